@@ -1,3 +1,22 @@
 from django.contrib import admin
 
+from .models import KPIRollup, Timetable, TripStats
+
 # Register your models here.
+
+
+@admin.register(KPIRollup)
+class KPIRollupAdmin(admin.ModelAdmin):
+    list_display = ('scope', 'label', 'trips', 'on_time_trips', 'distance_m', 'updated_at')
+    list_filter = ('scope',)
+
+
+@admin.register(TripStats)
+class TripStatsAdmin(admin.ModelAdmin):
+    list_display = ('trip', 'on_time', 'delay_seconds', 'passengers', 'seats', 'distance_m', 'idle_seconds')
+
+
+@admin.register(Timetable)
+class TimetableAdmin(admin.ModelAdmin):
+    list_display = ('route', 'weekdays', 'start_time', 'end_time', 'headway_minutes', 'bus', 'driver', 'is_active')
+    list_filter = ('route', 'is_active')
@@ -0,0 +1,204 @@
+# api/analytics.py
+
+"""
+Fleet operations KPIs, maintained incrementally.
+
+When a Trip is marked completed (api/signals.py), a background job runs
+record_trip(): it computes that trip's TripStats once and adds them to the
+running KPIRollup rows of its route and its bus with F() increments, in the
+same transaction. Dashboards read the rollups only, so nothing is ever
+recomputed from the full history; `manage.py backfill_analytics` covers
+trips completed before this existed.
+
+    on time        trip started within ANALYTICS_ON_TIME_GRACE_S of scheduled_time
+    delay          seconds the start was late; early starts count as 0, and
+                   trips never started are not recorded at all
+    utilization    passengers / bus capacity
+    distance       sum of haversine segment lengths between the bus's fixes
+    idle time      time in segments where the bus was below IDLE_KMH
+
+Distance and idle time are computed over the fix arrays in one vectorized
+pass with numpy when it is installed (a plain loop otherwise). Segments
+longer than MAX_GAP_S are treated as signal loss and not counted.
+"""
+
+import math
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import caching, write_queue
+from .models import BusLocation, KPIRollup, Trip, TripStats
+
+try:
+    import numpy as np
+except ImportError:  # the pure-Python loop is used instead
+    np = None
+
+ANALYTICS = 'analytics'
+
+IDLE_KMH = 2.0
+MAX_GAP_S = 300
+EARTH_RADIUS_M = 6_371_000
+
+SUMMED_FIELDS = ('delay_seconds', 'passengers', 'seats', 'distance_m', 'moving_seconds', 'idle_seconds')
+
+
+def on_time_grace():
+    return getattr(settings, 'ANALYTICS_ON_TIME_GRACE_S', 300)
+
+
+# ============================================
+# FIX ARRAYS
+# ============================================
+
+def _motion_numpy(lats, lngs, speeds, times):
+    lat = np.radians(np.asarray(lats, dtype=np.float64))
+    lng = np.radians(np.asarray(lngs, dtype=np.float64))
+    speed = np.asarray(speeds, dtype=np.float64)
+    dt = np.diff(np.asarray(times, dtype=np.float64))
+
+    a = (np.sin(np.diff(lat) / 2) ** 2
+         + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lng) / 2) ** 2)
+    dist = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+    valid = (dt > 0) & (dt <= MAX_GAP_S)
+    idle = valid & (speed[:-1] < IDLE_KMH)
+    return (
+        float(dist[valid].sum()),
+        float(dt[valid & ~idle].sum()),
+        float(dt[idle].sum()),
+    )
+
+
+def _motion_python(lats, lngs, speeds, times):
+    distance = moving = idle = 0.0
+    for i in range(1, len(times)):
+        dt = times[i] - times[i - 1]
+        if dt <= 0 or dt > MAX_GAP_S:
+            continue
+        lat1, lat2 = math.radians(lats[i - 1]), math.radians(lats[i])
+        a = (math.sin((lat2 - lat1) / 2) ** 2
+             + math.cos(lat1) * math.cos(lat2) * math.sin(math.radians(lngs[i] - lngs[i - 1]) / 2) ** 2)
+        distance += 2 * EARTH_RADIUS_M * math.asin(math.sqrt(min(a, 1.0)))
+        if speeds[i - 1] < IDLE_KMH:
+            idle += dt
+        else:
+            moving += dt
+    return distance, moving, idle
+
+
+def motion(lats, lngs, speeds, times):
+    """(distance m, moving s, idle s) over fixes in time order; times in epoch seconds"""
+    if len(times) < 2:
+        return 0.0, 0.0, 0.0
+    if np is not None:
+        return _motion_numpy(lats, lngs, speeds, times)
+    return _motion_python(lats, lngs, speeds, times)
+
+
+def trip_fixes(trip):
+    """The bus's fixes between trip start and end as parallel lists"""
+    rows = (
+        BusLocation.objects.filter(bus_id=trip.bus_id, timestamp__gte=trip.start_time, timestamp__lte=trip.end_time)
+        .order_by('timestamp')
+        .values_list('latitude', 'longitude', 'speed', 'timestamp')
+    )
+    lats, lngs, speeds, times = [], [], [], []
+    for lat, lng, speed, ts in rows.iterator(chunk_size=5000):
+        lats.append(float(lat))
+        lngs.append(float(lng))
+        speeds.append(speed)
+        times.append(ts.timestamp())
+    return lats, lngs, speeds, times
+
+
+# ============================================
+# INCREMENTAL ROLLUPS
+# ============================================
+
+def compute_stats(trip):
+    """Unsaved TripStats for a completed trip that was started"""
+    # Leaving early is not negative delay; it would hide late trips in the average
+    delay = max((trip.start_time - trip.scheduled_time).total_seconds(), 0.0)
+    passengers = trip.passenger_count or trip.bookings.count()
+
+    fixes = ([], [], [], [])
+    if trip.end_time:
+        fixes = trip_fixes(trip)
+    distance, moving, idle = motion(*fixes)
+
+    return TripStats(
+        trip=trip,
+        on_time=delay <= on_time_grace(),
+        delay_seconds=delay,
+        passengers=passengers,
+        seats=trip.bus.capacity,
+        distance_m=distance,
+        moving_seconds=moving,
+        idle_seconds=idle,
+        fixes=len(fixes[0]),
+    )
+
+
+def _add_to_rollup(scope, object_id, label, stats):
+    rollup, _ = KPIRollup.objects.get_or_create(scope=scope, object_id=object_id, defaults={'label': label})
+    updates = {field: F(field) + getattr(stats, field) for field in SUMMED_FIELDS}
+    # update() bypasses auto_now
+    KPIRollup.objects.filter(pk=rollup.pk).update(
+        label=label,
+        updated_at=timezone.now(),
+        trips=F('trips') + 1,
+        on_time_trips=F('on_time_trips') + int(stats.on_time),
+        **updates,
+    )
+
+
+def record_trip(trip_id):
+    """
+    Add a completed trip to the rollups; returns its TripStats, or None when
+    the trip is not completed, was never started or was already recorded.
+    """
+    trip = (Trip.objects.select_related('bus', 'route')
+            .filter(pk=trip_id, status='completed', start_time__isnull=False).first())
+    if trip is None or TripStats.objects.filter(trip_id=trip_id).exists():
+        return None
+    # Reading the fixes stays outside the (possibly single-writer) write
+    stats = compute_stats(trip)
+    if not write_queue.run(_store, trip, stats):
+        return None
+    return stats
+
+
+def _store(trip, stats):
+    try:
+        with transaction.atomic():
+            stats.save()
+            _add_to_rollup('route', trip.route_id, trip.route.name, stats)
+            _add_to_rollup('bus', trip.bus_id, trip.bus.bus_number, stats)
+    except IntegrityError:
+        # Another worker recorded it first
+        return False
+    transaction.on_commit(lambda: caching.bump_version(ANALYTICS))
+    return True
+
+
+def kpi_rows(scope):
+    """Dashboard rows for 'route' or 'bus' from the rollups alone"""
+    rows = []
+    for r in KPIRollup.objects.filter(scope=scope).order_by('label'):
+        active = r.moving_seconds + r.idle_seconds
+        rows.append({
+            'id': r.object_id,
+            'label': r.label,
+            'trips': r.trips,
+            'on_time_pct': round(100 * r.on_time_trips / r.trips, 1) if r.trips else None,
+            'avg_delay_s': round(r.delay_seconds / r.trips, 1) if r.trips else None,
+            'utilization_pct': round(100 * r.passengers / r.seats, 1) if r.seats else None,
+            'distance_km': round(r.distance_m / 1000, 2),
+            'idle_pct': round(100 * r.idle_seconds / active, 1) if active else None,
+            'updated_at': r.updated_at,
+        })
+    return rows
@@ -0,0 +1,212 @@
+# api/anomalies.py
+
+"""
+Streaming anomaly detection on location fixes.
+
+Ingest hands every fix to observe(). Each bus keeps a BusWindow: a ring
+buffer of its last `window` fixes (a deque with maxlen, so memory stays
+constant however long the bus runs) plus a few flags. Checks per fix:
+
+    speeding    reported speed, or speed computed from the path over the
+                last speed_window_s of fixes, above speed_limit_kmh
+    idling      reported speed below idle_kmh for idle_s
+    off_route   farther than off_route_m from the polyline through the
+                in-progress trip's stops (only stops with coordinates count)
+    dropout     more than dropout_s since the previous fix
+
+Alerts are edge-triggered (one when a condition starts, none while it
+lasts) and go out as 'anomaly.<kind>' events through log_event, which also
+counts them in campushub_log_events_total. A check is a handful of float
+operations over at most `window` fixes; see benchmarks/bench_anomalies.py.
+
+Windows are per process, so they see every fix of a bus only when one
+process does: a single worker, or ingest shards (api/shards.py), which run
+the analyzer on the fixes they accept and hand a bus's window over with the
+bus when a resize moves it (release_windows(), adopt_windows()).
+"""
+
+import logging
+import math
+import threading
+from collections import deque
+
+from django.conf import settings
+
+from . import pingrate
+from .eventlog import log_event
+
+SPEEDING = 'speeding'
+IDLING = 'idling'
+OFF_ROUTE = 'off_route'
+DROPOUT = 'dropout'
+KINDS = (SPEEDING, IDLING, OFF_ROUTE, DROPOUT)
+
+DEFAULTS = {
+    'enabled': True,
+    'window': 16,
+    'speed_limit_kmh': 60.0,
+    'speed_window_s': 15.0,
+    'idle_kmh': 2.0,
+    'idle_s': 600.0,
+    'off_route_m': 250.0,
+    'dropout_s': 120.0,
+    'route_cache_s': 60,
+}
+
+# Back on route only once within this fraction of off_route_m, so a bus
+# riding the threshold does not alert on every fix
+ROUTE_HYSTERESIS = 0.8
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'ANOMALIES', {})}
+
+
+def distance_to_path(lat, lng, points):
+    """Metres from (lat, lng) to the polyline through `points` (a single point is fine)"""
+    if len(points) == 1:
+        return pingrate.distance_m(lat, lng, *points[0])
+    # Local plane around the fix, x east and y north in metres
+    scale_y = math.radians(1) * pingrate.EARTH_RADIUS_M
+    scale_x = scale_y * math.cos(math.radians(lat))
+    best = math.inf
+    ax, ay = (points[0][1] - lng) * scale_x, (points[0][0] - lat) * scale_y
+    for plat, plng in points[1:]:
+        bx, by = (plng - lng) * scale_x, (plat - lat) * scale_y
+        dx, dy = bx - ax, by - ay
+        length2 = dx * dx + dy * dy
+        t = 0.0 if length2 == 0 else min(max(-(ax * dx + ay * dy) / length2, 0.0), 1.0)
+        best = min(best, math.hypot(ax + t * dx, ay + t * dy))
+        ax, ay = bx, by
+    return best
+
+
+class BusWindow:
+    __slots__ = ('fixes', 'idle_since', 'idling', 'speeding', 'off_route')
+
+    def __init__(self, size):
+        # (epoch seconds, lat, lng, reported km/h, metres from the previous fix)
+        self.fixes = deque(maxlen=size)
+        self.idle_since = None
+        self.idling = False
+        self.speeding = False
+        self.off_route = False
+
+
+class Analyzer:
+    def __init__(self, cfg=None, route_points=None, emit=None):
+        """route_points(bus_id, ttl) -> [(lat, lng), ...]; defaults to the in-progress trip's stops"""
+        self.cfg = cfg or config()
+        self._route_points = route_points or pingrate.route_stops
+        self._emit = emit or self._log
+        self._lock = threading.Lock()
+        self._windows = {}
+
+    @staticmethod
+    def _log(bus_id, kind, fields):
+        log_event(f'anomaly.{kind}', level=logging.WARNING, bus_id=bus_id, **fields)
+
+    def observe(self, bus_id, latitude, longitude, speed, timestamp):
+        """Check one fix (timestamp in epoch seconds); returns the alerts raised as (kind, fields)"""
+        latitude, longitude, speed = float(latitude), float(longitude), float(speed or 0)
+        # May query the database on a cache miss, so not under the lock
+        points = self._route_points(bus_id, self.cfg['route_cache_s'])
+        with self._lock:
+            window = self._windows.get(bus_id)
+            if window is None:
+                window = self._windows[bus_id] = BusWindow(self.cfg['window'])
+            alerts = self._check(window, latitude, longitude, speed, timestamp, points)
+        for kind, fields in alerts:
+            self._emit(bus_id, kind, fields)
+        return alerts
+
+    def release(self, bus_ids):
+        """Remove and return {bus_id: BusWindow} for buses another process takes over"""
+        with self._lock:
+            return {bus_id: self._windows.pop(bus_id) for bus_id in bus_ids if bus_id in self._windows}
+
+    def adopt(self, windows):
+        """Take over {bus_id: BusWindow} released by another process"""
+        with self._lock:
+            self._windows.update(windows)
+
+    def _check(self, window, lat, lng, speed, ts, points):
+        cfg = self.cfg
+        fixes = window.fixes
+        alerts = []
+        segment = 0.0
+        if fixes:
+            previous = fixes[-1]
+            gap = ts - previous[0]
+            if gap <= 0:
+                # Duplicate or out of order: nothing new to judge
+                return alerts
+            if gap > cfg['dropout_s']:
+                alerts.append((DROPOUT, {'gap_s': round(gap, 1)}))
+            segment = pingrate.distance_m(previous[1], previous[2], lat, lng)
+        fixes.append((ts, lat, lng, speed, segment))
+
+        # Path speed over the recent fixes smooths single-fix GPS jitter
+        path, start, lead = 0.0, ts, 0.0
+        for fix_ts, _, _, _, fix_segment in reversed(fixes):
+            if ts - fix_ts > cfg['speed_window_s']:
+                break
+            path += fix_segment
+            start, lead = fix_ts, fix_segment
+        # The oldest fix's segment leads into the window from outside it
+        computed = (path - lead) / (ts - start) * 3.6 if ts > start else None
+        limit = cfg['speed_limit_kmh']
+        over = speed > limit or (computed is not None and computed > limit)
+        if over and not window.speeding:
+            alerts.append((SPEEDING, {
+                'reported_kmh': round(speed, 1),
+                'computed_kmh': None if computed is None else round(computed, 1),
+                'limit_kmh': limit,
+            }))
+        window.speeding = over
+
+        if speed < cfg['idle_kmh']:
+            if window.idle_since is None:
+                window.idle_since = ts
+            elif not window.idling and ts - window.idle_since >= cfg['idle_s']:
+                window.idling = True
+                alerts.append((IDLING, {'idle_s': round(ts - window.idle_since, 1)}))
+        else:
+            window.idle_since = None
+            window.idling = False
+
+        if points:
+            off = distance_to_path(lat, lng, points)
+            threshold = cfg['off_route_m'] * (ROUTE_HYSTERESIS if window.off_route else 1)
+            if off > threshold and not window.off_route:
+                alerts.append((OFF_ROUTE, {'distance_m': round(off), 'lat': lat, 'lng': lng}))
+            window.off_route = off > threshold
+        return alerts
+
+
+_analyzer = None
+_analyzer_lock = threading.Lock()
+
+
+def get_analyzer():
+    global _analyzer
+    if _analyzer is None:
+        with _analyzer_lock:
+            if _analyzer is None:
+                _analyzer = Analyzer()
+    return _analyzer
+
+
+def release_windows(bus_ids):
+    return get_analyzer().release(bus_ids)
+
+
+def adopt_windows(windows):
+    get_analyzer().adopt(windows)
+
+
+def observe(bus_id, latitude, longitude, speed, timestamp):
+    """Run the checks on one fix (timestamp a datetime) unless ANOMALIES['enabled'] is off"""
+    analyzer = get_analyzer()
+    if analyzer.cfg['enabled']:
+        analyzer.observe(bus_id, latitude, longitude, speed, timestamp.timestamp())
@@ -1,7 +1,10 @@
+import time
+
 from rest_framework import authentication
 from rest_framework import exceptions
 from django.contrib.auth.models import User
 from backend_project.firebase_config import verify_firebase_token
+from .metrics import record_auth_time
 from .models import Student, Driver
 
 
@@ -23,7 +26,9 @@ class FirebaseAuthentication(authentication.BaseAuthentication):
             raise exceptions.AuthenticationFailed('Invalid token format')
         
         # Verify Firebase token
+        start = time.perf_counter()
         decoded_token = verify_firebase_token(token)
+        record_auth_time(time.perf_counter() - start)
         
         if not decoded_token:
             raise exceptions.AuthenticationFailed('Invalid or expired token')
@@ -0,0 +1,141 @@
+# api/caching.py
+
+"""
+Version-based ETags and short-TTL response caching for the polled GET endpoints.
+
+Each cached endpoint belongs to a scope ('fleet', 'bookings', 'student:<user id>')
+with a change counter in the Django cache. Writes bump the counter (see
+api/signals.py), so a view can build its ETag and answer If-None-Match from the
+counter alone, without touching the ORM.
+
+With read replicas, a GET that reads the new version right after a bump
+could still read the old rows from a lagging replica and store them under
+that version. Each bump therefore marks its scope for REPLICA_LAG_S, and
+consistent_reads(scope) sends reads to the primary while the mark lasts.
+
+The counters live in CACHES['default']; with several workers that must be a
+shared backend (see REDIS_URL in settings) or writes on one worker will not
+invalidate ETags handed out by another.
+"""
+
+import time
+import zlib
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+from backend_project.db_routing import replica_aliases, use_primary
+
+VERSION_PREFIX = 'api:version:'
+RESPONSE_PREFIX = 'api:response:'
+BUMPED_PREFIX = 'api:bumped:'
+
+FLEET = 'fleet'
+BOOKINGS = 'bookings'
+ROUTES = 'routes'
+TRIPS = 'trips'
+
+
+def student_scope(user_id):
+    return f'student:{user_id}'
+
+
+def _seed():
+    # Seeding from the clock means a counter lost to eviction or a restart
+    # never hands out an ETag a client saw before
+    return int(time.time() * 1000)
+
+
+def get_version(scope):
+    key = VERSION_PREFIX + scope
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _seed(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(*scopes):
+    """Invalidate every ETag and cached response for the given scopes; returns {scope: new version}"""
+    lag = getattr(settings, 'REPLICA_LAG_S', 0)
+    if lag and replica_aliases():
+        # Marked before the bump, so no reader sees the new version unmarked
+        cache.set_many({BUMPED_PREFIX + scope: 1 for scope in scopes}, timeout=lag)
+    versions = {}
+    for scope in scopes:
+        key = VERSION_PREFIX + scope
+        try:
+            versions[scope] = cache.incr(key)
+        except ValueError:
+            versions[scope] = _seed()
+            cache.set(key, versions[scope], timeout=None)
+    return versions
+
+
+@contextmanager
+def consistent_reads(scope):
+    """Read from the primary while replicas may still lag the last bump of `scope`"""
+    if replica_aliases() and cache.get(BUMPED_PREFIX + scope) is not None:
+        with use_primary():
+            yield
+    else:
+        yield
+
+
+def variant(request):
+    """Responses differ by query string (?layout=columns) and renderer"""
+    query = request.META.get('QUERY_STRING', '')
+    accept = request.META.get('HTTP_ACCEPT', '')
+    return f"{zlib.crc32(f'{query}|{accept}'.encode()):08x}"
+
+
+def etag_matches(request, etag):
+    """True when If-None-Match lists `etag` (or *)"""
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    candidates = [tag.strip() for tag in header.split(',')]
+    return '*' in candidates or etag in candidates
+
+
+def versioned_response(scope):
+    """
+    Add an ETag to a GET view and answer matching If-None-Match with 304.
+
+    `scope` is a scope name or a callable taking the request. Place this
+    below @api_view so authentication has already run. When
+    API_RESPONSE_CACHE_TTL is set, full responses are also shared between
+    clients for that many seconds (keyed by version, so writes invalidate them).
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            scope_name = scope(request) if callable(scope) else scope
+            version = get_version(scope_name)
+            variant_key = variant(request)
+            etag = f'W/"{scope_name}-{version}-{variant_key}"'
+
+            if etag_matches(request, etag):
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+            ttl = getattr(settings, 'API_RESPONSE_CACHE_TTL', 0)
+            cache_key = f'{RESPONSE_PREFIX}{scope_name}:{version}:{variant_key}'
+            if ttl:
+                data = cache.get(cache_key)
+                if data is not None:
+                    return Response(data, headers={'ETag': etag})
+
+            with consistent_reads(scope_name):
+                response = view_func(request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                response['ETag'] = etag
+                if ttl:
+                    cache.set(cache_key, response.data, timeout=ttl)
+            return response
+
+        return wrapper
+    return decorator
@@ -0,0 +1,121 @@
+# api/eventlog.py
+
+"""
+Structured, non-blocking logging.
+
+Request threads only push records onto an in-memory queue; a background
+listener thread formats them as JSON lines and writes them out. When the
+queue is full, records are dropped and counted instead of blocking a worker.
+
+High-frequency events (location pings) go through log_event(), which
+always bumps a per-event counter (exported via /api/metrics/) but only
+emits one line every LOG_SAMPLE_EVERY[event] occurrences.
+"""
+
+import itertools
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+
+from . import metrics
+
+EVENTS = metrics.registry.counter(
+    'campushub_log_events_total', 'Structured log events by type (sampled or not)', labels=('event',))
+DROPPED = metrics.registry.counter(
+    'campushub_log_records_dropped_total', 'Log records dropped because the log queue was full')
+
+event_logger = logging.getLogger('api.events')
+
+# Standard LogRecord attributes, so extra fields can be told apart
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg plus any extra fields"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class BackgroundQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that owns its queue and a listener thread writing to `stream`.
+    Usable straight from the LOGGING dict config.
+    """
+
+    def __init__(self, stream=None, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.target = logging.StreamHandler(stream or sys.stderr)
+        self.listener = logging.handlers.QueueListener(self.queue, self.target, respect_handler_level=True)
+        self.listener.start()
+        self._running = True
+
+    def setFormatter(self, fmt):
+        # Formatting happens on the listener thread, not in the request
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Same process, so no pickling: just freeze the message text
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED.inc()
+
+    def close(self):
+        # logging.shutdown() calls this at exit; stop() flushes what is queued
+        if self._running:
+            self._running = False
+            self.listener.stop()
+        super().close()
+
+
+# ============================================
+# EVENTS
+# ============================================
+
+_sample_counters = {}
+_sample_lock = threading.Lock()
+
+
+def _sample_every(event):
+    from django.conf import settings
+    return getattr(settings, 'LOG_SAMPLE_EVERY', {}).get(event, 1)
+
+
+def log_event(event, level=logging.INFO, **fields):
+    """
+    Count `event` and log it (subject to sampling) with `fields` as JSON keys.
+    """
+    EVENTS.inc(event)
+    every = _sample_every(event)
+    if every > 1:
+        counter = _sample_counters.get(event)
+        if counter is None:
+            with _sample_lock:
+                counter = _sample_counters.setdefault(event, itertools.count())
+        # itertools.count is atomic under the GIL
+        if next(counter) % every:
+            return
+        fields['sampled_every'] = every
+    if event_logger.isEnabledFor(level):
+        event_logger.log(level, event, extra=dict(fields, event=event))
@@ -0,0 +1,143 @@
+# api/export.py
+
+"""
+Streaming CSV / NDJSON export of bookings, trips and location history.
+
+Rows are read in keyset-paginated chunks (WHERE id > last ORDER BY id LIMIT n)
+and encoded one chunk at a time, so memory stays flat however many rows
+match and the first bytes go out after the first chunk. Used by the export
+endpoint (StreamingHttpResponse) and `manage.py export_data` (file output).
+"""
+
+import csv
+import decimal
+import io
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Booking, BusLocation, Trip
+from .renderers import encode_default, get_dumps
+
+CHUNK_SIZE = 2000
+
+# name -> (model, date field for the range filter, {exported column: ORM path})
+DATASETS = {
+    'bookings': (Booking, 'created_at', {
+        'id': 'id',
+        'student_id': 'student__student_id',
+        'source': 'source',
+        'destination': 'destination',
+        'pickup_time': 'pickup_time',
+        'status': 'status',
+        'bus_number': 'assigned_bus__bus_number',
+        'created_at': 'created_at',
+    }),
+    'trips': (Trip, 'scheduled_time', {
+        'id': 'id',
+        'bus_number': 'bus__bus_number',
+        'route': 'route__name',
+        'driver_id': 'driver__driver_id',
+        'scheduled_time': 'scheduled_time',
+        'start_time': 'start_time',
+        'end_time': 'end_time',
+        'status': 'status',
+        'passenger_count': 'passenger_count',
+    }),
+    'locations': (BusLocation, 'timestamp', {
+        'id': 'id',
+        'bus_number': 'bus__bus_number',
+        'latitude': 'latitude',
+        'longitude': 'longitude',
+        'speed': 'speed',
+        'timestamp': 'timestamp',
+    }),
+}
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def parse_bound(value, is_end=False):
+    """
+    Aware datetime from an ISO date or datetime; a date as the end of a
+    range includes that whole day. Naive values are in the server's time
+    zone. Raises ValueError when `value` is neither.
+    """
+    day = parse_date(value)
+    if day is not None:
+        parsed = datetime.combine(day + timedelta(days=1) if is_end else day, datetime.min.time())
+    else:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise ValueError(f'{value!r} is not an ISO date or datetime')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def keyset_chunks(queryset, paths, chunk_size=CHUNK_SIZE):
+    """Yield lists of value tuples in primary-key order, chunk_size at a time"""
+    last = None
+    queryset = queryset.order_by('pk').values_list(*paths)
+    while True:
+        page = queryset if last is None else queryset.filter(pk__gt=last)
+        chunk = list(page[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        # 'id' is always the first exported column
+        last = chunk[-1][0]
+        if len(chunk) < chunk_size:
+            return
+
+
+def rows(dataset, start=None, end=None, chunk_size=CHUNK_SIZE):
+    """Chunks of rows for `dataset` with start <= date field < end"""
+    model, date_field, columns = DATASETS[dataset]
+    queryset = model.objects.all()
+    if start is not None:
+        queryset = queryset.filter(**{f'{date_field}__gte': start})
+    if end is not None:
+        queryset = queryset.filter(**{f'{date_field}__lt': end})
+    return keyset_chunks(queryset, columns.values(), chunk_size)
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (str, int, float, decimal.Decimal)):
+        return value
+    return encode_default(value)
+
+
+def encode_csv(columns, chunks):
+    """Yield CSV text: the header, then one string per chunk"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    for chunk in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([[_csv_value(v) for v in row] for row in chunk])
+        yield buffer.getvalue()
+
+
+def encode_ndjson(columns, chunks):
+    """Yield NDJSON bytes, one piece per chunk"""
+    dumps = get_dumps()
+    for chunk in chunks:
+        yield b''.join(dumps(dict(zip(columns, row))) + b'\n' for row in chunk)
+
+
+def stream(dataset, fmt, start=None, end=None, chunk_size=CHUNK_SIZE):
+    """Encoded export of `dataset` as an iterator of str/bytes pieces"""
+    columns = list(DATASETS[dataset][2])
+    chunks = rows(dataset, start, end, chunk_size)
+    if fmt == 'csv':
+        return encode_csv(columns, chunks)
+    return encode_ndjson(columns, chunks)
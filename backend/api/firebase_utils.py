@@ -1,18 +1,17 @@
-import firebase_admin
-from firebase_admin import credentials, auth as firebase_auth, firestore
-import os
+"""
+Thin wrappers over backend_project.firebase_config, kept for existing imports.
+Nothing is initialized until first use.
+"""
 
-# Initialize Firebase Admin SDK (only once)
-if not firebase_admin._apps:
-    cred_path = os.path.join(os.path.dirname(__file__), "..", "serviceAccountKey.json")
-    cred = credentials.Certificate(cred_path)
-    firebase_admin.initialize_app(cred)
+from backend_project.firebase_config import get_firestore, verify_firebase_token
 
-db = firestore.client()
 
 def verify_id_token(id_token):
-    try:
-        return firebase_auth.verify_id_token(id_token)
-    except Exception as e:
-        print("Token verification failed:", e)
-        return None
+    return verify_firebase_token(id_token)
+
+
+def __getattr__(name):
+    # `from api.firebase_utils import db` still works, lazily
+    if name == 'db':
+        return get_firestore()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,361 @@
+# api/heatmap.py
+
+"""
+Demand heatmap tiles for the admin dashboard.
+
+Three layers are kept as counts on slippy-map tiles (z/x/y, Web Mercator),
+each tile a TILE_SIZE x TILE_SIZE grid, per time window (window_s):
+
+    pickups    Booking.source, placed at its stop's coordinates, by pickup time
+    dropoffs   Booking.destination, likewise
+    buses      BusLocation fixes (bus density)
+
+Counts are maintained for every zoom from min_zoom to max_zoom as rows
+arrive, so serving a tile only sums its windows in the requested range.
+refresh() catches up incrementally: it reads rows past the last id seen
+(keyset chunks of chunk_size), bins each chunk in one vectorized pass when
+numpy is installed (a plain-Python loop otherwise) and folds the counts in.
+The first refresh only goes back history_s. Views schedule refreshes through
+api/jobs.py, so requests never wait on the database for a tile.
+
+Ids are handed out before their transactions commit, so a row can appear
+below ids already read. After the first pass, each gap in the ids read is
+remembered for overlap_s and re-read by later refreshes until the rows turn up, so a
+transaction that commits within overlap_s of its insert is never missed.
+
+Tile contents are versioned by the shared caching scopes their rows bump
+(SCOPES): a refresh records the versions it read up to, and the tile view
+builds its ETag from them, so every worker hands out the same ETag for the
+same data. Pickups and dropoffs are binned by pickup time, which is mostly
+in the future; their tiles can be read up to ahead_s past now.
+
+Booking stops are placed through the stop catalog (api/stops.py) and only
+have coordinates when Route.stops entries are {'name', 'lat', 'lng'} dicts;
+bookings at unknown stops are counted in
+campushub_heatmap_unplaced_total and otherwise skipped. Status changes
+after a booking is first seen are not reflected.
+"""
+
+import math
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from . import caching, jobs, metrics, stops
+from .models import Booking, BusLocation
+
+try:
+    import numpy as np
+except ImportError:  # the pure-Python binning is used instead
+    np = None
+
+BINNED = metrics.registry.counter(
+    'campushub_heatmap_points_total', 'Points binned into heatmap tiles', labels=('layer',))
+UNPLACED = metrics.registry.counter(
+    'campushub_heatmap_unplaced_total', 'Booking stops without coordinates', labels=('layer',))
+
+PICKUPS = 'pickups'
+DROPOFFS = 'dropoffs'
+BUSES = 'buses'
+LAYERS = (PICKUPS, DROPOFFS, BUSES)
+# Caching scope bumped by every write to each layer's rows
+SCOPES = {PICKUPS: caching.BOOKINGS, DROPOFFS: caching.BOOKINGS, BUSES: caching.FLEET}
+
+TILE_BITS = 6
+TILE_SIZE = 1 << TILE_BITS
+MAX_LAT = 85.05112878
+# Summed tiles kept for reuse until their layer changes
+MAX_RENDERED = 4096
+
+DEFAULTS = {
+    'min_zoom': 10,
+    'max_zoom': 16,
+    'window_s': 3600,
+    'history_s': 86400,
+    # How far past now booking layers can be read
+    'ahead_s': 7 * 86400,
+    'refresh_s': 5,
+    # How long a gap in the ids read is re-read for rows committing late
+    'overlap_s': 60,
+    'chunk_size': 5000,
+}
+
+
+def config():
+    cfg = {**DEFAULTS, **getattr(settings, 'HEATMAP', {})}
+    # Packed keys in _bin_numpy need 2 * max_zoom + 12 bits plus the window
+    cfg['max_zoom'] = min(cfg['max_zoom'], 18)
+    return cfg
+
+
+# ============================================
+# BINNING
+# ============================================
+
+def _bin_numpy(lats, lngs, windows, min_zoom, max_zoom):
+    """Yield (z, window, tx, ty, cell index, count) for every non-empty cell"""
+    top = 1 << (max_zoom + TILE_BITS)
+    lat = np.radians(np.clip(np.asarray(lats, dtype=np.float64), -MAX_LAT, MAX_LAT))
+    lng = np.asarray(lngs, dtype=np.float64)
+    x = np.clip(((lng + 180.0) / 360.0 * top).astype(np.int64), 0, top - 1)
+    y = np.clip(((1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / math.pi) / 2.0 * top).astype(np.int64),
+                0, top - 1)
+    windows = np.asarray(windows, dtype=np.int64)
+    base = int(windows.min())
+    rel = windows - base
+
+    for z in range(min_zoom, max_zoom + 1):
+        shift = max_zoom - z
+        cx, cy = x >> shift, y >> shift
+        index = ((cy & (TILE_SIZE - 1)) << TILE_BITS) | (cx & (TILE_SIZE - 1))
+        key = ((((rel << z) | (cx >> TILE_BITS)) << z | (cy >> TILE_BITS)) << (2 * TILE_BITS)) | index
+        keys, counts = np.unique(key, return_counts=True)
+        cells = keys & ((1 << (2 * TILE_BITS)) - 1)
+        keys >>= 2 * TILE_BITS
+        ty = keys & ((1 << z) - 1)
+        keys >>= z
+        tx = keys & ((1 << z) - 1)
+        window = (keys >> z) + base
+        yield from zip([z] * len(counts), window.tolist(), tx.tolist(), ty.tolist(),
+                       cells.tolist(), counts.tolist())
+
+
+def _bin_python(lats, lngs, windows, min_zoom, max_zoom):
+    top = 1 << (max_zoom + TILE_BITS)
+    counts = Counter()
+    for lat, lng, window in zip(lats, lngs, windows):
+        rad = math.radians(min(max(lat, -MAX_LAT), MAX_LAT))
+        x = min(max(int((lng + 180.0) / 360.0 * top), 0), top - 1)
+        y = min(max(int((1.0 - math.log(math.tan(rad) + 1.0 / math.cos(rad)) / math.pi) / 2.0 * top), 0), top - 1)
+        for z in range(min_zoom, max_zoom + 1):
+            cx, cy = x >> (max_zoom - z), y >> (max_zoom - z)
+            index = ((cy & (TILE_SIZE - 1)) << TILE_BITS) | (cx & (TILE_SIZE - 1))
+            counts[z, window, cx >> TILE_BITS, cy >> TILE_BITS, index] += 1
+    for (z, window, tx, ty, index), count in counts.items():
+        yield z, window, tx, ty, index, count
+
+
+def bin_points(lats, lngs, windows, min_zoom, max_zoom):
+    if not lats:
+        return iter(())
+    binner = _bin_numpy if np is not None else _bin_python
+    return binner(lats, lngs, windows, min_zoom, max_zoom)
+
+
+# ============================================
+# STORE
+# ============================================
+
+class HeatmapStore:
+    def __init__(self, cfg=None):
+        self.cfg = cfg or config()
+        # layer -> {(z, window, tx, ty): {cell index: count}}
+        self._tiles = {layer: {} for layer in LAYERS}
+        self.generation = dict.fromkeys(LAYERS, 0)
+        # Shared caching versions the last refresh read up to
+        self._versions = dict.fromkeys(SCOPES.values(), 0)
+        self._marks = {'locations': 0, 'bookings': 0}
+        # kind -> [(first id, last id, monotonic expiry)] of ids not seen yet
+        self._holes = {'locations': [], 'bookings': []}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._refreshed_at = 0.0
+        self._scheduled = False
+        self._rendered = {}
+
+    def window_of(self, epoch_seconds):
+        return int(epoch_seconds // self.cfg['window_s'])
+
+    def clamp(self, layer, start, end):
+        """
+        (start, end) cut to the history_s the store holds, ending no later
+        than now, or ahead_s past now for the booking layers
+        """
+        now = timezone.now()
+        oldest = now - timedelta(seconds=self.cfg['history_s'])
+        latest = now if layer == BUSES else now + timedelta(seconds=self.cfg['ahead_s'])
+        end = min(max(end, oldest), latest)
+        return min(max(start, oldest), end), end
+
+    def version(self, layer):
+        """Shared version of the data this store holds for `layer`, for ETags"""
+        return self._versions[SCOPES[layer]]
+
+    def add(self, layer, lats, lngs, windows):
+        cfg = self.cfg
+        cells = list(bin_points(lats, lngs, windows, cfg['min_zoom'], cfg['max_zoom']))
+        with self._lock:
+            tiles = self._tiles[layer]
+            for z, window, tx, ty, index, count in cells:
+                tile = tiles.get((z, window, tx, ty))
+                if tile is None:
+                    tile = tiles[z, window, tx, ty] = {}
+                tile[index] = tile.get(index, 0) + count
+            if cells:
+                self.generation[layer] += 1
+        BINNED.inc(layer, amount=len(lats))
+
+    def stale(self):
+        return time.monotonic() - self._refreshed_at >= self.cfg['refresh_s']
+
+    def request_refresh(self):
+        """Queue one background refresh when the data is older than refresh_s"""
+        if self.stale() and not self._scheduled:
+            self._scheduled = True
+            jobs.defer('heatmap.refresh')
+
+    def refresh(self):
+        """Fold in rows added since the last refresh; returns rows read"""
+        if not self._refresh_lock.acquire(blocking=False):
+            return 0
+        try:
+            # Read before the rows, so the versions never claim rows not read yet
+            versions = {scope: caching.get_version(scope) for scope in self._versions}
+            since = timezone.now() - timedelta(seconds=self.cfg['history_s'])
+            rows = self._refresh_locations(since) + self._refresh_bookings(since)
+            self._prune(self.window_of(since.timestamp()))
+            self._versions = versions
+            self._refreshed_at = time.monotonic()
+            return rows
+        finally:
+            self._scheduled = False
+            self._refresh_lock.release()
+
+    def _catch_up(self, kind, queryset, since_field, since, fields, fold):
+        """
+        Pass every row not folded in yet to fold(chunk), as (id, *fields)
+        tuples: rows that turned up in a remembered gap, then keyset chunks
+        past the last id read (only history_s back, on the first pass).
+        Returns rows read.
+        """
+        read = 0
+        holes = self._holes[kind]
+        if holes:
+            wanted = Q()
+            for first, last, _ in holes:
+                wanted |= Q(pk__range=(first, last))
+            chunk = list(queryset.filter(wanted).values_list('pk', *fields))
+            if chunk:
+                fold(chunk)
+                holes = self._holes[kind] = _fill(holes, [row[0] for row in chunk])
+                read += len(chunk)
+
+        mark = self._marks[kind]
+        first_pass = not mark
+        if first_pass:
+            # Gaps here are rows filtered out, not rows still to commit
+            queryset = queryset.filter(**{f'{since_field}__gte': since})
+        expires = time.monotonic() + self.cfg['overlap_s']
+        while True:
+            chunk = list(queryset.filter(pk__gt=mark).order_by('pk').values_list('pk', *fields)
+                         [:self.cfg['chunk_size']])
+            if not chunk:
+                break
+            fold(chunk)
+            if not first_pass:
+                previous = mark
+                for row in chunk:
+                    if row[0] > previous + 1:
+                        holes.append((previous + 1, row[0] - 1, expires))
+                    previous = row[0]
+            mark = self._marks[kind] = chunk[-1][0]
+            read += len(chunk)
+
+        now = time.monotonic()
+        self._holes[kind] = [hole for hole in holes if hole[2] > now]
+        return read
+
+    def _refresh_locations(self, since):
+        def fold(chunk):
+            self.add(
+                BUSES,
+                [float(row[1]) for row in chunk],
+                [float(row[2]) for row in chunk],
+                [self.window_of(row[3].timestamp()) for row in chunk],
+            )
+        return self._catch_up('locations', BusLocation.objects.all(), 'timestamp', since,
+                              ('latitude', 'longitude', 'timestamp'), fold)
+
+    def _refresh_bookings(self, since):
+        catalog = None
+
+        def fold(chunk):
+            nonlocal catalog
+            if catalog is None:
+                catalog = stops.get_catalog()
+            for layer, column in ((PICKUPS, 1), (DROPOFFS, 2)):
+                lats, lngs, windows = [], [], []
+                for row in chunk:
+                    point = catalog.coordinates(row[column])
+                    if point is None:
+                        UNPLACED.inc(layer)
+                        continue
+                    lats.append(point[0])
+                    lngs.append(point[1])
+                    windows.append(self.window_of(row[3].timestamp()))
+                self.add(layer, lats, lngs, windows)
+        return self._catch_up('bookings', Booking.objects.exclude(status='cancelled'), 'pickup_time', since,
+                              ('source', 'destination', 'pickup_time'), fold)
+
+    def _prune(self, oldest_window):
+        with self._lock:
+            for layer, tiles in self._tiles.items():
+                old = [key for key in tiles if key[1] < oldest_window]
+                for key in old:
+                    del tiles[key]
+                if old:
+                    self.generation[layer] += 1
+            self._rendered.clear()
+
+    def tile(self, layer, z, x, y, first_window, last_window):
+        """{cell index: count} for one tile, summed over [first_window, last_window]"""
+        cache_key = (layer, z, x, y, first_window, last_window)
+        with self._lock:
+            generation = self.generation[layer]
+            cached = self._rendered.get(cache_key)
+            if cached is not None and cached[0] == generation:
+                return cached[1]
+            total = Counter()
+            for window in range(first_window, last_window + 1):
+                cells = self._tiles[layer].get((z, window, x, y))
+                if cells:
+                    total.update(cells)
+            cells = dict(total)
+            if len(self._rendered) >= MAX_RENDERED:
+                self._rendered.clear()
+            self._rendered[cache_key] = (generation, cells)
+        return cells
+
+
+def _fill(holes, found):
+    """`holes` less the ids in `found`"""
+    found = sorted(found)
+    left = []
+    for first, last, expires in holes:
+        start = first
+        for pk in found[bisect_left(found, first):bisect_right(found, last)]:
+            if pk > start:
+                left.append((start, pk - 1, expires))
+            start = pk + 1
+        if start <= last:
+            left.append((start, last, expires))
+    return left
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = HeatmapStore()
+    return _store
@@ -0,0 +1,125 @@
+# api/ingest.py
+
+"""
+Location ingest: the write path behind update_driver_location.
+
+Kept separate from the view so other entry points (binary batches, replay
+tools) store fixes exactly the same way.
+
+Every fix is a presence heartbeat (api/presence.py) and goes through the
+anomaly checks (api/anomalies.py). The driver's current
+position is updated by a background job (api/jobs.py) and offered to the
+Firestore mirror (api/mirror.py);
+with JOB_QUEUE['defer_history'] the BusLocation inserts are too, and the
+returned locations are unsaved instances. The same goes for
+INGEST_SHARDS['enabled'], where the inserts happen in the bus's ingest shard
+process (api/shards.py).
+"""
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import anomalies, caching, jobs, metrics, mirror, presence, shards, write_queue
+from .models import Bus, BusLocation
+
+INGEST_FIXES = metrics.registry.counter('campushub_ingest_fixes_total', 'Location fixes received')
+INGEST_RATE = metrics.RateMeter()
+
+
+def get_active_bus(driver):
+    """The driver's assigned active bus, or None"""
+    return Bus.objects.filter(driver=driver, is_active=True).first()
+
+
+def record_location(driver, latitude, longitude, speed=0, timestamp=None):
+    """
+    Store one fix: update the driver's current position and, when a bus is
+    assigned, append to its location history. Returns (bus, location).
+    """
+    timestamp = timestamp or timezone.now()
+    INGEST_FIXES.inc()
+    INGEST_RATE.add()
+    _update_position(driver, latitude, longitude, speed, timestamp)
+
+    bus = get_active_bus(driver)
+    if bus is None:
+        return None, None
+
+    if shards.enabled() and shards.submit(bus.pk, [(latitude, longitude, speed, timestamp)]):
+        return bus, BusLocation(bus=bus, latitude=latitude, longitude=longitude, speed=speed, timestamp=timestamp)
+    anomalies.observe(bus.pk, latitude, longitude, speed, timestamp)
+    if jobs.config()['defer_history']:
+        jobs.defer('locations.history', bus.pk, latitude, longitude, speed, timestamp)
+        location = BusLocation(bus=bus, latitude=latitude, longitude=longitude, speed=speed, timestamp=timestamp)
+        return bus, location
+    return bus, write_queue.run(_record_location, bus, latitude, longitude, speed, timestamp)
+
+
+def _update_position(driver, latitude, longitude, speed, timestamp):
+    driver.current_latitude = latitude
+    driver.current_longitude = longitude
+    driver.last_location_update = timestamp
+    presence.heartbeat(driver.pk)
+    jobs.defer('driver.position', driver.pk, latitude, longitude, timestamp)
+    mirror.offer(driver, latitude, longitude, speed, timestamp)
+
+
+def _record_location(bus, latitude, longitude, speed, timestamp):
+    return BusLocation.objects.create(
+        bus=bus,
+        latitude=latitude,
+        longitude=longitude,
+        speed=speed,
+        timestamp=timestamp,
+    )
+
+
+def record_batch(driver, batch):
+    """
+    Store a FixBatch (oldest first) with one bulk insert. The driver's current
+    position becomes the last fix. Returns (bus, locations).
+    """
+    INGEST_FIXES.inc(amount=len(batch))
+    INGEST_RATE.add(len(batch))
+    latitude, longitude, speed, timestamp = batch.last()
+    _update_position(driver, latitude, longitude, speed, timestamp)
+
+    bus = get_active_bus(driver)
+    if bus is None:
+        return None, []
+
+    fixes = list(batch)
+    unsaved = [
+        BusLocation(bus=bus, latitude=lat, longitude=lng, speed=speed, timestamp=ts)
+        for lat, lng, speed, ts in fixes
+    ]
+    if shards.enabled() and shards.submit(bus.pk, fixes):
+        return bus, unsaved
+    for lat, lng, fix_speed, ts in fixes:
+        anomalies.observe(bus.pk, lat, lng, fix_speed, ts)
+    if jobs.config()['defer_history']:
+        jobs.defer('locations.history_batch', bus.pk, fixes)
+        return bus, unsaved
+    return bus, write_queue.run(_record_batch, bus, batch)
+
+
+def _record_batch(bus, batch):
+    locations = BusLocation.objects.bulk_create([
+        BusLocation(bus=bus, latitude=lat, longitude=lng, speed=speed, timestamp=ts)
+        for lat, lng, speed, ts in batch
+    ])
+    # bulk_create sends no post_save, so invalidate the fleet ETag here
+    transaction.on_commit(lambda: caching.bump_version(caching.FLEET))
+    return locations
+
+
+def store_fixes(fixes_by_bus):
+    """One bulk insert for {bus id: [(lat, lng, speed, timestamp), ...]}; used by ingest shards"""
+    def insert():
+        BusLocation.objects.bulk_create([
+            BusLocation(bus_id=bus_id, latitude=lat, longitude=lng, speed=speed, timestamp=ts)
+            for bus_id, fixes in fixes_by_bus.items()
+            for lat, lng, speed, ts in fixes
+        ])
+        transaction.on_commit(lambda: caching.bump_version(caching.FLEET))
+    write_queue.run(insert)
@@ -0,0 +1,330 @@
+# api/jobs.py
+
+"""
+In-process background jobs, for work that need not hold up the response.
+
+Tasks are plain functions registered by name with @task (see api/tasks.py).
+Views call defer(name, *args) and return; a pool of worker threads runs the
+job, retrying failures with exponential backoff. The queue is bounded: when
+it is full, defer() runs the job inline instead, so load turns into latency
+rather than lost work.
+
+With settings.JOB_QUEUE['durable_path'] set, every accepted job is also
+written to a small SQLite file and only deleted once it succeeds. Jobs still
+pending when a process dies are picked up again by the next one to start.
+Arguments must then be JSON-serializable (DjangoJSONEncoder), so pass ids
+and values rather than model instances. Jobs that exhaust their retries are
+kept in that file with status 'failed'.
+
+shutdown() (registered with atexit) stops accepting jobs and drains what is
+queued, up to a timeout.
+"""
+
+import atexit
+import heapq
+import itertools
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, connection
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+JOBS = metrics.registry.counter(
+    'campushub_jobs_total', 'Background jobs by task and outcome', labels=('task', 'outcome'))
+JOB_TIME = metrics.registry.histogram(
+    'campushub_job_duration_seconds', 'Background job run time', labels=('task',))
+QUEUE_DEPTH = metrics.registry.gauge('campushub_job_queue_depth', 'Jobs waiting for a worker')
+
+DEFAULTS = {
+    'enabled': True,
+    'workers': 2,
+    'maxsize': 10000,
+    'retries': 3,
+    'backoff_s': 0.5,
+    'durable_path': None,
+    'drain_timeout_s': 10,
+    # Also move BusLocation inserts off the request (see api/ingest.py)
+    'defer_history': False,
+}
+
+TASKS = {}
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Task:
+    def __init__(self, name, func, retries=None):
+        self.name = name
+        self.func = func
+        self.retries = retries
+
+
+def task(name, retries=None):
+    """Register a function as background task `name`"""
+    def register(func):
+        TASKS[name] = Task(name, func, retries)
+        return func
+    return register
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'JOB_QUEUE', {})}
+
+
+# ============================================
+# DURABLE STORE
+# ============================================
+
+class SQLiteStore:
+    """Pending jobs in their own SQLite file, independent of the app database"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY,
+            task TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            run_at REAL NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            error TEXT
+        )
+    """
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute(self.SCHEMA)
+
+    def add(self, name, args, kwargs):
+        payload = json.dumps([args, kwargs], cls=DjangoJSONEncoder)
+        with self._lock:
+            cur = self._conn.execute(
+                'INSERT INTO jobs (task, payload, run_at) VALUES (?, ?, ?)', (name, payload, time.time()))
+        return cur.lastrowid
+
+    def pending(self):
+        """(id, task, args, kwargs, attempts, run_at) for every pending job, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, task, payload, attempts, run_at FROM jobs WHERE status = 'pending' ORDER BY id"
+            ).fetchall()
+        for job_id, name, payload, attempts, run_at in rows:
+            args, kwargs = json.loads(payload)
+            yield job_id, name, tuple(args), kwargs, attempts, run_at
+
+    def done(self, job_id):
+        with self._lock:
+            self._conn.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+
+    def retry(self, job_id, attempts, run_at, error):
+        with self._lock:
+            self._conn.execute(
+                'UPDATE jobs SET attempts = ?, run_at = ?, error = ? WHERE id = ?',
+                (attempts, run_at, error, job_id))
+
+    def failed(self, job_id, error):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET status = 'failed', error = ? WHERE id = ?", (error, job_id))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# ============================================
+# QUEUE
+# ============================================
+
+_STOP = object()
+
+
+class JobQueue:
+    def __init__(self, workers=2, maxsize=10000, retries=3, backoff_s=0.5, store=None):
+        self.retries = retries
+        self.backoff_s = backoff_s
+        self.store = store
+        self._queue = queue.Queue(maxsize)
+        # Jobs waiting out a retry backoff: (run_at, seq, item)
+        self._delayed = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._active = 0
+        self._closed = False
+        self._threads = [
+            threading.Thread(target=self._work, name=f'jobs-{i}', daemon=True) for i in range(workers)
+        ]
+        if store is not None:
+            self._recover()
+        for t in self._threads:
+            t.start()
+
+    def _recover(self):
+        recovered = 0
+        for job_id, name, args, kwargs, attempts, run_at in self.store.pending():
+            self._delay((job_id, name, args, kwargs, attempts), run_at)
+            recovered += 1
+        if recovered:
+            logger.info("Recovered %d pending background jobs", recovered)
+
+    def enqueue(self, name, *args, **kwargs):
+        """Queue task `name`; raises QueueFull when the queue is at capacity"""
+        if name not in TASKS:
+            raise KeyError(f'Unknown task {name!r}')
+        if self._closed or self._queue.full():
+            raise QueueFull(name)
+        job_id = self.store.add(name, args, kwargs) if self.store is not None else None
+        try:
+            self._queue.put_nowait((job_id, name, args, kwargs, 0))
+        except queue.Full:
+            if job_id is not None:
+                self.store.done(job_id)
+            raise QueueFull(name)
+        QUEUE_DEPTH.set(value=self._queue.qsize())
+
+    def _delay(self, item, run_at):
+        with self._lock:
+            heapq.heappush(self._delayed, (run_at, next(self._seq), item))
+
+    def _next_item(self):
+        """
+        (item, from_queue): a retry that is due, else the next queued job
+        (waiting briefly). Queued jobs count as unfinished until task_done().
+        """
+        with self._lock:
+            if self._delayed and self._delayed[0][0] <= time.time():
+                self._active += 1
+                return heapq.heappop(self._delayed)[2], False
+            wait = min(0.5, self._delayed[0][0] - time.time()) if self._delayed else 0.5
+        try:
+            return self._queue.get(timeout=max(wait, 0.01)), True
+        except queue.Empty:
+            return None, False
+
+    def _work(self):
+        while True:
+            item, from_queue = self._next_item()
+            if item is _STOP:
+                break
+            if item is None:
+                continue
+            try:
+                self._execute(item)
+            finally:
+                if from_queue:
+                    self._queue.task_done()
+                else:
+                    with self._lock:
+                        self._active -= 1
+        connection.close()
+
+    def _execute(self, item):
+        job_id, name, args, kwargs, attempts = item
+        entry = TASKS[name]
+        close_old_connections()
+        start = time.perf_counter()
+        try:
+            entry.func(*args, **kwargs)
+        except Exception as exc:
+            JOB_TIME.observe(time.perf_counter() - start, name)
+            self._failed(item, entry, exc)
+            return
+        JOB_TIME.observe(time.perf_counter() - start, name)
+        JOBS.inc(name, 'ok')
+        if job_id is not None:
+            self.store.done(job_id)
+
+    def _failed(self, item, entry, exc):
+        job_id, name, args, kwargs, attempts = item
+        attempts += 1
+        retries = self.retries if entry.retries is None else entry.retries
+        error = f'{type(exc).__name__}: {exc}'
+        if attempts > retries:
+            JOBS.inc(name, 'failed')
+            logger.error("Background job %s failed after %d attempts: %s", name, attempts, error)
+            if job_id is not None:
+                self.store.failed(job_id, error)
+            return
+        JOBS.inc(name, 'retried')
+        run_at = time.time() + self.backoff_s * 2 ** (attempts - 1)
+        if job_id is not None:
+            self.store.retry(job_id, attempts, run_at, error)
+        self._delay((job_id, name, args, kwargs, attempts), run_at)
+
+    def idle(self):
+        with self._lock:
+            return not self._queue.unfinished_tasks and not self._delayed and not self._active
+
+    def shutdown(self, timeout=10):
+        """Stop accepting jobs, run what is queued, then stop the workers"""
+        if self._closed:
+            return
+        self._closed = True
+        deadline = time.monotonic() + timeout
+        while not self.idle() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        if not self.idle():
+            logger.warning("Background jobs still pending at shutdown (%d queued, %d delayed)",
+                           self._queue.qsize(), len(self._delayed))
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for t in self._threads:
+            t.join(max(0.0, deadline - time.monotonic()) + 1)
+        if self.store is not None:
+            self.store.close()
+
+
+# ============================================
+# MODULE API
+# ============================================
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    """The process-wide JobQueue, started on first use (None when disabled)"""
+    global _queue
+    cfg = config()
+    if not cfg['enabled']:
+        return None
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                store = SQLiteStore(cfg['durable_path']) if cfg['durable_path'] else None
+                _queue = JobQueue(cfg['workers'], cfg['maxsize'], cfg['retries'], cfg['backoff_s'], store)
+                atexit.register(shutdown)
+    return _queue
+
+
+def defer(name, *args, **kwargs):
+    """Run task `name` in the background; inline when disabled or the queue is full"""
+    jobs = get_queue()
+    if jobs is not None:
+        try:
+            jobs.enqueue(name, *args, **kwargs)
+            return
+        except QueueFull:
+            JOBS.inc(name, 'inline')
+    TASKS[name].func(*args, **kwargs)
+
+
+def shutdown(timeout=None):
+    global _queue
+    with _queue_lock:
+        jobs, _queue = _queue, None
+    if jobs is not None:
+        jobs.shutdown(config()['drain_timeout_s'] if timeout is None else timeout)
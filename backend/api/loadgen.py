@@ -0,0 +1,298 @@
+# api/loadgen.py
+
+"""
+Synthetic campus fleet load for capacity testing (used by `manage.py loadtest`).
+
+Requests go through the full Django/DRF stack in-process via APIClient,
+with force_authenticate standing in for Firebase token verification. Every
+seeded name, id and Firebase uid starts with SEED_PREFIX, so cleanup() removes
+exactly what seed() created.
+
+Both refuse to run against a database that holds real students or drivers
+unless called with allow_live=True (`loadtest --allow-live-db`).
+"""
+
+import math
+import random
+import threading
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import Bus, Driver, Route, Student
+
+SEED_PREFIX = 'load-'
+# Firebase uids of every synthetic user: seed() here and trace replay (api/traces.py)
+SYNTHETIC_PREFIXES = (SEED_PREFIX, 'replay-')
+
+# Campus centre the synthetic traces wander around
+CENTER = (12.9716, 77.5946)
+
+
+# ============================================
+# SEEDING
+# ============================================
+
+def holds_real_data():
+    """True when the database has students or drivers that seed() or trace replay did not create"""
+    synthetic = Q()
+    for prefix in SYNTHETIC_PREFIXES:
+        synthetic |= Q(firebase_uid__startswith=prefix)
+    return Student.objects.exclude(synthetic).exists() or Driver.objects.exclude(synthetic).exists()
+
+
+def _check_database(allow_live):
+    if not allow_live and holds_real_data():
+        raise RuntimeError(
+            f"Database '{connection.settings_dict['NAME']}' holds real students or drivers; "
+            "load testing it needs allow_live=True")
+
+
+def seed(students, drivers, routes, stops_per_route=8, allow_live=False):
+    """Create students, drivers (each with an active bus) and routes"""
+    _check_database(allow_live)
+    stop_names = [f'{SEED_PREFIX}stop-{i}' for i in range(max(stops_per_route * 2, 10))]
+
+    for i in range(routes):
+        stops = random.sample(stop_names, stops_per_route)
+        Route.objects.create(
+            name=f'{SEED_PREFIX}route-{i}',
+            source=stops[0],
+            destination=stops[-1],
+            stops=stops,
+            estimated_duration=random.randint(20, 60),
+        )
+
+    student_objs = []
+    for i in range(students):
+        user = User.objects.create(username=f'{SEED_PREFIX}student-{i}')
+        student_objs.append(Student.objects.create(
+            user=user, firebase_uid=f'{SEED_PREFIX}s{i}', student_id=f'{SEED_PREFIX}S{i:05d}',
+            phone='0', address='load test',
+        ))
+
+    driver_objs = []
+    for i in range(drivers):
+        user = User.objects.create(username=f'{SEED_PREFIX}driver-{i}')
+        driver = Driver.objects.create(
+            user=user, firebase_uid=f'{SEED_PREFIX}d{i}', driver_id=f'{SEED_PREFIX}D{i:05d}',
+            license_number='LOADTEST', phone='0',
+        )
+        Bus.objects.create(bus_number=f'{SEED_PREFIX}B{i:05d}', driver=driver)
+        driver_objs.append(driver)
+
+    return student_objs, driver_objs, stop_names
+
+
+def _seeded_users():
+    # Matched on the profile's uid as well, so a real 'load-...' username survives
+    return User.objects.filter(username__startswith=SEED_PREFIX).filter(
+        Q(student__firebase_uid__startswith=SEED_PREFIX) | Q(driver__firebase_uid__startswith=SEED_PREFIX))
+
+
+def cleanup_needed():
+    return _seeded_users().exists()
+
+
+def cleanup(allow_live=False):
+    """Delete everything seed() created (cascades to buses, bookings, locations)"""
+    _check_database(allow_live)
+    Route.objects.filter(name__startswith=f'{SEED_PREFIX}route-', source__startswith=f'{SEED_PREFIX}stop-').delete()
+    Bus.objects.filter(bus_number__startswith=SEED_PREFIX, driver__firebase_uid__startswith=SEED_PREFIX).delete()
+    _seeded_users().delete()
+
+
+# ============================================
+# SYNTHETIC GPS TRACES
+# ============================================
+
+def synthetic_trace(seed_value, radius_km=3.0):
+    """
+    Endless (lat, lng, speed_kmh) fixes for one bus: a loop around the campus
+    centre with stops (speed 0) and speed noise.
+    """
+    rng = random.Random(seed_value)
+    phase = rng.random() * 2 * math.pi
+    radius = radius_km * rng.uniform(0.4, 1.0) / 111.0
+    step = 0
+    while True:
+        step += 1
+        if step % rng.randint(20, 40) == 0:
+            speed = 0.0
+        else:
+            speed = max(0.0, rng.gauss(28, 8))
+            phase += speed / 3600 / (radius * 111) * 5
+        yield (
+            round(CENTER[0] + radius * math.sin(phase), 6),
+            round(CENTER[1] + radius * math.cos(phase), 6),
+            round(speed, 1),
+        )
+
+
+# ============================================
+# RUNNER
+# ============================================
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class EndpointStats:
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.errors = 0
+        self.queries = 0
+        self.statuses = {}
+        self._lock = threading.Lock()
+
+    def record(self, seconds, status_code, queries):
+        with self._lock:
+            self.latencies.append(seconds)
+            self.queries += queries
+            self.statuses[status_code] = self.statuses.get(status_code, 0) + 1
+            if status_code >= 400:
+                self.errors += 1
+
+    def summary(self, duration):
+        lat = sorted(self.latencies)
+        count = len(lat)
+        return {
+            'requests': count,
+            'errors': self.errors,
+            'statuses': {str(k): v for k, v in sorted(self.statuses.items())},
+            'throughput_rps': count / duration if duration else 0.0,
+            'p50_ms': percentile(lat, 50) * 1000,
+            'p95_ms': percentile(lat, 95) * 1000,
+            'p99_ms': percentile(lat, 99) * 1000,
+            'max_ms': (lat[-1] if lat else 0.0) * 1000,
+            'queries_per_request': self.queries / count if count else 0.0,
+        }
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def _paced(rate, deadline, stop):
+    """Yield once per 1/rate seconds until the deadline (no catch-up bursts)"""
+    interval = 1.0 / rate
+    next_at = time.perf_counter()
+    while not stop.is_set() and next_at < deadline:
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        yield
+        next_at = max(next_at + interval, time.perf_counter())
+
+
+def _timed(stats, call):
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        start = time.perf_counter()
+        response = call()
+        elapsed = time.perf_counter() - start
+    stats.record(elapsed, response.status_code, counter.count)
+    return response
+
+
+def _client(kind, index):
+    """
+    APIClient with its own address, so per-IP rate limits see distinct clients.
+    Server errors come back as 500 responses and count as errors; raised, they
+    would end the actor's thread and drop out of the report.
+    """
+    return APIClient(SERVER_NAME='localhost', REMOTE_ADDR=f'10.{kind}.{index // 256 % 256}.{index % 256}',
+                     raise_request_exception=False)
+
+
+def _driver_actor(driver, stats, rate, deadline, stop):
+    client = _client(1, driver.pk)
+    client.force_authenticate(driver.user)
+    trace = synthetic_trace(driver.pk)
+    for _ in _paced(rate, deadline, stop):
+        lat, lng, speed = next(trace)
+        _timed(stats, lambda: client.post(
+            '/api/driver/location/update/', {'lat': lat, 'lng': lng, 'speed': speed}, format='json'))
+    connection.close()
+
+
+def _student_actor(student, stats, rate, deadline, stop, stop_names):
+    client = _client(2, student.pk)
+    client.force_authenticate(student.user)
+    rng = random.Random(student.pk)
+    for _ in _paced(rate, deadline, stop):
+        source, destination = rng.sample(stop_names, 2)
+        pickup = (timezone.now() + timedelta(minutes=rng.randint(10, 600))).isoformat()
+        _timed(stats, lambda: client.post('/api/student/booking/create/', {
+            'source': source, 'destination': destination, 'pickup_time': pickup,
+        }, format='json'))
+    connection.close()
+
+
+def _poller_actor(index, stats, rate, deadline, stop, conditional):
+    client = _client(3, index)
+    etag = None
+    for _ in _paced(rate, deadline, stop):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if conditional and etag else {}
+        response = _timed(stats, lambda: client.get('/api/admin/buses/locations/', **headers))
+        etag = response.get('ETag', etag)
+    connection.close()
+
+
+def run(students, drivers, stop_names, duration, ping_rate, booking_rate,
+        pollers, poll_rate, conditional_polls=True):
+    """
+    Run ingest, booking and fleet-polling load concurrently for `duration`
+    seconds. Rates are per actor, in requests per second.
+    """
+    endpoints = {
+        'update_driver_location': EndpointStats('update_driver_location'),
+        'create_booking': EndpointStats('create_booking'),
+        'get_all_bus_locations': EndpointStats('get_all_bus_locations'),
+    }
+    stop = threading.Event()
+    deadline = time.perf_counter() + duration
+    threads = []
+
+    if ping_rate > 0:
+        threads += [threading.Thread(target=_driver_actor, args=(
+            d, endpoints['update_driver_location'], ping_rate, deadline, stop)) for d in drivers]
+    if booking_rate > 0:
+        threads += [threading.Thread(target=_student_actor, args=(
+            s, endpoints['create_booking'], booking_rate, deadline, stop, stop_names)) for s in students]
+    if poll_rate > 0:
+        threads += [threading.Thread(target=_poller_actor, args=(
+            i, endpoints['get_all_bus_locations'], poll_rate, deadline, stop, conditional_polls))
+            for i in range(pollers)]
+
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    try:
+        for t in threads:
+            t.join()
+    except KeyboardInterrupt:
+        stop.set()
+        for t in threads:
+            t.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'duration_s': elapsed,
+        'endpoints': {name: s.summary(elapsed) for name, s in endpoints.items() if s.latencies},
+    }
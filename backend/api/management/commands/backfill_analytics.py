@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from api.analytics import record_trip
+from api.models import Trip
+
+
+class Command(BaseCommand):
+    help = "Add completed trips that have no TripStats yet to the KPI rollups."
+
+    def handle(self, *args, **options):
+        pending = Trip.objects.filter(status='completed', stats__isnull=True).order_by('pk')
+        recorded = 0
+        for trip_id in pending.values_list('pk', flat=True).iterator():
+            if record_trip(trip_id) is not None:
+                recorded += 1
+        self.stdout.write(self.style.SUCCESS(f"Recorded {recorded} trips"))
@@ -0,0 +1,42 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.export import CHUNK_SIZE, DATASETS, FORMATS, parse_bound, stream
+
+
+class Command(BaseCommand):
+    help = "Stream bookings, trips or location history to CSV or NDJSON in constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(DATASETS))
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--start', help='Range start, ISO date or datetime (inclusive)')
+        parser.add_argument('--end', help='Range end, ISO datetime (exclusive) or date (that whole day included)')
+        parser.add_argument('--output', '-o', help='File to write (default: stdout)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            start = parse_bound(options['start']) if options['start'] else None
+            end = parse_bound(options['end'], is_end=True) if options['end'] else None
+        except ValueError as exc:
+            raise CommandError(f'Invalid date: {exc}')
+
+        pieces = stream(options['dataset'], options['format'], start, end, options['chunk_size'])
+        out = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        written = 0
+        try:
+            for piece in pieces:
+                data = piece.encode('utf-8') if isinstance(piece, str) else piece
+                out.write(data)
+                written += len(data)
+        finally:
+            if options['output']:
+                out.close()
+            else:
+                out.flush()
+
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Wrote {written} bytes of {options['dataset']} to {options['output']}"))
@@ -0,0 +1,45 @@
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.traces import export_trace
+
+
+class Command(BaseCommand):
+    help = "Export a day's (or a time range's) BusLocation stream to a compact trace file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Trace file to write (add .gz to compress)')
+        parser.add_argument('--date', help='Day to export, YYYY-MM-DD (default: today)')
+        parser.add_argument('--start', help='Range start, ISO datetime (overrides --date)')
+        parser.add_argument('--end', help='Range end, ISO datetime (overrides --date)')
+        parser.add_argument('--bus', action='append', dest='buses', help='Only this bus number (repeatable)')
+
+    def handle(self, *args, **options):
+        try:
+            if options['start'] or options['end']:
+                if not (options['start'] and options['end']):
+                    raise CommandError('--start and --end must be given together')
+                start = self._aware(datetime.fromisoformat(options['start']))
+                end = self._aware(datetime.fromisoformat(options['end']))
+            else:
+                day = (datetime.strptime(options['date'], '%Y-%m-%d').date()
+                       if options['date'] else timezone.localdate())
+                start = self._aware(datetime.combine(day, time.min))
+                end = start + timedelta(days=1)
+        except ValueError as exc:
+            raise CommandError(f'Invalid date: {exc}')
+
+        try:
+            buses, fixes = export_trace(options['output'], start, end, options['buses'])
+        except ValueError as exc:
+            raise CommandError(f'Invalid range: {exc}')
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {fixes} fixes from {buses} buses ({start:%Y-%m-%d %H:%M} to {end:%Y-%m-%d %H:%M}) "
+            f"to {options['output']}"
+        ))
+
+    @staticmethod
+    def _aware(value):
+        return timezone.make_aware(value) if timezone.is_naive(value) else value
@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.models import Timetable
+from api.timetables import CHUNK_SIZE, generate_trips
+
+
+class Command(BaseCommand):
+    help = "Create Trip rows from active timetables for a date range; safe to re-run."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day, YYYY-MM-DD (default: today)')
+        parser.add_argument('--end', help='Last day, YYYY-MM-DD (default: start + --days - 1)')
+        parser.add_argument('--days', type=int, default=7)
+        parser.add_argument('--route', type=int, action='append', dest='routes', help='Only this route id (repeatable)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            start = (datetime.strptime(options['start'], '%Y-%m-%d').date()
+                     if options['start'] else timezone.localdate())
+            end = (datetime.strptime(options['end'], '%Y-%m-%d').date()
+                   if options['end'] else start + timedelta(days=options['days'] - 1))
+        except ValueError as exc:
+            raise CommandError(f'Invalid date: {exc}')
+        if end < start:
+            raise CommandError('--end is before --start')
+
+        timetables = Timetable.objects.filter(is_active=True, headway_minutes__gt=0)
+        if options['routes']:
+            timetables = timetables.filter(route_id__in=options['routes'])
+
+        created = generate_trips(start, end, timetables, options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Created {created} trips from {start} to {end}"))
@@ -0,0 +1,121 @@
+import json
+import platform
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api import loadgen
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic fleet and measure ingest, booking and fleet-map "
+        "polling under concurrent load. Results are written as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=50)
+        parser.add_argument('--drivers', type=int, default=50)
+        parser.add_argument('--routes', type=int, default=20)
+        parser.add_argument('--duration', type=float, default=30.0, help='Seconds of load')
+        parser.add_argument('--ping-rate', type=float, default=0.2,
+                            help='Location pings per second per driver (0 disables ingest)')
+        parser.add_argument('--booking-rate', type=float, default=0.05,
+                            help='Bookings per second per student (0 disables bookings)')
+        parser.add_argument('--pollers', type=int, default=20, help='Concurrent fleet-map pollers')
+        parser.add_argument('--poll-rate', type=float, default=1.0,
+                            help='Polls per second per poller (0 disables polling)')
+        parser.add_argument('--no-etag', action='store_true',
+                            help='Pollers ignore ETags and always fetch full bodies')
+        parser.add_argument('--output', help='Result file (default loadtest-<timestamp>.json)')
+        parser.add_argument('--baseline', help='Earlier result file to compare against')
+        parser.add_argument('--keep-data', action='store_true', help='Do not delete seeded rows')
+        parser.add_argument('--rate-limit', action='store_true',
+                            help='Keep API rate limiting on (off by default so limits do not cap the measurement)')
+        parser.add_argument('--allow-live-db', action='store_true',
+                            help='Seed and clean up even though the database holds real students or drivers')
+
+    def handle(self, *args, **options):
+        if not options['rate_limit']:
+            settings.RATE_LIMIT_ENABLED = False
+
+        allow_live = options['allow_live_db']
+        if not allow_live and loadgen.holds_real_data():
+            raise CommandError(
+                f"Database '{connection.settings_dict['NAME']}' holds real students or drivers. "
+                "Point DATABASE_URL at a scratch database, or pass --allow-live-db.")
+
+        if loadgen.cleanup_needed():
+            loadgen.cleanup(allow_live)
+
+        self.stdout.write(
+            f"Seeding {options['students']} students, {options['drivers']} drivers, "
+            f"{options['routes']} routes on {connection.vendor}..."
+        )
+        students, drivers, stop_names = loadgen.seed(
+            options['students'], options['drivers'], options['routes'], allow_live=allow_live)
+
+        try:
+            self.stdout.write(f"Running load for {options['duration']:.0f}s...")
+            result = loadgen.run(
+                students, drivers, stop_names,
+                duration=options['duration'],
+                ping_rate=options['ping_rate'],
+                booking_rate=options['booking_rate'],
+                pollers=options['pollers'],
+                poll_rate=options['poll_rate'],
+                conditional_polls=not options['no_etag'],
+            )
+        finally:
+            if not options['keep_data']:
+                loadgen.cleanup(allow_live)
+
+        result['config'] = {
+            key: options[key] for key in (
+                'students', 'drivers', 'routes', 'duration', 'ping_rate',
+                'booking_rate', 'pollers', 'poll_rate', 'no_etag')
+        }
+        result['database'] = connection.vendor
+        result['python'] = platform.python_version()
+        result['finished_at'] = datetime.now().isoformat()
+
+        self._report(result)
+
+        output = options['output'] or f"loadtest-{datetime.now():%Y%m%d-%H%M%S}.json"
+        with open(output, 'w') as fh:
+            json.dump(result, fh, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {output}"))
+
+        if options['baseline']:
+            self._compare(result, options['baseline'])
+
+    def _report(self, result):
+        self.stdout.write(
+            f"\n{'endpoint':<26}{'reqs':>7}{'err':>6}{'rps':>9}"
+            f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'q/req':>7}"
+        )
+        for name, s in result['endpoints'].items():
+            self.stdout.write(
+                f"{name:<26}{s['requests']:>7}{s['errors']:>6}{s['throughput_rps']:>9.1f}"
+                f"{s['p50_ms']:>9.1f}{s['p95_ms']:>9.1f}{s['p99_ms']:>9.1f}{s['queries_per_request']:>7.1f}"
+            )
+
+    def _compare(self, result, baseline_path):
+        try:
+            with open(baseline_path) as fh:
+                baseline = json.load(fh)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"Cannot read baseline {baseline_path}: {exc}")
+
+        self.stdout.write(f"\nChange vs {baseline_path}")
+        for name, s in result['endpoints'].items():
+            old = baseline.get('endpoints', {}).get(name)
+            if not old:
+                continue
+            deltas = []
+            for key in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request'):
+                if old[key]:
+                    deltas.append(f"{key} {100 * (s[key] - old[key]) / old[key]:+.1f}%")
+            self.stdout.write(f"  {name}: " + ', '.join(deltas))
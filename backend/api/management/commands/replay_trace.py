@@ -0,0 +1,80 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api import traces
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a trace file from export_trace through the ingest endpoint or "
+        "directly into the ingest layer, preserving timing, and report lag. "
+        "Fixes go to synthetic 'replay-' buses, never the real ones."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('trace', help='Trace file from export_trace')
+        parser.add_argument('--speed', default='1',
+                            help="Time scale: 1 = real time, 10 = ten times faster, 'max' = no waiting")
+        parser.add_argument('--via', choices=['endpoint', 'ingest'], default='endpoint',
+                            help='Send fixes through the HTTP view or call api.ingest directly')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--output', help='Write the summary as JSON to this file')
+        parser.add_argument('--rate-limit', action='store_true',
+                            help='Keep API rate limiting on (off by default so limits do not cap the measurement)')
+        parser.add_argument('--allow-live-db', action='store_true',
+                            help='Replay even though the database holds real students or drivers')
+
+    def handle(self, *args, **options):
+        if not options['rate_limit']:
+            settings.RATE_LIMIT_ENABLED = False
+
+        if options['speed'] == 'max':
+            speed = None
+        else:
+            try:
+                speed = float(options['speed'])
+            except ValueError:
+                raise CommandError("--speed must be a number or 'max'")
+            if speed <= 0:
+                raise CommandError('--speed must be positive')
+
+        try:
+            events = traces.timeline(options['trace'])
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"Cannot read {options['trace']}: {exc}")
+
+        bus_numbers = {event[1] for event in events}
+        try:
+            drivers = traces.replay_drivers(bus_numbers, allow_live=options['allow_live_db'])
+        except RuntimeError:
+            raise CommandError(
+                f"Database '{connection.settings_dict['NAME']}' holds real students or drivers. "
+                "Point DATABASE_URL at a scratch database, or pass --allow-live-db.")
+        sink = traces.endpoint_sink(drivers) if options['via'] == 'endpoint' else traces.ingest_sink(drivers)
+
+        pace = 'max speed' if speed is None else f"{options['speed']}x"
+        self.stdout.write(
+            f"Replaying {len(events)} fixes from {len(bus_numbers)} buses "
+            f"at {pace} via {options['via']}..."
+        )
+        summary = traces.replay(events, sink, speed=speed, workers=options['workers'])
+        summary.update(speed=options['speed'], via=options['via'], trace=options['trace'])
+
+        self.stdout.write(
+            f"{summary['fixes']} fixes in {summary['wall_seconds']:.1f}s "
+            f"(trace spans {summary['trace_seconds']:.1f}s), {summary['fixes_per_second']:.0f} fixes/s, "
+            f"{summary['errors']} errors"
+        )
+        self.stdout.write(
+            f"End-to-end lag ms, until {summary['lag_until']}: p50 {summary['lag_p50_ms']:.1f}  p95 {summary['lag_p95_ms']:.1f}  "
+            f"p99 {summary['lag_p99_ms']:.1f}  max {summary['lag_max_ms']:.1f}"
+        )
+        if summary['sample_error']:
+            self.stdout.write(self.style.WARNING(f"e.g. {summary['sample_error']}"))
+
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(summary, fh, indent=2)
@@ -0,0 +1,46 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import shards
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the ingest shard supervisor (INGEST_SHARDS): one process per shard, "
+        "fed by web workers over a Unix socket. --resize/--stats talk to a running one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, help='Shard processes (default: INGEST_SHARDS workers)')
+        parser.add_argument('--address', help='Unix socket path (default: INGEST_SHARDS address)')
+        parser.add_argument('--resize', type=int, metavar='N', help='Resize a running supervisor to N shards')
+        parser.add_argument('--stats', action='store_true', help='Print per-shard counts from a running supervisor')
+
+    def handle(self, *args, **options):
+        cfg = shards.config()
+        if options['address']:
+            cfg['address'] = options['address']
+
+        if options['resize'] or options['stats']:
+            try:
+                if options['resize']:
+                    moved = shards.request(('resize', options['resize']), cfg['address'])
+                    self.stdout.write(self.style.SUCCESS(f"Resized to {options['resize']} shards, {moved} buses moved"))
+                if options['stats']:
+                    self.stdout.write(json.dumps(shards.request(('stats',), cfg['address']), indent=2))
+            except OSError as exc:
+                raise CommandError(f"No supervisor at {cfg['address']}: {exc}")
+            except RuntimeError as exc:
+                raise CommandError(str(exc))
+            return
+
+        workers = options['workers'] or cfg['workers']
+        pool = shards.ShardPool(workers, cfg)
+        self.stdout.write(self.style.SUCCESS(f"{workers} ingest shards listening on {cfg['address']}"))
+        try:
+            shards.serve(pool, cfg['address'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            pool.shutdown()
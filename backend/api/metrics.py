@@ -0,0 +1,206 @@
+# api/metrics.py
+
+"""
+In-process metrics with Prometheus text exposition.
+
+Counters and histograms are per worker process; scrape every worker (or sum
+them in Prometheus) for fleet-wide numbers.
+"""
+
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in items:
+            yield self.name, _format_labels(self.labels, label_values), value
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, *label_values, value):
+        with self._lock:
+            self._values[label_values] = value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [bucket counts..., +Inf count, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(label_values)
+            if row is None:
+                row = self._values[label_values] = [0] * (len(self.buckets) + 2)
+            row[index] += 1
+            row[-1] += value
+
+    def count(self, *label_values):
+        row = self._values.get(label_values)
+        return sum(row[:-1]) if row else 0
+
+    def samples(self):
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        for label_values, row in items:
+            cumulative = 0
+            for bound, hits in zip(self.buckets + ('+Inf',), row[:-1]):
+                cumulative += hits
+                yield self.name + '_bucket', _format_labels(self.labels, label_values, ('le', bound)), cumulative
+            yield self.name + '_sum', _format_labels(self.labels, label_values), row[-1]
+            yield self.name + '_count', _format_labels(self.labels, label_values), cumulative
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text, labels=()):
+        return self.register(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=()):
+        return self.register(Gauge(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+class RateMeter:
+    """
+    Events per second, smoothed over roughly `horizon` seconds (EWMA over
+    1-second slots). Cheap enough to call on every ping.
+    """
+
+    def __init__(self, horizon=10.0):
+        self.alpha = 1.0 / horizon
+        self._slot = int(time.monotonic())
+        self._count = 0
+        self._rate = 0.0
+        self._lock = threading.Lock()
+
+    def _roll(self, slot):
+        # Close the current slot and decay through any empty slots since
+        elapsed = slot - self._slot
+        if elapsed > 0:
+            self._rate += self.alpha * (self._count - self._rate)
+            self._rate *= (1 - self.alpha) ** (elapsed - 1)
+            self._slot, self._count = slot, 0
+
+    def add(self, n=1):
+        slot = int(time.monotonic())
+        with self._lock:
+            self._roll(slot)
+            self._count += n
+
+    def rate(self):
+        with self._lock:
+            self._roll(int(time.monotonic()))
+            return self._rate
+
+
+registry = Registry()
+
+REQUEST_LATENCY = registry.histogram(
+    'campushub_request_duration_seconds', 'Request latency by view', labels=('view', 'method'))
+REQUESTS = registry.counter(
+    'campushub_requests_total', 'Requests by view and status', labels=('view', 'method', 'status'))
+DB_QUERIES = registry.counter(
+    'campushub_db_queries_total', 'Database queries by view', labels=('view',))
+DB_TIME = registry.histogram(
+    'campushub_db_duration_seconds', 'Database time per request by view', labels=('view',))
+AUTH_TIME = registry.histogram(
+    'campushub_auth_verification_seconds', 'Firebase token verification time',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+
+
+# ============================================
+# PER-REQUEST STATS
+# ============================================
+
+class RequestStats:
+    """Query count / DB time / auth time for the request in progress"""
+    __slots__ = ('queries', 'db_time', 'auth_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.auth_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+
+
+current_stats = contextvars.ContextVar('request_stats', default=None)
+
+
+def record_auth_time(seconds):
+    AUTH_TIME.observe(seconds)
+    stats = current_stats.get()
+    if stats is not None:
+        stats.auth_time += seconds
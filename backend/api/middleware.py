@@ -0,0 +1,85 @@
+# api/middleware.py
+
+import hmac
+import logging
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import metrics, profiling
+
+slow_logger = logging.getLogger('api.slow')
+
+
+class MetricsMiddleware:
+    """
+    Records per-view latency, status, DB query count and DB time.
+
+    Requests slower than SLOW_REQUEST_MS (0 = off) are also logged to 'api.slow'
+    with their query and auth breakdown.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_seconds = getattr(settings, 'SLOW_REQUEST_MS', 0) / 1000
+
+    def __call__(self, request):
+        stats = metrics.RequestStats()
+        token = metrics.current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(stats))
+                response = self.get_response(request)
+        finally:
+            metrics.current_stats.reset(token)
+        elapsed = time.perf_counter() - start
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        metrics.REQUEST_LATENCY.observe(elapsed, view, request.method)
+        metrics.REQUESTS.inc(view, request.method, response.status_code)
+        if stats.queries:
+            metrics.DB_QUERIES.inc(view, amount=stats.queries)
+        metrics.DB_TIME.observe(stats.db_time, view)
+
+        if self.slow_seconds and elapsed >= self.slow_seconds:
+            slow_logger.warning(
+                'Slow request %s %s view=%s status=%s total_ms=%.1f db_ms=%.1f queries=%d auth_ms=%.1f',
+                request.method, request.path, view, response.status_code,
+                elapsed * 1000, stats.db_time * 1000, stats.queries, stats.auth_time * 1000,
+            )
+        return response
+
+
+class ProfileMiddleware:
+    """
+    Profiles a single request sent with "X-Profile: <PROFILING token>" and
+    answers with X-Profile-Id for GET /api/admin/profile/<id>/. Not installed
+    at all when no token is configured.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        cfg = profiling.config()
+        if not cfg['token']:
+            raise MiddlewareNotUsed
+        self.token = cfg['token'].encode()
+        self.interval_s = cfg['request_interval_ms'] / 1000
+
+    def __call__(self, request):
+        header = request.META.get('HTTP_X_PROFILE')
+        # compare_digest takes non-ASCII only as bytes; headers arrive latin-1 decoded
+        if header is None or not hmac.compare_digest(header.encode('latin-1', 'replace'), self.token):
+            return self.get_response(request)
+
+        with profiling.Sampler(self.interval_s, only={threading.get_ident()}, mode='request') as sampler:
+            response = self.get_response(request)
+        response['X-Profile-Id'] = profiling.save_request_profile(sampler)
+        response['X-Profile-Samples'] = str(sampler.samples)
+        return response
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.8 on 2026-10-19 10:18
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0003_delete_demanddata"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="buslocation",
+            name="timestamp",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now,
+                help_text="Fix time (device time for batched uploads)",
+            ),
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.2.8 on 2026-10-19 10:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0004_buslocation_timestamp_default"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="KPIRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "scope",
+                    models.CharField(
+                        choices=[("route", "Route"), ("bus", "Bus")], max_length=10
+                    ),
+                ),
+                ("object_id", models.IntegerField()),
+                ("label", models.CharField(max_length=100)),
+                ("trips", models.IntegerField(default=0)),
+                ("on_time_trips", models.IntegerField(default=0)),
+                ("delay_seconds", models.FloatField(default=0.0)),
+                ("passengers", models.IntegerField(default=0)),
+                ("seats", models.IntegerField(default=0)),
+                ("distance_m", models.FloatField(default=0.0)),
+                ("moving_seconds", models.FloatField(default=0.0)),
+                ("idle_seconds", models.FloatField(default=0.0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("scope", "object_id"), name="unique_kpi_rollup"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="TripStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("on_time", models.BooleanField()),
+                (
+                    "delay_seconds",
+                    models.FloatField(help_text="Actual start minus scheduled time"),
+                ),
+                ("passengers", models.IntegerField()),
+                (
+                    "seats",
+                    models.IntegerField(help_text="Bus capacity at completion"),
+                ),
+                ("distance_m", models.FloatField()),
+                ("moving_seconds", models.FloatField()),
+                ("idle_seconds", models.FloatField()),
+                ("fixes", models.IntegerField()),
+                ("computed_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "trip",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stats",
+                        to="api.trip",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 5.2.8 on 2026-10-19 10:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0005_trip_stats_kpi_rollup"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Timetable",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "weekdays",
+                    models.CharField(
+                        default="01234",
+                        help_text="Days it runs, Monday=0 ... Sunday=6",
+                        max_length=7,
+                    ),
+                ),
+                (
+                    "start_time",
+                    models.TimeField(help_text="First departure of the band"),
+                ),
+                (
+                    "end_time",
+                    models.TimeField(help_text="No departures at or after this time"),
+                ),
+                ("headway_minutes", models.PositiveIntegerField()),
+                ("valid_from", models.DateField(blank=True, null=True)),
+                (
+                    "valid_until",
+                    models.DateField(
+                        blank=True, help_text="Last day it runs", null=True
+                    ),
+                ),
+                ("is_active", models.BooleanField(default=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "bus",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="timetables",
+                        to="api.bus",
+                    ),
+                ),
+                (
+                    "driver",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="timetables",
+                        to="api.driver",
+                    ),
+                ),
+                (
+                    "route",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="timetables",
+                        to="api.route",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="trip",
+            name="timetable",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Set on trips generated from a timetable (api/timetables.py)",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="trips",
+                to="api.timetable",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="trip",
+            constraint=models.UniqueConstraint(
+                fields=("timetable", "scheduled_time"),
+                name="unique_timetable_departure",
+            ),
+        ),
+    ]
@@ -0,0 +1,255 @@
+# api/mirror.py
+
+"""
+Mirror driver positions into the Firestore `driver_locations` collection,
+which the frontend map listens to (useLiveDrivers).
+
+Ingest only calls offer(), which keeps the latest fix per driver in memory.
+A flusher thread wakes every `interval_s` and writes whatever changed since
+the last flush as batched set(merge=True) writes (at most MAX_BATCH documents
+per commit), so Firestore sees one write per driver per interval however
+often that driver pings. Failed commits are retried with exponential backoff;
+if they still fail, the fixes go back into the pending set (unless a newer
+fix arrived meanwhile) and are retried on the next cycle.
+
+Fixes carry position fields only. isActive belongs to the frontend (the
+driver portal sets it true when sharing starts and false when it stops), so
+the mirror writes it only when presence (api/presence.py) switches a silent
+driver off, or back on at their next fix.
+Pending documents for one driver merge field by field, newest updatedAt wins.
+
+The client comes from settings.FIRESTORE_MIRROR['client'], a dotted path to
+a zero-argument factory. The default is the Admin SDK client, which honours
+FIRESTORE_EMULATOR_HOST for the local emulator; MemoryFirestore is an
+in-process stand-in for tests and development.
+"""
+
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+DOCS = metrics.registry.counter('campushub_mirror_docs_total', 'Driver documents written to Firestore')
+BATCHES = metrics.registry.counter(
+    'campushub_mirror_batches_total', 'Firestore batch commits by outcome', labels=('outcome',))
+PENDING = metrics.registry.gauge('campushub_mirror_pending', 'Drivers waiting for the next mirror flush')
+
+COLLECTION = 'driver_locations'
+# Firestore's limit on writes per batch
+MAX_BATCH = 500
+
+DEFAULTS = {
+    'enabled': False,
+    'client': 'backend_project.firebase_config.get_firestore',
+    'collection': COLLECTION,
+    'interval_s': 2.0,
+    'retries': 3,
+    'backoff_s': 0.5,
+}
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'FIRESTORE_MIRROR', {})}
+
+
+def location_doc(driver_id, latitude, longitude, speed, timestamp):
+    """Position fields the frontend reads from a driver_locations document"""
+    return {
+        'driverId': driver_id,
+        'latitude': float(latitude),
+        'longitude': float(longitude),
+        'speed': float(speed or 0),
+        'timestamp': timestamp,
+        'updatedAt': timestamp,
+    }
+
+
+def activity_doc(driver_id, active, timestamp):
+    return {'driverId': driver_id, 'isActive': active, 'updatedAt': timestamp}
+
+
+def _merge(current, doc):
+    """Both documents' fields, the newer one's where they overlap"""
+    if current is None:
+        return doc
+    if current['updatedAt'] <= doc['updatedAt']:
+        return {**current, **doc}
+    return {**doc, **current}
+
+
+class FirestoreMirror:
+    def __init__(self, client_factory, collection=COLLECTION, interval_s=2.0, retries=3, backoff_s=0.5):
+        self.client_factory = client_factory
+        self.collection = collection
+        self.interval_s = interval_s
+        self.retries = retries
+        self.backoff_s = backoff_s
+        self._client = None
+        # firebase uid -> document, latest fix only
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name='firestore-mirror', daemon=True)
+        self._thread.start()
+
+    def offer(self, uid, doc):
+        with self._lock:
+            self._pending[uid] = _merge(self._pending.get(uid), doc)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval_s):
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        """Write everything pending; returns the number of documents written"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        PENDING.set(value=len(pending))
+        if not pending:
+            return 0
+
+        items = list(pending.items())
+        written = 0
+        for start in range(0, len(items), MAX_BATCH):
+            chunk = items[start:start + MAX_BATCH]
+            if self._commit(chunk):
+                written += len(chunk)
+            else:
+                self._requeue(items[start:])
+                break
+        DOCS.inc(amount=written)
+        return written
+
+    def _commit(self, chunk):
+        for attempt in range(self.retries + 1):
+            try:
+                if self._client is None:
+                    self._client = self.client_factory()
+                collection = self._client.collection(self.collection)
+                batch = self._client.batch()
+                for uid, doc in chunk:
+                    batch.set(collection.document(uid), doc, merge=True)
+                batch.commit()
+                BATCHES.inc('ok')
+                return True
+            except Exception as exc:
+                BATCHES.inc('error')
+                if attempt == self.retries or self._stop.is_set():
+                    logger.warning("Firestore mirror commit failed (%d docs): %s", len(chunk), exc)
+                    return False
+                time.sleep(self.backoff_s * 2 ** attempt)
+        return False
+
+    def _requeue(self, items):
+        with self._lock:
+            for uid, doc in items:
+                self._pending[uid] = _merge(self._pending.get(uid), doc)
+
+    def close(self, timeout=5):
+        """Stop the flusher after one last flush"""
+        self._stop.set()
+        self._thread.join(timeout)
+
+
+class MemoryFirestore:
+    """
+    Just enough of the Firestore client for the mirror: collection().document(),
+    batch().set(..., merge=True) and commit(). Documents live in `self.data`.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.commits = 0
+        self._lock = threading.Lock()
+
+    def collection(self, name):
+        return _MemoryCollection(name)
+
+    def batch(self):
+        return _MemoryBatch(self)
+
+    def _apply(self, writes):
+        with self._lock:
+            for (collection, doc_id), fields, merge in writes:
+                key = (collection, doc_id)
+                self.data[key] = {**self.data.get(key, {}), **fields} if merge else dict(fields)
+            self.commits += 1
+
+
+class _MemoryCollection:
+    def __init__(self, name):
+        self.name = name
+
+    def document(self, doc_id):
+        return (self.name, doc_id)
+
+
+class _MemoryBatch:
+    def __init__(self, store):
+        self.store = store
+        self.writes = []
+
+    def set(self, ref, fields, merge=False):
+        self.writes.append((ref, fields, merge))
+
+    def commit(self):
+        self.store._apply(self.writes)
+
+
+# ============================================
+# MODULE API
+# ============================================
+
+_mirror = None
+_mirror_lock = threading.Lock()
+
+
+def enabled():
+    return config()['enabled']
+
+
+def get_mirror():
+    """The process-wide mirror, started on first use (None when disabled)"""
+    global _mirror
+    cfg = config()
+    if not cfg['enabled']:
+        return None
+    if _mirror is None:
+        with _mirror_lock:
+            if _mirror is None:
+                _mirror = FirestoreMirror(
+                    import_string(cfg['client']), cfg['collection'],
+                    cfg['interval_s'], cfg['retries'], cfg['backoff_s'])
+                atexit.register(shutdown)
+    return _mirror
+
+
+def offer(driver, latitude, longitude, speed, timestamp):
+    """Queue the driver's latest fix for the next flush (no-op when disabled)"""
+    mirror = get_mirror()
+    if mirror is not None:
+        mirror.offer(driver.firebase_uid, location_doc(
+            driver.firebase_uid, latitude, longitude, speed, timestamp))
+
+
+def set_active(firebase_uid, active, timestamp):
+    """Queue an isActive change from presence (no-op when disabled)"""
+    mirror = get_mirror()
+    if mirror is not None:
+        mirror.offer(firebase_uid, activity_doc(firebase_uid, active, timestamp))
+
+
+def shutdown():
+    global _mirror
+    with _mirror_lock:
+        mirror, _mirror = _mirror, None
+    if mirror is not None:
+        mirror.close()
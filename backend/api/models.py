@@ -2,6 +2,7 @@
 
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 # ============================================
 # USER MODELS
@@ -82,7 +83,7 @@ class BusLocation(models.Model):
     latitude = models.DecimalField(max_digits=9, decimal_places=6)
     longitude = models.DecimalField(max_digits=9, decimal_places=6)
     speed = models.FloatField(default=0.0, help_text="Speed in km/h")
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now, help_text="Fix time (device time for batched uploads)")
 
     def __str__(self):
         return f"Bus {self.bus.bus_number} at ({self.latitude}, {self.longitude})"
@@ -140,10 +141,88 @@ class Trip(models.Model):
     end_time = models.DateTimeField(null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='scheduled')
     passenger_count = models.IntegerField(default=0)
+    timetable = models.ForeignKey(
+        'Timetable', on_delete=models.SET_NULL, null=True, blank=True, related_name='trips',
+        help_text="Set on trips generated from a timetable (api/timetables.py)")
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"Trip #{self.id} - {self.bus.bus_number} on {self.route.name}"
 
     class Meta:
-        ordering = ['-scheduled_time']
\ No newline at end of file
+        ordering = ['-scheduled_time']
+        constraints = [
+            # Makes timetable generation idempotent
+            models.UniqueConstraint(fields=['timetable', 'scheduled_time'], name='unique_timetable_departure'),
+        ]
+
+
+# ============================================
+# TIMETABLES
+# ============================================
+
+class Timetable(models.Model):
+    """One time band of a route's recurring schedule: a departure every headway_minutes"""
+    route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name='timetables')
+    bus = models.ForeignKey(Bus, on_delete=models.CASCADE, related_name='timetables')
+    driver = models.ForeignKey(Driver, on_delete=models.CASCADE, related_name='timetables')
+    weekdays = models.CharField(max_length=7, default='01234', help_text="Days it runs, Monday=0 ... Sunday=6")
+    start_time = models.TimeField(help_text="First departure of the band")
+    end_time = models.TimeField(help_text="No departures at or after this time")
+    headway_minutes = models.PositiveIntegerField()
+    valid_from = models.DateField(null=True, blank=True)
+    valid_until = models.DateField(null=True, blank=True, help_text="Last day it runs")
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.route.name} {self.start_time:%H:%M}-{self.end_time:%H:%M} every {self.headway_minutes} min"
+
+# ============================================
+# ANALYTICS
+# ============================================
+
+class TripStats(models.Model):
+    """KPIs of one completed trip, computed once by api/analytics.py"""
+    trip = models.OneToOneField(Trip, on_delete=models.CASCADE, related_name='stats')
+    on_time = models.BooleanField()
+    delay_seconds = models.FloatField(help_text="Actual start minus scheduled time")
+    passengers = models.IntegerField()
+    seats = models.IntegerField(help_text="Bus capacity at completion")
+    distance_m = models.FloatField()
+    moving_seconds = models.FloatField()
+    idle_seconds = models.FloatField()
+    fixes = models.IntegerField()
+    computed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Stats for trip #{self.trip_id}"
+
+
+class KPIRollup(models.Model):
+    """Running totals over completed trips, per route or per bus"""
+    SCOPE_CHOICES = [
+        ('route', 'Route'),
+        ('bus', 'Bus'),
+    ]
+
+    scope = models.CharField(max_length=10, choices=SCOPE_CHOICES)
+    object_id = models.IntegerField()
+    label = models.CharField(max_length=100)
+    trips = models.IntegerField(default=0)
+    on_time_trips = models.IntegerField(default=0)
+    delay_seconds = models.FloatField(default=0.0)
+    passengers = models.IntegerField(default=0)
+    seats = models.IntegerField(default=0)
+    distance_m = models.FloatField(default=0.0)
+    moving_seconds = models.FloatField(default=0.0)
+    idle_seconds = models.FloatField(default=0.0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.scope} {self.label}: {self.trips} trips"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'object_id'], name='unique_kpi_rollup'),
+        ]
@@ -0,0 +1,22 @@
+# api/parsers.py
+
+import time
+
+from rest_framework import exceptions
+from rest_framework.parsers import BaseParser
+
+from . import wire
+
+
+class FixBatchParser(BaseParser):
+    """
+    Parses the compact binary location format (see api/wire.py) into a FixBatch,
+    refusing fixes timed too far from server time
+    """
+    media_type = wire.MEDIA_TYPE
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return wire.decode(stream.read(), now_ms=int(time.time() * 1000))
+        except ValueError as exc:
+            raise exceptions.ParseError(f'Invalid location batch: {exc}')
@@ -0,0 +1,166 @@
+# api/pingrate.py
+
+"""
+Server-chosen driver ping intervals.
+
+update_driver_location answers every fix with `next_ping_ms`, the delay the
+driver app should wait before sending the next one:
+
+    parked (speed < MOVING_KMH)   idle_s
+    moving                        time to cover moving_distance_m, so the map
+                                  gets a fix roughly every N metres
+    near a stop                   min_s, so arrivals are sharp
+    nobody polling the fleet      x unwatched_factor
+    ingest above capacity         stretched by load / capacity
+
+and the result is clamped to [min_s, max_s]. Stops only count when
+Route.stops entries carry coordinates ({'name', 'lat', 'lng'}); plain stop
+names are skipped. The route is the bus's in-progress Trip, cached per bus.
+"""
+
+import functools
+import math
+import threading
+import time
+
+from django.conf import settings
+
+from . import ingest, metrics
+from .models import Trip
+from .stops import stop_coordinates
+
+NEXT_PING = metrics.registry.histogram(
+    'campushub_next_ping_seconds', 'Ping interval handed to drivers',
+    buckets=(2, 5, 10, 15, 30, 60, 120))
+INGEST_FIXES_PER_SECOND = metrics.registry.gauge(
+    'campushub_ingest_fixes_per_second', 'Smoothed location fixes per second')
+
+DEFAULTS = {
+    'min_s': 2,
+    'max_s': 60,
+    'idle_s': 30,
+    'moving_distance_m': 100,
+    'near_stop_m': 300,
+    'unwatched_factor': 2,
+    'ingest_capacity_per_s': 200,
+    'interest_window_s': 60,
+    'route_cache_s': 60,
+}
+MOVING_KMH = 2.0
+EARTH_RADIUS_M = 6_371_000
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'ADAPTIVE_PING', {})}
+
+
+# ============================================
+# FLEET INTEREST
+# ============================================
+
+_last_interest = 0.0
+
+
+def note_interest():
+    """Somebody looked at the fleet map"""
+    global _last_interest
+    _last_interest = time.monotonic()
+
+
+def is_watched(window_s):
+    return time.monotonic() - _last_interest < window_s
+
+
+def tracks_fleet_interest(view):
+    """
+    Decorator for fleet read views; put it above versioned_response so
+    conditional (304) polls count as interest too.
+    """
+    @functools.wraps(view)
+    def wrapped(request, *args, **kwargs):
+        note_interest()
+        return view(request, *args, **kwargs)
+    return wrapped
+
+
+# ============================================
+# STOPS
+# ============================================
+
+_stops_cache = {}
+_stops_lock = threading.Lock()
+
+
+def _stop_points(stops):
+    points = (stop_coordinates(stop) for stop in stops or ())
+    return [point for point in points if point is not None]
+
+
+def route_stops(bus_id, ttl):
+    """(lat, lng) stops of the bus's in-progress trip, cached for `ttl` seconds"""
+    now = time.monotonic()
+    cached = _stops_cache.get(bus_id)
+    if cached and cached[0] > now:
+        return cached[1]
+    stops = (
+        Trip.objects.filter(bus_id=bus_id, status='in_progress')
+        .order_by('-start_time')
+        .values_list('route__stops', flat=True)
+        .first()
+    )
+    points = _stop_points(stops)
+    with _stops_lock:
+        _stops_cache[bus_id] = (now + ttl, points)
+    return points
+
+
+def distance_m(lat1, lng1, lat2, lng2):
+    """Equirectangular approximation, plenty for a campus-sized area"""
+    x = math.radians(lng2 - lng1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return EARTH_RADIUS_M * math.hypot(x, y)
+
+
+# ============================================
+# POLICY
+# ============================================
+
+def next_interval(speed_kmh, stop_distance_m=None, watched=True, ingest_rate=0.0, cfg=None):
+    """Seconds until the next ping (pure function of its inputs)"""
+    cfg = cfg or config()
+    if speed_kmh < MOVING_KMH:
+        interval = cfg['idle_s']
+    elif stop_distance_m is not None and stop_distance_m <= cfg['near_stop_m']:
+        interval = cfg['min_s']
+    else:
+        interval = cfg['moving_distance_m'] / (speed_kmh / 3.6)
+
+    if not watched:
+        interval *= cfg['unwatched_factor']
+    capacity = cfg['ingest_capacity_per_s']
+    if capacity and ingest_rate > capacity:
+        interval *= ingest_rate / capacity
+    return min(cfg['max_s'], max(cfg['min_s'], interval))
+
+
+def next_ping_ms(bus, latitude, longitude, speed):
+    """Interval for `bus` after a fix at (latitude, longitude, speed km/h)"""
+    cfg = config()
+    try:
+        speed = float(speed or 0)
+    except (TypeError, ValueError):
+        speed = 0.0
+
+    stop_distance = None
+    if bus is not None and speed >= MOVING_KMH:
+        lat, lng = float(latitude), float(longitude)
+        stops = route_stops(bus.pk, cfg['route_cache_s'])
+        if stops:
+            stop_distance = min(distance_m(lat, lng, s_lat, s_lng) for s_lat, s_lng in stops)
+
+    rate = ingest.INGEST_RATE.rate()
+    INGEST_FIXES_PER_SECOND.set(value=rate)
+    seconds = next_interval(
+        speed, stop_distance, is_watched(cfg['interest_window_s']), rate, cfg)
+    NEXT_PING.observe(seconds)
+    return int(seconds * 1000)
@@ -0,0 +1,332 @@
+# api/planner.py
+
+"""
+Journey planning over the route/stop network, with transfers.
+
+Each active Route becomes a pattern: its stops (normalized the same way as
+the stop catalog, so "Main Gate" on two routes is one transfer point) and
+each stop's offset from departure, taken from an 'offset_min' key on
+{'name', ...} stop entries or else spread evenly over estimated_duration.
+Departures are the scheduled and in-progress Trips of that route from
+PAST_S ago to well past AHEAD_S ahead; plan() refuses departure times
+outside that window (depart_window()) rather than answer with nothing.
+
+Queries run a RAPTOR scan (round k = journeys with k boardings): each round
+walks every route touched by a stop improved in the previous round, boards
+the earliest catchable trip by binary search over its departures and
+relaxes arrival times downstream. Beyond that search the cost does not
+grow with the number of trips, so a query takes a few milliseconds even
+on a 200-route network (see benchmarks/bench_planner.py).
+
+The network is cached per process. A route change (the 'routes' cache
+version) recompiles only routes whose stops or duration changed. Each trip save
+records its id under the 'trips' version it bumped (note_trip_change), so
+the planner re-reads just those trips; departures are reloaded in full only
+when that log has a gap or the loaded window runs low.
+"""
+
+import bisect
+import copy
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from backend_project.db_routing import use_primary
+
+from . import caching
+from .models import Route, Trip
+from .stops import normalize
+
+INF = float('inf')
+# ?depart may be this far in the past or the future
+PAST_S = 3600
+AHEAD_S = 12 * 3600
+# Departures stay loaded for at least HORIZON_S / 2 after the latest allowed departure
+HORIZON_S = 12 * 3600
+PLANNED_STATUSES = ('scheduled', 'in_progress')
+# Trip saves remembered per TRIPS version; a gap longer than this reloads everything
+CHANGE_LOG_TTL = 3600
+MAX_CHANGES = 500
+CHANGE_PREFIX = 'planner:trip:'
+
+
+def transfer_seconds():
+    return getattr(settings, 'PLANNER_TRANSFER_S', 120)
+
+
+class Pattern:
+    """One route's stop sequence, offsets and sorted departures"""
+    __slots__ = ('route_id', 'name', 'stops', 'names', 'offsets', 'departures', 'trip_ids', 'signature')
+
+    def __init__(self, route_id, name, stop_names, offsets, signature=None):
+        self.route_id = route_id
+        self.name = name
+        self.names = list(stop_names)
+        self.stops = [normalize(n) for n in stop_names]
+        self.offsets = list(offsets)
+        self.departures = []
+        self.trip_ids = []
+        self.signature = signature
+
+    def with_departures(self, departures):
+        """A copy with `departures`: iterable of (epoch seconds at first stop, trip id)"""
+        pattern = copy.copy(self)
+        ordered = sorted(departures)
+        pattern.departures = [d for d, _ in ordered]
+        pattern.trip_ids = [t for _, t in ordered]
+        return pattern
+
+
+# ============================================
+# TRIP CHANGE LOG
+# ============================================
+
+def note_trip_change(version, trip_id):
+    """Record that TRIPS `version` came from saving or deleting `trip_id`"""
+    cache.set(f'{CHANGE_PREFIX}{version}', trip_id, timeout=CHANGE_LOG_TTL)
+
+
+def changed_trips(old_version, new_version):
+    """Trip ids behind the bumps old_version -> new_version; None when any is unknown"""
+    if old_version is None or not 0 < new_version - old_version <= MAX_CHANGES:
+        return None
+    keys = [f'{CHANGE_PREFIX}{v}' for v in range(old_version + 1, new_version + 1)]
+    found = cache.get_many(keys)
+    if len(found) != len(keys):
+        return None
+    return set(found.values())
+
+
+def compile_route(route_id, name, stops, estimated_duration):
+    names, offsets = [], []
+    explicit = True
+    for entry in stops or ():
+        if isinstance(entry, dict):
+            names.append(str(entry.get('name', '')))
+            offsets.append(entry.get('offset_min'))
+        else:
+            names.append(str(entry))
+            offsets.append(None)
+        explicit = explicit and offsets[-1] is not None
+    if not explicit:
+        step = (estimated_duration or 0) * 60 / max(len(names) - 1, 1)
+        offsets = [i * step for i in range(len(names))]
+    else:
+        offsets = [float(o) * 60 for o in offsets]
+    return Pattern(route_id, name, names, offsets, signature=(tuple(names), tuple(offsets)))
+
+
+class Network:
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        # stop key -> [(pattern index, position)], a stop may repeat on loops
+        self.serving = {}
+        self.display = {}
+        for r, pattern in enumerate(self.patterns):
+            for i, (key, name) in enumerate(zip(pattern.stops, pattern.names)):
+                if key:
+                    self.serving.setdefault(key, []).append((r, i))
+                    self.display.setdefault(key, name)
+
+    def plan(self, source, destination, depart_at, max_transfers=2, transfer_s=None):
+        """
+        Pareto-optimal journeys (fewest boardings for each earlier arrival)
+        from `source` to `destination` leaving at or after `depart_at`
+        (epoch seconds). Each journey is a list of legs.
+        """
+        src, dst = normalize(source), normalize(destination)
+        if src not in self.serving or dst not in self.serving or src == dst:
+            return []
+        transfer_s = transfer_seconds() if transfer_s is None else transfer_s
+
+        best = {src: depart_at}
+        previous = {src: depart_at}
+        rounds = []
+        marked = {src}
+        for k in range(max_transfers + 1):
+            queue = {}
+            for stop in marked:
+                for r, i in self.serving.get(stop, ()):
+                    if i < queue.get(r, INF):
+                        queue[r] = i
+            current, parents, marked = {}, {}, set()
+            for r, first in queue.items():
+                pattern = self.patterns[r]
+                departures, offsets, stops = pattern.departures, pattern.offsets, pattern.stops
+                trip = board = None
+                for i in range(first, len(stops)):
+                    stop = stops[i]
+                    if trip is not None:
+                        arrival = departures[trip] + offsets[i]
+                        if arrival < best.get(stop, INF) and arrival < best.get(dst, INF):
+                            best[stop] = current[stop] = arrival
+                            parents[stop] = (r, trip, board, i)
+                            marked.add(stop)
+                    ready = previous.get(stop)
+                    if ready is None:
+                        continue
+                    if k:
+                        ready += transfer_s
+                    if trip is None or ready <= departures[trip] + offsets[i]:
+                        j = bisect.bisect_left(departures, ready - offsets[i])
+                        if j < len(departures) and (trip is None or j < trip):
+                            trip, board = j, i
+            rounds.append(parents)
+            if not marked:
+                break
+            previous = current
+
+        journeys = []
+        arrived = INF
+        for k, parents in enumerate(rounds):
+            if dst in parents:
+                legs = self._legs(rounds, k, dst)
+                if legs[-1]['arrive'] < arrived:
+                    arrived = legs[-1]['arrive']
+                    journeys.append(legs)
+        return journeys
+
+    def _legs(self, rounds, k, stop):
+        legs = []
+        while k >= 0 and stop in rounds[k]:
+            r, trip, board, alight = rounds[k][stop]
+            pattern = self.patterns[r]
+            start = pattern.departures[trip]
+            legs.append({
+                'route_id': pattern.route_id,
+                'route': pattern.name,
+                'trip_id': pattern.trip_ids[trip],
+                'board': pattern.names[board],
+                'depart': start + pattern.offsets[board],
+                'alight': pattern.names[alight],
+                'arrive': start + pattern.offsets[alight],
+            })
+            stop = pattern.stops[board]
+            k -= 1
+        legs.reverse()
+        return legs
+
+
+# ============================================
+# DATABASE-BACKED NETWORK
+# ============================================
+
+class Planner:
+    """Keeps a Network in step with Route and Trip changes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._patterns = {}
+        self._network = None
+        self._routes_version = None
+        self._trips_version = None
+        self._loaded_from = 0
+        self._loaded_until = 0
+        # trip id -> route id for every loaded departure
+        self._trip_routes = {}
+
+    def network(self):
+        routes_version = caching.get_version(caching.ROUTES)
+        trips_version = caching.get_version(caching.TRIPS)
+        now = time.time()
+        if (self._network is not None and routes_version == self._routes_version
+                and trips_version == self._trips_version and now + AHEAD_S + HORIZON_S / 2 < self._loaded_until):
+            return self._network
+        # Kept under these versions until the next bump, so never from a lagging replica
+        with self._lock, use_primary():
+            if routes_version != self._routes_version or self._network is None:
+                self._recompile_routes()
+                self._load_departures(now)
+            elif now + AHEAD_S + HORIZON_S / 2 >= self._loaded_until:
+                self._load_departures(now)
+            elif trips_version != self._trips_version:
+                changed = changed_trips(self._trips_version, trips_version)
+                if changed is None:
+                    self._load_departures(now)
+                else:
+                    self._apply_trip_changes(changed)
+            self._network = Network(self._patterns.values())
+            self._routes_version, self._trips_version = routes_version, trips_version
+        return self._network
+
+    def _recompile_routes(self):
+        patterns = {}
+        rows = Route.objects.filter(is_active=True).values_list('pk', 'name', 'stops', 'estimated_duration')
+        for route_id, name, stops, duration in rows:
+            compiled = compile_route(route_id, name, stops, duration)
+            existing = self._patterns.get(route_id)
+            if existing is not None and existing.signature == compiled.signature and existing.name == name:
+                compiled = existing
+            patterns[route_id] = compiled
+        self._patterns = patterns
+
+    def _load_departures(self, now):
+        # Trips already under way at the earliest allowed departure still serve their later stops
+        longest = max((p.offsets[-1] for p in self._patterns.values() if p.offsets), default=0)
+        loaded_from, until = now - PAST_S - longest, now + AHEAD_S + HORIZON_S
+        per_route = {route_id: [] for route_id in self._patterns}
+        trip_routes = {}
+        trips = Trip.objects.filter(
+            route_id__in=list(self._patterns),
+            status__in=PLANNED_STATUSES,
+            scheduled_time__gte=datetime.fromtimestamp(loaded_from, tz=dt_timezone.utc),
+            scheduled_time__lt=datetime.fromtimestamp(until, tz=dt_timezone.utc),
+        ).values_list('route_id', 'scheduled_time', 'pk')
+        for route_id, scheduled, trip_id in trips.iterator(chunk_size=5000):
+            per_route[route_id].append((scheduled.timestamp(), trip_id))
+            trip_routes[trip_id] = route_id
+        # New Pattern objects, so a query still running on the old Network sees consistent lists
+        self._patterns = {
+            route_id: self._patterns[route_id].with_departures(departures)
+            for route_id, departures in per_route.items()
+        }
+        self._trip_routes = trip_routes
+        self._loaded_from, self._loaded_until = loaded_from, until
+
+    def _apply_trip_changes(self, trip_ids):
+        """Re-read only the trips saved or deleted since the last load"""
+        touched = {self._trip_routes.pop(trip_id) for trip_id in trip_ids if trip_id in self._trip_routes}
+        removed = set(trip_ids)
+        current = {}
+        rows = Trip.objects.filter(pk__in=trip_ids, status__in=PLANNED_STATUSES).values_list(
+            'pk', 'route_id', 'scheduled_time')
+        for trip_id, route_id, scheduled in rows:
+            departure = scheduled.timestamp()
+            if route_id in self._patterns and self._loaded_from <= departure < self._loaded_until:
+                current.setdefault(route_id, []).append((departure, trip_id))
+                self._trip_routes[trip_id] = route_id
+                touched.add(route_id)
+        for route_id in touched:
+            pattern = self._patterns[route_id]
+            kept = [(d, t) for d, t in zip(pattern.departures, pattern.trip_ids) if t not in removed]
+            self._patterns[route_id] = pattern.with_departures(kept + current.get(route_id, []))
+
+
+_planner = Planner()
+
+
+def depart_window(now=None):
+    """Earliest and latest departure plan() accepts, as aware datetimes"""
+    now = now or timezone.now()
+    return now - timedelta(seconds=PAST_S), now + timedelta(seconds=AHEAD_S)
+
+
+def plan(source, destination, depart_at=None, max_transfers=2):
+    """
+    Journeys as lists of legs with aware datetimes. ValueError when
+    depart_at is outside depart_window(), where departures are not loaded.
+    """
+    depart_at = depart_at or timezone.now()
+    earliest, latest = depart_window()
+    if not earliest <= depart_at <= latest:
+        raise ValueError(f'depart must be between {earliest:%Y-%m-%d %H:%M} and {latest:%Y-%m-%d %H:%M} UTC')
+    journeys = _planner.network().plan(source, destination, depart_at.timestamp(), max_transfers)
+    for legs in journeys:
+        for leg in legs:
+            leg['depart'] = datetime.fromtimestamp(leg['depart'], tz=dt_timezone.utc)
+            leg['arrive'] = datetime.fromtimestamp(leg['arrive'], tz=dt_timezone.utc)
+    return journeys
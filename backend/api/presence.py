@@ -0,0 +1,193 @@
+# api/presence.py
+
+"""
+Driver presence from location heartbeats.
+
+Every fix is a heartbeat. A driver is
+
+    online      heard from within stale_s
+    stale       silent for stale_s (the app may be backgrounded)
+    offline     silent for offline_s (the app is gone)
+
+Timeouts live in a hashed timer wheel (TimerWheel): a heartbeat drops one
+entry into the slot for its deadline, and advancing the clock empties the
+slots it passes, so both are O(1) amortized however many drivers there are.
+Rather than cancel the old entry, a heartbeat bumps the driver's generation;
+an entry whose generation is out of date is skipped when its slot fires.
+The wheel advances on heartbeats and on every fleet read, conditional (304)
+polls included (ticks_on_read), so no thread is needed.
+
+Going stale or offline bumps the fleet ETag (the fleet map drops the bus
+without waiting for a write), and going offline marks the Driver
+unavailable (and inactive in the Firestore mirror, api/mirror.py); their
+next heartbeat marks them available again. The offline update is
+conditional on last_location_update, so a worker that stopped hearing a
+driver only because their pings moved to another worker changes nothing,
+and only drivers switched off this way are switched back on.
+
+Fleet reads classify each bus by the age of its latest fix with the same
+thresholds (classify()), which gives every worker the same answer.
+"""
+
+import functools
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import caching, jobs, metrics
+
+ONLINE = 'online'
+STALE = 'stale'
+OFFLINE = 'offline'
+STATES = (ONLINE, STALE, OFFLINE)
+
+TRANSITIONS = metrics.registry.counter(
+    'campushub_presence_transitions_total', 'Driver presence changes', labels=('state',))
+TRACKED = metrics.registry.gauge('campushub_presence_tracked', 'Drivers with a pending presence timeout')
+
+DEFAULTS = {
+    # Above ADAPTIVE_PING max_s, so a parked driver on a slow ping stays online
+    'stale_s': 120,
+    'offline_s': 600,
+    'tick_s': 1.0,
+}
+
+# Cache key marking a driver whose availability presence switched off
+OFFLINE_KEY = 'presence:offline:'
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'PRESENCE', {})}
+
+
+def classify(age_s, cfg=None):
+    """Presence state for a fix `age_s` seconds old"""
+    cfg = cfg or config()
+    if age_s < cfg['stale_s']:
+        return ONLINE
+    if age_s < cfg['offline_s']:
+        return STALE
+    return OFFLINE
+
+
+class TimerWheel:
+    """Hashed timing wheel for delays up to `horizon_s`"""
+
+    def __init__(self, tick_s, horizon_s, now):
+        self.tick_s = tick_s
+        self.size = int(math.ceil(horizon_s / tick_s)) + 2
+        self.slots = [[] for _ in range(self.size)]
+        self.current = int(now / tick_s)
+
+    def schedule(self, delay_s, item):
+        ticks = min(max(int(math.ceil(delay_s / self.tick_s)), 1), self.size - 1)
+        self.slots[(self.current + ticks) % self.size].append(item)
+
+    def advance(self, now):
+        """Items whose deadline has passed, in deadline order"""
+        target = int(now / self.tick_s)
+        expired = []
+        # After a long quiet spell every slot is due; visit each once
+        steps = min(target - self.current, self.size)
+        for step in range(1, steps + 1):
+            slot = self.slots[(self.current + step) % self.size]
+            if slot:
+                expired.extend(slot)
+                slot.clear()
+        self.current = max(self.current, target)
+        return expired
+
+
+class PresenceTracker:
+    def __init__(self, cfg=None, clock=time.monotonic):
+        self.cfg = cfg or config()
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._wheel = TimerWheel(self.cfg['tick_s'], max(self.cfg['stale_s'], self.cfg['offline_s']), clock())
+        # driver id -> [generation, state]
+        self._drivers = {}
+
+    def heartbeat(self, driver_id):
+        with self._lock:
+            expired = self._wheel.advance(self._clock())
+            entry = self._drivers.get(driver_id)
+            returning = entry is None
+            generation = entry[0] + 1 if entry else 0
+            self._drivers[driver_id] = [generation, ONLINE]
+            self._wheel.schedule(self.cfg['stale_s'], (driver_id, generation, STALE))
+            changes = self._expire(expired)
+        if returning:
+            changes.append((driver_id, ONLINE))
+        self._apply(changes)
+
+    def tick(self):
+        """Fire due timeouts; called on fleet reads so they happen without heartbeats"""
+        with self._lock:
+            changes = self._expire(self._wheel.advance(self._clock()))
+        self._apply(changes)
+
+    def _expire(self, expired):
+        changes = []
+        for driver_id, generation, state in expired:
+            entry = self._drivers.get(driver_id)
+            if entry is None or entry[0] != generation:
+                continue
+            entry[1] = state
+            if state == STALE:
+                self._wheel.schedule(self.cfg['offline_s'] - self.cfg['stale_s'], (driver_id, generation, OFFLINE))
+            else:
+                del self._drivers[driver_id]
+            changes.append((driver_id, state))
+        TRACKED.set(value=len(self._drivers))
+        return changes
+
+    def _apply(self, changes):
+        if not changes:
+            return
+        for driver_id, state in changes:
+            TRANSITIONS.inc(state)
+            if state == OFFLINE:
+                jobs.defer('presence.offline', driver_id, self.cfg['offline_s'])
+            elif state == ONLINE:
+                if cache.get(f'{OFFLINE_KEY}{driver_id}'):
+                    jobs.defer('presence.online', driver_id)
+        if any(state != ONLINE for _, state in changes):
+            caching.bump_version(caching.FLEET)
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_tracker():
+    global _tracker
+    if _tracker is None:
+        with _tracker_lock:
+            if _tracker is None:
+                _tracker = PresenceTracker()
+    return _tracker
+
+
+def heartbeat(driver_id):
+    get_tracker().heartbeat(driver_id)
+
+
+def tick():
+    get_tracker().tick()
+
+
+def ticks_on_read(view):
+    """
+    Decorator for fleet read views; put it above versioned_response (or
+    snapshots.published) so timeouts fire before the ETag is checked. A
+    quiet fleet is polled almost only with If-None-Match, and a tick that
+    ran inside the view would never run.
+    """
+    @functools.wraps(view)
+    def wrapped(request, *args, **kwargs):
+        tick()
+        return view(request, *args, **kwargs)
+    return wrapped
@@ -0,0 +1,188 @@
+# api/profiling.py
+
+"""
+On-demand sampling profiler for a running worker.
+
+A Sampler thread wakes every `interval_s`, reads every thread's current
+frame (sys._current_frames()) and counts the stack it finds. Nothing is
+traced between samples, so the cost is one stack walk per thread per tick
+and none at all when no profile is running. Stacks come out in the
+collapsed format ("root;caller;leaf count" per line) that flamegraph.pl,
+speedscope and inferno read directly.
+
+Two ways in:
+
+    GET /api/admin/profile/?seconds=5      every thread of the worker that
+                                           answers it, for N seconds
+    X-Profile: <PROFILING token> header    just the thread serving that
+                                           request (ProfileMiddleware); the
+                                           response gets X-Profile-Id, and
+                                           GET /api/admin/profile/<id>/
+                                           returns the stacks
+
+A thread only gets the GIL back when the running one lets go, every
+sys.getswitchinterval() (5 ms) at most, so while a profile runs the switch
+interval is lowered to the sampling interval and restored afterwards.
+"""
+
+import os
+import sys
+import threading
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metrics
+
+SAMPLES = metrics.registry.counter('campushub_profiler_samples_total', 'Stack samples taken', labels=('mode',))
+
+DEFAULTS = {
+    # Value the X-Profile header must carry; empty disables per-request profiling
+    'token': '',
+    'max_seconds': 60,
+    'interval_ms': 10,
+    'request_interval_ms': 1,
+    'keep_s': 600,
+}
+
+CACHE_PREFIX = 'profile:'
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'PROFILING', {})}
+
+
+_roots = tuple(sorted({os.path.dirname(os.path.dirname(os.path.abspath(__file__)))} | set(sys.path), key=len, reverse=True))
+
+
+def _label(code):
+    """'api/views.py:get_all_bus_locations', paths relative to the project or sys.path"""
+    filename = code.co_filename
+    for root in _roots:
+        if root and filename.startswith(root + os.sep):
+            filename = filename[len(root) + 1:]
+            break
+    return f"{filename}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+# ============================================
+# SAMPLER
+# ============================================
+
+_switch_lock = threading.Lock()
+_switch_users = 0
+_switch_saved = None
+
+
+def _lower_switch_interval(interval_s):
+    global _switch_users, _switch_saved
+    with _switch_lock:
+        if _switch_users == 0:
+            _switch_saved = sys.getswitchinterval()
+        _switch_users += 1
+        sys.setswitchinterval(min(sys.getswitchinterval(), max(interval_s / 2, 0.0005)))
+
+
+def _restore_switch_interval():
+    global _switch_users
+    with _switch_lock:
+        _switch_users -= 1
+        if _switch_users == 0:
+            sys.setswitchinterval(_switch_saved)
+
+
+class Sampler:
+    def __init__(self, interval_s, only=None, exclude=(), mode='worker'):
+        """only: thread ids to sample (default all); exclude: thread ids to skip"""
+        self.interval_s = interval_s
+        self.only = only
+        self.exclude = set(exclude)
+        self.mode = mode
+        self.counts = Counter()
+        self.samples = 0
+        self._labels = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        _lower_switch_interval(self.interval_s)
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        _restore_switch_interval()
+        SAMPLES.inc(self.mode, amount=self.samples)
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _run(self):
+        own = threading.get_ident()
+        labels = self._labels
+        while not self._stop.wait(self.interval_s):
+            for ident, frame in sys._current_frames().items():
+                if ident == own or ident in self.exclude or (self.only is not None and ident not in self.only):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = _label(code)
+                    stack.append(label)
+                    frame = frame.f_back
+                stack.reverse()
+                self.counts[';'.join(stack)] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.counts.most_common())
+
+    def as_dict(self):
+        return {
+            'samples': self.samples,
+            'interval_ms': self.interval_s * 1000,
+            'stacks': [{'stack': stack.split(';'), 'count': count} for stack, count in self.counts.most_common()],
+        }
+
+
+# ============================================
+# WORKER AND REQUEST PROFILES
+# ============================================
+
+_worker_lock = threading.Lock()
+
+
+def profile_worker(seconds, interval_s):
+    """
+    Sample every other thread for `seconds`; None when a worker profile is
+    already running in this process.
+    """
+    if not _worker_lock.acquire(blocking=False):
+        return None
+    try:
+        with Sampler(interval_s, exclude={threading.get_ident()}) as sampler:
+            threading.Event().wait(seconds)
+        return sampler
+    finally:
+        _worker_lock.release()
+
+
+def save_request_profile(sampler):
+    """Keep a request's collapsed stacks for PROFILING keep_s; returns its id"""
+    profile_id = uuid.uuid4().hex
+    cache.set(f'{CACHE_PREFIX}{profile_id}', sampler.collapsed(), timeout=config()['keep_s'])
+    return profile_id
+
+
+def load_request_profile(profile_id):
+    return cache.get(f'{CACHE_PREFIX}{profile_id}')
@@ -0,0 +1,183 @@
+# api/ratelimit.py
+
+"""
+Token-bucket rate limiting for the public/high-volume endpoints.
+
+Each endpoint belongs to a bucket class (settings.RATE_LIMIT_VIEWS); each class
+has a refill rate and burst size (settings.RATE_LIMITS). Limits apply twice:
+
+    RateLimitMiddleware   before the view, per IP address. Requests carrying a
+                          bearer token share a separate per-IP bucket scaled by
+                          RATE_LIMIT_SHARED_IP_FACTOR, since many signed-in
+                          users can sit behind one campus NAT address.
+    VerifiedUserThrottle  inside DRF once authentication has verified the
+                          token, per user (Firebase uid).
+
+Nothing is keyed on an unverified token, so made-up tokens neither get fresh
+buckets nor drain another user's.
+
+The default backend keeps buckets in process memory behind striped locks, so
+concurrent requests for different clients rarely contend. The 'cache' backend
+shares counters between workers through the Django cache as fixed windows of
+`burst` tokens, an approximation of the same limit.
+"""
+
+import math
+import threading
+import time
+import zlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from rest_framework.throttling import BaseThrottle
+
+from . import metrics
+
+LIMITED = metrics.registry.counter(
+    'campushub_rate_limited_total', 'Requests rejected with 429 by bucket class', labels=('bucket',))
+
+STRIPES = 64
+# Buckets idle long enough to have refilled completely are pruned past this size
+MAX_BUCKETS = 100_000
+
+
+class LocalBackend:
+    """In-process token buckets with striped locks"""
+
+    def __init__(self, stripes=STRIPES):
+        self._stripes = [(threading.Lock(), {}) for _ in range(stripes)]
+
+    def consume(self, key, rate, burst, now=None):
+        """Take one token; returns 0 on success or seconds until one is available"""
+        now = time.monotonic() if now is None else now
+        lock, buckets = self._stripes[zlib.crc32(key.encode()) % len(self._stripes)]
+        with lock:
+            state = buckets.get(key)
+            if state is None:
+                if len(buckets) * len(self._stripes) > MAX_BUCKETS:
+                    self._prune(buckets, now)
+                # tokens, last refill, seconds until full again
+                buckets[key] = [burst - 1.0, now, burst / rate]
+                return 0.0
+            tokens = min(burst, state[0] + (now - state[1]) * rate)
+            state[1] = now
+            if tokens >= 1.0:
+                state[0] = tokens - 1.0
+                return 0.0
+            state[0] = tokens
+            return (1.0 - tokens) / rate
+
+    @staticmethod
+    def _prune(buckets, now):
+        for key in [k for k, (_, last, full_after) in buckets.items() if now - last > full_after]:
+            del buckets[key]
+
+
+class CacheBackend:
+    """Fixed-window counters in the shared Django cache"""
+
+    def consume(self, key, rate, burst, now=None):
+        now = time.time() if now is None else now
+        window = max(1, math.ceil(burst / rate))
+        slot = int(now // window)
+        cache_key = f'rl:{key}:{slot}'
+        if cache.add(cache_key, 1, timeout=window + 1):
+            return 0.0
+        try:
+            count = cache.incr(cache_key)
+        except ValueError:
+            cache.set(cache_key, 1, timeout=window + 1)
+            return 0.0
+        if count <= burst:
+            return 0.0
+        return (slot + 1) * window - now
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                kind = getattr(settings, 'RATE_LIMIT_BACKEND', 'local')
+                _backend = CacheBackend() if kind == 'cache' else LocalBackend()
+    return _backend
+
+
+# ============================================
+# CLIENT IDENTITY
+# ============================================
+
+def client_ip(request):
+    if getattr(settings, 'RATE_LIMIT_TRUST_FORWARDED', False):
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def view_bucket(request):
+    match = request.resolver_match
+    return settings.RATE_LIMIT_VIEWS.get(match.url_name) if match else None
+
+
+def _limited(bucket, wait):
+    LIMITED.inc(bucket)
+    response = JsonResponse({'error': 'Too many requests'}, status=429)
+    response['Retry-After'] = str(max(1, math.ceil(wait)))
+    return response
+
+
+class RateLimitMiddleware:
+    """
+    Answers 429 from process_view, i.e. after URL resolution but before the
+    view (and so before authentication or any ORM work) runs.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not getattr(settings, 'RATE_LIMIT_ENABLED', True):
+            return None
+        bucket = view_bucket(request)
+        if bucket is None:
+            return None
+        rate, burst = settings.RATE_LIMITS[bucket]
+
+        key = f'{bucket}:ip:{client_ip(request)}'
+        if request.META.get('HTTP_AUTHORIZATION', '').startswith('Bearer '):
+            factor = getattr(settings, 'RATE_LIMIT_SHARED_IP_FACTOR', 10)
+            key, rate, burst = f'{bucket}:ipauth:{client_ip(request)}', rate * factor, burst * factor
+        wait = get_backend().consume(key, rate, burst)
+        return _limited(bucket, wait) if wait else None
+
+
+class VerifiedUserThrottle(BaseThrottle):
+    """Per-user buckets, checked by DRF after authentication (DEFAULT_THROTTLE_CLASSES)"""
+
+    def allow_request(self, request, view):
+        self._wait = 0.0
+        if not getattr(settings, 'RATE_LIMIT_ENABLED', True):
+            return True
+        bucket = view_bucket(request)
+        user = request.user
+        if bucket is None or not user.is_authenticated:
+            return True
+        rate, burst = settings.RATE_LIMITS[bucket]
+        uid = getattr(user, 'firebase_uid', None) or f'user-{user.pk}'
+        self._wait = get_backend().consume(f'{bucket}:uid:{uid}', rate, burst)
+        if self._wait:
+            LIMITED.inc(bucket)
+            return False
+        return True
+
+    def wait(self):
+        return self._wait
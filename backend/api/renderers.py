@@ -0,0 +1,102 @@
+# api/renderers.py
+
+"""
+Fast JSON rendering for the high-volume read endpoints.
+
+Views hand Decimal and datetime values straight to the renderer instead of
+calling str()/isoformat() per row; the encoder below turns them into the same
+strings the endpoints always returned.
+"""
+
+import datetime
+import decimal
+import json
+
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # stdlib json is the fallback when orjson is missing
+    orjson = None
+
+
+# Exact-type dispatch keeps the per-value callback to one dict lookup
+ENCODERS = {
+    decimal.Decimal: str,
+    datetime.datetime: datetime.datetime.isoformat,
+    datetime.date: datetime.date.isoformat,
+    datetime.time: datetime.time.isoformat,
+}
+
+
+def encode_default(obj):
+    """Encode the non-JSON types our endpoints return"""
+    encoder = ENCODERS.get(type(obj))
+    if encoder is not None:
+        return encoder(obj)
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+_stdlib_encoder = json.JSONEncoder(
+    default=encode_default,
+    ensure_ascii=False,
+    check_circular=False,
+    separators=(',', ':'),
+)
+
+
+def dumps_stdlib(data):
+    return _stdlib_encoder.encode(data).encode('utf-8')
+
+
+def dumps_orjson(data):
+    return orjson.dumps(data, default=encode_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+BACKENDS = {
+    'stdlib': dumps_stdlib,
+    'orjson': dumps_orjson,
+}
+
+
+def get_dumps(backend=None):
+    """
+    Return the dumps function for API_JSON_BACKEND ('auto', 'orjson', 'stdlib').
+    'auto' picks orjson when it is installed.
+    """
+    backend = backend or getattr(settings, 'API_JSON_BACKEND', 'auto')
+    if backend == 'auto':
+        backend = 'orjson' if orjson is not None else 'stdlib'
+    if backend == 'orjson' and orjson is None:
+        raise ImportError("API_JSON_BACKEND is 'orjson' but orjson is not installed")
+    return BACKENDS[backend]
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Compact JSON renderer with direct Decimal/datetime encoding
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return get_dumps()(data)
+
+
+# ============================================
+# ROW HELPERS
+# ============================================
+
+def rows_to_dicts(columns, rows):
+    """Turn values_list() tuples into the dicts the endpoints return"""
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def wants_columns(request):
+    """True when the client asked for the compact array-of-columns layout"""
+    return request.query_params.get('layout') == 'columns'
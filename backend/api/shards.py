@@ -0,0 +1,459 @@
+# api/shards.py
+
+"""
+Sharded location ingest: each bus's fixes go to one dedicated process.
+
+With INGEST_SHARDS['enabled'], web workers no longer write BusLocation rows
+themselves. They send each fix (or FixBatch) to the shard supervisor, started
+with `manage.py run_ingest_shards`, over a Unix socket:
+
+    web workers --socket--> supervisor --queue--> shard-0 .. shard-N-1
+
+The supervisor picks the shard by consistent hashing of the bus id
+(HashRing), so a bus always lands on the same process. That process owns the
+bus's state (BusTrack: last accepted fix, drop counts) without any locking,
+drops duplicate, out-of-order and physically impossible fixes (two rejected
+fixes in a row that agree with each other mean the accepted one was the
+glitch, and the track re-anchors on them, storing both), runs the anomaly
+checks (api/anomalies.py) on the rest and writes them with one bulk insert
+per drained batch. Shards are separate processes, so ingest uses as many
+cores as there are shards.
+
+Resizing (`run_ingest_shards --resize N`) pauses routing, asks every shard
+to hand back the buses it no longer owns under the new ring (each BusTrack
+carrying the bus's anomaly window), passes that state to the new owners and
+only then resumes routing; queues are FIFO, so no fix is applied out of
+order across the move. With consistent hashing only about 1/N of the buses
+move. If a shard does not answer within
+HANDOFF_TIMEOUT_S the resize is rolled back: handed-over buses go back to
+the shards they came from and the new shards are stopped.
+
+If the supervisor cannot be reached, the web worker stores the fixes itself
+(see api/ingest.py), so an outage costs the per-bus filtering, not data.
+"""
+
+import bisect
+import hashlib
+import logging
+import os
+import queue
+import threading
+import time
+from multiprocessing import get_context
+from multiprocessing.connection import Client, Listener
+
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+ROUTED = metrics.registry.counter(
+    'campushub_shard_fixes_total', 'Fixes handed to ingest shards by outcome', labels=('outcome',))
+
+DEFAULTS = {
+    'enabled': False,
+    'address': '/tmp/campushub-ingest.sock',
+    'workers': os.cpu_count() or 2,
+    'replicas': 64,
+    # Fixes implying a faster jump than this are GPS glitches
+    'max_jump_kmh': 200.0,
+    'max_batch': 500,
+}
+
+# Seconds a resize waits for shards to hand over their buses
+HANDOFF_TIMEOUT_S = 30
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'INGEST_SHARDS', {})}
+
+
+def _authkey():
+    return hashlib.sha256(settings.SECRET_KEY.encode()).digest()
+
+
+# ============================================
+# CONSISTENT HASHING
+# ============================================
+
+def _hash(value):
+    # Stable across processes, unlike hash()
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """Maps keys to nodes; adding or removing a node moves ~1/N of the keys"""
+
+    def __init__(self, nodes, replicas=DEFAULTS['replicas']):
+        self.nodes = tuple(nodes)
+        points = sorted((_hash(f'{node}#{i}'), node) for node in self.nodes for i in range(replicas))
+        self._points = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def node_for(self, key):
+        if not self._points:
+            raise LookupError('empty hash ring')
+        index = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[index]
+
+
+# ============================================
+# SHARD PROCESSES
+# ============================================
+
+class BusTrack:
+    """Everything a shard knows about one bus"""
+    __slots__ = ('last', 'rejected', 'accepted', 'dropped', 'window')
+
+    def __init__(self):
+        self.last = None
+        # Most recent fix dropped as implausible, cleared by an accepted one
+        self.rejected = None
+        self.accepted = 0
+        self.dropped = 0
+        # The bus's anomaly window, only while the track is handed over
+        self.window = None
+
+
+class Shard:
+    """The loop inside one shard process"""
+
+    def __init__(self, name, inbox, outbox, cfg):
+        from .anomalies import adopt_windows, observe, release_windows
+        from .ingest import store_fixes
+        from .pingrate import distance_m
+
+        self.name = name
+        self.inbox = inbox
+        self.outbox = outbox
+        self.replicas = cfg['replicas']
+        self.max_jump_mps = cfg['max_jump_kmh'] / 3.6
+        self.max_batch = cfg['max_batch']
+        self.tracks = {}
+        self._distance = distance_m
+        self._store = store_fixes
+        self._observe = observe
+        self._release_windows = release_windows
+        self._adopt_windows = adopt_windows
+
+    def plausible(self, previous, fix):
+        elapsed = (fix[3] - previous[3]).total_seconds()
+        if elapsed <= 0:
+            return False
+        jump = self._distance(float(previous[0]), float(previous[1]), float(fix[0]), float(fix[1]))
+        return jump / elapsed <= self.max_jump_mps
+
+    def accept(self, track, fix):
+        """The fixes to store for `fix`: none, `fix`, or a re-anchoring reject and `fix`"""
+        last = track.last
+        kept = [fix]
+        if last is not None:
+            if fix[3] <= last[3]:
+                track.dropped += 1
+                return []
+            if not self.plausible(last, fix):
+                # Two rejects in a row that agree with each other: `last` was the glitch
+                rejected, track.rejected = track.rejected, fix
+                if rejected is None or not self.plausible(rejected, fix):
+                    track.dropped += 1
+                    return []
+                # The earlier reject was right after all
+                track.dropped -= 1
+                kept.insert(0, rejected)
+        track.last = fix
+        track.rejected = None
+        track.accepted += len(kept)
+        return kept
+
+    def run(self):
+        while True:
+            pending = []
+            message = self.inbox.get()
+            while True:
+                kind = message[0]
+                if kind == 'fixes':
+                    _, bus_id, fixes = message
+                    track = self.tracks.get(bus_id)
+                    if track is None:
+                        track = self.tracks[bus_id] = BusTrack()
+                    for fix in fixes:
+                        for kept in self.accept(track, fix):
+                            pending.append((bus_id, kept))
+                            self._observe(bus_id, *kept)
+                else:
+                    # Control messages apply after every earlier fix is stored
+                    self.flush(pending)
+                    pending = []
+                    if not self.control(message):
+                        return
+                if len(pending) >= self.max_batch:
+                    break
+                try:
+                    message = self.inbox.get_nowait()
+                except queue.Empty:
+                    break
+            self.flush(pending)
+
+    def control(self, message):
+        kind = message[0]
+        if kind == 'release':
+            _, names, round_id = message
+            ring = HashRing(names, self.replicas)
+            moved = {bus_id: track for bus_id, track in self.tracks.items() if ring.node_for(bus_id) != self.name}
+            windows = self._release_windows(moved)
+            for bus_id, track in moved.items():
+                del self.tracks[bus_id]
+                track.window = windows.get(bus_id)
+            self.outbox.put(('released', self.name, round_id, moved))
+        elif kind == 'adopt':
+            tracks = message[1]
+            self._adopt_windows({bus_id: t.window for bus_id, t in tracks.items() if t.window is not None})
+            for track in tracks.values():
+                track.window = None
+            self.tracks.update(tracks)
+        elif kind == 'stats':
+            accepted = sum(t.accepted for t in self.tracks.values())
+            dropped = sum(t.dropped for t in self.tracks.values())
+            counts = {'buses': len(self.tracks), 'accepted': accepted, 'dropped': dropped}
+            self.outbox.put(('stats', self.name, message[1], counts))
+        elif kind == 'stop':
+            return False
+        return True
+
+    def flush(self, pending):
+        if not pending:
+            return
+        by_bus = {}
+        for bus_id, fix in pending:
+            by_bus.setdefault(bus_id, []).append(fix)
+        try:
+            self._store(by_bus)
+        except Exception:
+            logger.exception('%s: dropping %d fixes that failed to store', self.name, len(pending))
+
+
+def _shard_main(name, inbox, outbox, cfg):
+    import django
+    django.setup()
+    Shard(name, inbox, outbox, cfg).run()
+
+
+class ShardPool:
+    """The shard processes and the ring that routes buses to them"""
+
+    def __init__(self, workers, cfg=None):
+        self.cfg = cfg or config()
+        self._context = get_context('spawn')
+        self._lock = threading.Lock()
+        self._outbox = self._context.Queue()
+        self._round = 0
+        self._shards = {}
+        self._ring = HashRing([], self.cfg['replicas'])
+        self.resize(workers)
+
+    def route(self, bus_id, fixes):
+        with self._lock:
+            name = self._ring.node_for(bus_id)
+            self._shards[name][1].put(('fixes', bus_id, fixes))
+
+    def _start(self, name):
+        inbox = self._context.Queue()
+        process = self._context.Process(
+            target=_shard_main, args=(name, inbox, self._outbox, self.cfg), name=f'ingest-{name}', daemon=True)
+        process.start()
+        self._shards[name] = (process, inbox)
+
+    def _collect(self, kind, round_id, names):
+        """Replies to round `round_id` from `names`, as many as arrive within HANDOFF_TIMEOUT_S"""
+        replies = {}
+        deadline = time.monotonic() + HANDOFF_TIMEOUT_S
+        while len(replies) < len(names):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                reply_kind, name, reply_round, payload = self._outbox.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if reply_round == round_id and reply_kind == kind:
+                replies[name] = payload
+            else:
+                self._stale(reply_kind, name, payload)
+        return replies
+
+    def _stale(self, reply_kind, name, payload):
+        if reply_kind == 'released' and name in self._shards:
+            # A shard that answered an abandoned resize too late: the ring never
+            # changed, so its buses go straight back to it
+            self._shards[name][1].put(('adopt', payload))
+
+    def _next_round(self):
+        """Handle late replies to earlier rounds before starting a new one"""
+        while True:
+            try:
+                reply_kind, name, _, payload = self._outbox.get_nowait()
+            except queue.Empty:
+                break
+            self._stale(reply_kind, name, payload)
+        self._round += 1
+        return self._round
+
+    def resize(self, workers):
+        """
+        Grow or shrink to `workers` shards, handing buses over to their new
+        owners; returns the number of buses moved. RuntimeError, with nothing
+        changed, when a shard does not hand over in time.
+        """
+        workers = max(int(workers), 1)
+        with self._lock:
+            names = [f'shard-{i}' for i in range(workers)]
+            existing = list(self._shards)
+            started = [name for name in names if name not in self._shards]
+            for name in started:
+                self._start(name)
+            ring = HashRing(names, self.cfg['replicas'])
+
+            round_id = self._next_round()
+            for name in existing:
+                self._shards[name][1].put(('release', names, round_id))
+            released = self._collect('released', round_id, existing)
+            if len(released) < len(existing):
+                for name, tracks in released.items():
+                    self._shards[name][1].put(('adopt', tracks))
+                for name in started:
+                    self._stop(name)
+                missing = sorted(set(existing) - released.keys())
+                raise RuntimeError(f"{', '.join(missing)} did not hand over within {HANDOFF_TIMEOUT_S}s; resize abandoned")
+
+            moved = {}
+            for tracks in released.values():
+                moved.update(tracks)
+            adopted = {}
+            for bus_id, track in moved.items():
+                adopted.setdefault(ring.node_for(bus_id), {})[bus_id] = track
+            for name, tracks in adopted.items():
+                self._shards[name][1].put(('adopt', tracks))
+
+            for name in existing:
+                if name not in names:
+                    self._stop(name)
+            self._ring = ring
+            logger.info('Ingest shards: %d (%d buses moved)', workers, len(moved))
+            return len(moved)
+
+    def _stop(self, name):
+        process, inbox = self._shards.pop(name)
+        inbox.put(('stop',))
+        process.join()
+
+    def stats(self):
+        """Counts per shard; None for a shard that did not answer in time"""
+        with self._lock:
+            round_id = self._next_round()
+            for _, inbox in self._shards.values():
+                inbox.put(('stats', round_id))
+            replies = self._collect('stats', round_id, list(self._shards))
+            return {name: replies.get(name) for name in self._shards}
+
+    def shutdown(self):
+        with self._lock:
+            for process, inbox in self._shards.values():
+                inbox.put(('stop',))
+            for process, _ in self._shards.values():
+                process.join()
+            self._shards.clear()
+
+
+# ============================================
+# SUPERVISOR SOCKET
+# ============================================
+
+def serve(pool, address):
+    """Accept web worker connections on `address` and route their messages"""
+    if os.path.exists(address):
+        os.unlink(address)
+    listener = Listener(address, family='AF_UNIX', authkey=_authkey())
+    try:
+        while True:
+            conn = listener.accept()
+            threading.Thread(target=_handle, args=(pool, conn), daemon=True).start()
+    finally:
+        listener.close()
+
+
+def _handle(pool, conn):
+    with conn:
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                return
+            kind = message[0]
+            if kind == 'fixes':
+                pool.route(message[1], message[2])
+                continue
+            # Control messages get ('ok', result) or ('error', reason), never silence
+            try:
+                if kind == 'resize':
+                    reply = ('ok', pool.resize(message[1]))
+                elif kind == 'stats':
+                    reply = ('ok', pool.stats())
+                else:
+                    reply = ('error', f'unknown message {kind!r}')
+            except Exception as exc:
+                logger.exception('Ingest shards: %s failed', kind)
+                reply = ('error', str(exc))
+            try:
+                conn.send(reply)
+            except OSError:
+                return
+
+
+# ============================================
+# WEB WORKER SIDE
+# ============================================
+
+_local = threading.local()
+
+
+def enabled():
+    return config()['enabled']
+
+
+def _connection():
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = _local.conn = Client(config()['address'], family='AF_UNIX', authkey=_authkey())
+    return conn
+
+
+def request(message, address=None):
+    """
+    Send a control message ('resize', n) or ('stats',) to the supervisor and
+    return its result; RuntimeError when the supervisor reports a failure.
+    """
+    with Client(address or config()['address'], family='AF_UNIX', authkey=_authkey()) as conn:
+        conn.send(message)
+        outcome, result = conn.recv()
+    if outcome != 'ok':
+        raise RuntimeError(result)
+    return result
+
+
+def submit(bus_id, fixes):
+    """
+    Hand fixes [(lat, lng, speed, timestamp), ...] for one bus to its shard.
+    False when the supervisor is unreachable; the caller then stores them.
+    """
+    try:
+        _connection().send(('fixes', bus_id, fixes))
+    except (OSError, EOFError):
+        conn = getattr(_local, 'conn', None)
+        if conn is not None:
+            conn.close()
+        _local.conn = None
+        ROUTED.inc('unreachable')
+        return False
+    ROUTED.inc('sent')
+    return True
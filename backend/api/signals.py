@@ -0,0 +1,50 @@
+# api/signals.py
+
+"""
+Model signal handlers. Connected in ApiConfig.ready().
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import caching, jobs, planner
+from .models import Booking, Bus, BusLocation, Route, Trip
+
+
+@receiver([post_save, post_delete], sender=Booking)
+def booking_changed(sender, instance, **kwargs):
+    scopes = (caching.BOOKINGS, caching.student_scope(instance.student.user_id))
+    # Bump after commit so no reader can pair the new version with old rows
+    transaction.on_commit(lambda: caching.bump_version(*scopes))
+
+
+@receiver([post_save, post_delete], sender=Bus)
+@receiver([post_save, post_delete], sender=BusLocation)
+def fleet_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: caching.bump_version(caching.FLEET))
+
+
+@receiver([post_save, post_delete], sender=Route)
+def route_changed(sender, instance, **kwargs):
+    # Invalidates the stop catalog (api/stops.py) and planner network in every worker
+    transaction.on_commit(lambda: caching.bump_version(caching.ROUTES))
+
+
+@receiver([post_save, post_delete], sender=Trip)
+def trip_changed(sender, instance, **kwargs):
+    # Departures in the journey planner, which re-reads just this trip
+    trip_id = instance.pk
+
+    def bump():
+        version = caching.bump_version(caching.TRIPS)[caching.TRIPS]
+        planner.note_trip_change(version, trip_id)
+    transaction.on_commit(bump)
+
+
+@receiver(post_save, sender=Trip)
+def trip_saved(sender, instance, **kwargs):
+    # Rollups are idempotent per trip, so re-saving a completed trip is harmless
+    if instance.status == 'completed':
+        trip_id = instance.pk
+        transaction.on_commit(lambda: jobs.defer('analytics.trip', trip_id))
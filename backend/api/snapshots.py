@@ -0,0 +1,210 @@
+# api/snapshots.py
+
+"""
+Serialize-once responses for endpoints every client polls with the same
+query, like the fleet map.
+
+@published(scope) renders a view's JSON once per (scope version, variant)
+and at most once per tick_s, into an immutable Snapshot holding the body
+plus gzip and (when the brotli package is installed) brotli encodings made
+at publish time. Every poller in between gets those bytes as-is, picked by
+its Accept-Encoding, so a poll costs an ETag check and a copy rather than a
+query, a render and a compression. One request renders a stale snapshot
+while concurrent ones for the same variant wait for it instead of rendering
+their own.
+
+ETags match caching.versioned_response, so clients see no difference.
+Each snapshot counts the requests it served; the count goes to the
+campushub_snapshot_served histogram when it is replaced, and stats() lists
+the live ones.
+"""
+
+import gzip
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import caching, metrics
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+SERVED = metrics.registry.histogram(
+    'campushub_snapshot_served', 'Requests served by one snapshot before it was replaced',
+    labels=('scope',), buckets=(1, 2, 5, 10, 50, 100, 500, 1000))
+RESPONSES = metrics.registry.counter(
+    'campushub_snapshot_responses_total', 'Snapshot responses by encoding', labels=('encoding',))
+PUBLISHED = metrics.registry.counter('campushub_snapshots_published_total', 'Snapshots rendered', labels=('scope',))
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 512
+# Variants kept at once (each distinct query string is one); the oldest goes first
+MAX_SNAPSHOTS = 64
+
+
+def tick_seconds():
+    return getattr(settings, 'SNAPSHOT_TICK_S', 1.0)
+
+
+class Snapshot:
+    __slots__ = ('scope', 'version', 'etag', 'content_type', 'bodies', 'created', 'served')
+
+    def __init__(self, scope, version, etag, content_type, body):
+        self.scope = scope
+        self.version = version
+        self.etag = etag
+        self.content_type = content_type
+        self.bodies = {'identity': body}
+        if len(body) >= MIN_COMPRESS_BYTES:
+            self.bodies['gzip'] = gzip.compress(body, compresslevel=6, mtime=0)
+            if brotli is not None:
+                self.bodies['br'] = brotli.compress(body, quality=5)
+        self.created = time.monotonic()
+        self.served = 0
+
+    def response(self, request):
+        self.served += 1
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''), self.bodies)
+        RESPONSES.inc(encoding)
+        response = HttpResponse(self.bodies[encoding], content_type=self.content_type)
+        response['ETag'] = self.etag
+        response['Vary'] = 'Accept-Encoding'
+        if encoding != 'identity':
+            response['Content-Encoding'] = encoding
+        return response
+
+
+def choose_encoding(header, available):
+    """Best of br, gzip, identity that the Accept-Encoding header allows"""
+    accepted = {}
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in ('br', 'gzip'):
+        if encoding in available and accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return 'identity'
+
+
+class SnapshotPublisher:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshots = {}
+        self._building = {}
+
+    def get(self, key, scope, version, build):
+        """The snapshot for `key` at `version`, calling build() when it is missing or old"""
+        snapshot = self._snapshots.get(key)
+        if self._fresh(snapshot, version):
+            return snapshot
+        with self._lock:
+            building = self._building.setdefault(key, threading.Lock())
+        with building:
+            snapshot = self._snapshots.get(key)
+            if self._fresh(snapshot, version):
+                return snapshot
+            fresh = None
+            try:
+                fresh = build()
+            finally:
+                if fresh is None:
+                    self._forget(key, building)
+            if fresh is None:
+                return None
+            if snapshot is not None:
+                SERVED.observe(snapshot.served, snapshot.scope)
+            elif len(self._snapshots) >= MAX_SNAPSHOTS:
+                self._evict_oldest()
+            self._snapshots[key] = fresh
+            PUBLISHED.inc(scope)
+            return fresh
+
+    def _forget(self, key, building):
+        """Drop the build lock of a variant that failed to build and has no snapshot"""
+        with self._lock:
+            if key not in self._snapshots and self._building.get(key) is building:
+                del self._building[key]
+
+    def _evict_oldest(self):
+        with self._lock:
+            key = min(self._snapshots, key=lambda k: self._snapshots[k].created, default=None)
+            snapshot = self._snapshots.pop(key, None)
+            self._building.pop(key, None)
+        if snapshot is not None:
+            SERVED.observe(snapshot.served, snapshot.scope)
+
+    @staticmethod
+    def _fresh(snapshot, version):
+        return (snapshot is not None and snapshot.version == version
+                and time.monotonic() - snapshot.created < tick_seconds())
+
+    def stats(self):
+        now = time.monotonic()
+        return [{
+            'scope': s.scope,
+            'etag': s.etag,
+            'age_s': round(now - s.created, 3),
+            'served': s.served,
+            'bytes': {encoding: len(body) for encoding, body in s.bodies.items()},
+        } for s in list(self._snapshots.values())]
+
+
+publisher = SnapshotPublisher()
+
+
+def published(scope):
+    """
+    Serve a GET view's JSON from shared snapshots, in place of
+    caching.versioned_response. Place this below @api_view. Renderers other
+    than JSON (the browsable API) and non-200 responses bypass the snapshot.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            version = caching.get_version(scope)
+            variant_key = caching.variant(request)
+            etag = f'W/"{scope}-{version}-{variant_key}"'
+
+            if caching.etag_matches(request, etag):
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+            renderer = request.accepted_renderer
+            if renderer.format != 'json':
+                response = view_func(request, *args, **kwargs)
+                if response.status_code == status.HTTP_200_OK:
+                    response['ETag'] = etag
+                return response
+
+            failed = []
+
+            def build():
+                with caching.consistent_reads(scope):
+                    response = view_func(request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    failed.append(response)
+                    return None
+                body = renderer.render(response.data, request.accepted_media_type, {'request': request})
+                content_type = f'{renderer.media_type}; charset={renderer.charset}' if renderer.charset else renderer.media_type
+                return Snapshot(scope, version, etag, content_type, body)
+
+            snapshot = publisher.get((scope, variant_key), scope, version, build)
+            if snapshot is None:
+                return failed[0]
+            return snapshot.response(request)
+
+        return wrapper
+    return decorator
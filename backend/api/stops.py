@@ -0,0 +1,186 @@
+# api/stops.py
+
+"""
+Stop catalog built from Route.stops, for resolving free-text stop names.
+
+Route.stops entries are either names or {'name', 'lat', 'lng'} dicts. The
+catalog normalizes every name (accents stripped, lower case, punctuation to
+spaces) and keeps:
+
+    by_key      normalized name -> Stop (exact resolution)
+    keys        sorted normalized names and word suffixes, for prefix search
+                ("gate" finds "main gate") by bisection
+    trigrams    trigram -> stop keys, for fuzzy suggestions on typos
+    pairs       (from key, to key) -> route ids serving them in that order
+
+so resolve() and routes_between() are dictionary lookups rather than a scan
+over every route's JSON. The catalog is rebuilt lazily when the 'routes'
+cache version changes (bumped by Route saves and deletes, see signals.py).
+"""
+
+import bisect
+import logging
+import math
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+
+from backend_project.db_routing import use_primary
+
+from . import caching
+from .models import Route
+
+logger = logging.getLogger(__name__)
+
+MIN_SIMILARITY = 0.3
+
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(name):
+    """'  Main-Gate (North) ' -> 'main gate north'"""
+    text = unicodedata.normalize('NFKD', str(name)).encode('ascii', 'ignore').decode('ascii')
+    return _NON_ALNUM.sub(' ', text.lower()).strip()
+
+
+def trigrams(key):
+    padded = f'  {key} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class Stop:
+    __slots__ = ('key', 'name', 'lat', 'lng', 'route_ids')
+
+    def __init__(self, key, name):
+        self.key = key
+        self.name = name
+        self.lat = None
+        self.lng = None
+        self.route_ids = set()
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'lat': self.lat,
+            'lng': self.lng,
+            'routes': sorted(self.route_ids),
+        }
+
+
+def stop_coordinates(entry):
+    """(lat, lng) of a route stops entry; None when missing or not a valid position"""
+    if not isinstance(entry, dict) or entry.get('lat') is None or entry.get('lng') is None:
+        return None
+    try:
+        lat, lng = float(entry['lat']), float(entry['lng'])
+    except (TypeError, ValueError):
+        return None
+    if not (math.isfinite(lat) and math.isfinite(lng) and -90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return lat, lng
+
+
+class StopCatalog:
+    def __init__(self, routes):
+        """routes: iterable of (route id, stops JSON list)"""
+        self.by_key = {}
+        self.pairs = defaultdict(set)
+        for route_id, stops in routes:
+            sequence = []
+            for entry in stops or ():
+                raw = entry.get('name') if isinstance(entry, dict) else entry
+                key = normalize(raw or '')
+                if not key:
+                    continue
+                stop = self.by_key.get(key)
+                if stop is None:
+                    stop = self.by_key[key] = Stop(key, str(raw).strip())
+                position = stop_coordinates(entry)
+                if position is not None:
+                    stop.lat, stop.lng = position
+                elif isinstance(entry, dict) and (entry.get('lat') is not None or entry.get('lng') is not None):
+                    # The stop stays searchable, just without a position
+                    logger.warning('Route %s: ignoring invalid coordinates for stop %r', route_id, raw)
+                stop.route_ids.add(route_id)
+                sequence.append(key)
+            for i, origin in enumerate(sequence):
+                for target in sequence[i + 1:]:
+                    if target != origin:
+                        self.pairs[origin, target].add(route_id)
+
+        # Every word suffix of a name is searchable: 'main gate' -> 'main gate', 'gate'
+        self.keys = sorted(
+            (key[start:], key)
+            for key in self.by_key
+            for start in [0] + [m.end() for m in re.finditer(' ', key)]
+        )
+        self.trigrams = defaultdict(set)
+        for key in self.by_key:
+            for gram in trigrams(key):
+                self.trigrams[gram].add(key)
+
+    def resolve(self, text):
+        """The Stop whose normalized name equals `text`'s, or None"""
+        return self.by_key.get(normalize(text))
+
+    def coordinates(self, text):
+        stop = self.resolve(text)
+        if stop is None or stop.lat is None:
+            return None
+        return stop.lat, stop.lng
+
+    def routes_between(self, source, destination):
+        """Ids of routes that visit `source` and later `destination`"""
+        return self.pairs.get((normalize(source), normalize(destination)), set())
+
+    def suggest(self, text, limit=10):
+        """Prefix matches (shortest first), then fuzzy trigram matches"""
+        query = normalize(text)
+        if not query:
+            return []
+        found = []
+        seen = set()
+        start = bisect.bisect_left(self.keys, (query,))
+        for suffix, key in self.keys[start:]:
+            if not suffix.startswith(query):
+                break
+            if key not in seen:
+                seen.add(key)
+                found.append(key)
+        found.sort(key=len)
+
+        if len(found) < limit:
+            grams = trigrams(query)
+            scores = defaultdict(int)
+            for gram in grams:
+                for key in self.trigrams.get(gram, ()):
+                    if key not in seen:
+                        scores[key] += 1
+            fuzzy = []
+            for key, shared in scores.items():
+                similarity = shared / (len(grams) + len(trigrams(key)) - shared)
+                if similarity >= MIN_SIMILARITY:
+                    fuzzy.append((-similarity, key))
+            found += [key for _, key in sorted(fuzzy)]
+        return [self.by_key[key] for key in found[:limit]]
+
+
+_catalog = None
+_catalog_version = None
+_lock = threading.Lock()
+
+
+def get_catalog():
+    """The catalog for the current routes, rebuilt after any route change"""
+    global _catalog, _catalog_version
+    version = caching.get_version(caching.ROUTES)
+    if _catalog is None or _catalog_version != version:
+        with _lock:
+            if _catalog is None or _catalog_version != version:
+                # Kept under `version` until the next bump, so never from a lagging replica
+                with use_primary():
+                    routes = list(Route.objects.filter(is_active=True).values_list('pk', 'stops'))
+                _catalog = StopCatalog(routes)
+                _catalog_version = version
+    return _catalog
@@ -0,0 +1,94 @@
+# api/tasks.py
+
+"""
+Background tasks run through api/jobs.py. Imported in ApiConfig.ready() so
+every task is registered before queued or recovered jobs run.
+
+Arguments are ids and plain values (strings after a round trip through the
+durable store), never model instances.
+"""
+
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import analytics, caching, heatmap, mirror, presence, write_queue
+from .jobs import task
+from .models import BusLocation, Driver
+
+
+@task('driver.position')
+def update_driver_position(driver_id, latitude, longitude, timestamp):
+    """Driver's current position; a fix older than the stored one is ignored"""
+    write_queue.run(
+        lambda: Driver.objects.filter(pk=driver_id)
+        .filter(Q(last_location_update__isnull=True) | Q(last_location_update__lte=timestamp))
+        .update(current_latitude=latitude, current_longitude=longitude, last_location_update=timestamp)
+    )
+
+
+@task('locations.history')
+def store_location(bus_id, latitude, longitude, speed, timestamp):
+    write_queue.run(
+        BusLocation.objects.create,
+        bus_id=bus_id, latitude=latitude, longitude=longitude, speed=speed, timestamp=timestamp,
+    )
+
+
+@task('locations.history_batch')
+def store_location_batch(bus_id, fixes):
+    """fixes: [(lat, lng, speed, timestamp), ...], oldest first"""
+    def insert():
+        BusLocation.objects.bulk_create([
+            BusLocation(bus_id=bus_id, latitude=lat, longitude=lng, speed=speed, timestamp=ts)
+            for lat, lng, speed, ts in fixes
+        ])
+        transaction.on_commit(lambda: caching.bump_version(caching.FLEET))
+    write_queue.run(insert)
+
+
+@task('heatmap.refresh', retries=0)
+def refresh_heatmap():
+    heatmap.get_store().refresh()
+
+
+@task('analytics.trip')
+def record_trip_analytics(trip_id):
+    analytics.record_trip(trip_id)
+
+
+@task('presence.offline')
+def mark_driver_offline(driver_id, offline_s):
+    """Unavailable, unless a fix reached the database within offline_s after all"""
+    cutoff = timezone.now() - timedelta(seconds=float(offline_s))
+    updated = write_queue.run(
+        lambda: Driver.objects.filter(pk=driver_id, is_available=True)
+        .filter(Q(last_location_update__isnull=True) | Q(last_location_update__lt=cutoff))
+        .update(is_available=False)
+    )
+    if updated:
+        cache.set(f'{presence.OFFLINE_KEY}{driver_id}', 1, timeout=None)
+        _mirror_active(driver_id, False)
+
+
+@task('presence.online')
+def mark_driver_online(driver_id):
+    """
+    Undo mark_driver_offline, for a driver it switched off only: the job
+    claims presence's offline flag first, so a repeat does nothing, and an
+    admin's availability set while the flag was clear is left alone.
+    """
+    if not cache.delete(f'{presence.OFFLINE_KEY}{driver_id}'):
+        return
+    write_queue.run(lambda: Driver.objects.filter(pk=driver_id, is_available=False).update(is_available=True))
+    _mirror_active(driver_id, True)
+
+
+def _mirror_active(driver_id, active):
+    if mirror.enabled():
+        uid = Driver.objects.filter(pk=driver_id).values_list('firebase_uid', flat=True).first()
+        if uid:
+            mirror.set_active(uid, active, timezone.now())
@@ -1,3 +1,763 @@
-from django.test import TestCase
+# api/tests.py
 
-# Create your tests here.
+"""
+Tests for the api app: python manage.py test api
+
+Background jobs run inline (JOB_QUEUE disabled) and rate limiting is off
+unless a test turns it on, so each test sees the effects of its own
+requests straight away.
+"""
+
+import io
+import os
+import queue
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, time as dt_time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import ParseError
+from rest_framework.test import APIClient
+
+from backend_project import firebase_config
+
+from . import anomalies, caching, export, heatmap, jobs, loadgen, planner, presence, ratelimit, shards, tasks, timetables, traces, wire
+from .models import Booking, Bus, BusLocation, Driver, Route, Student, Timetable, Trip
+from .parsers import FixBatchParser
+
+TEST_SETTINGS = dict(JOB_QUEUE={'enabled': False}, RATE_LIMIT_ENABLED=False)
+
+
+def make_driver(name='d1'):
+    user = User.objects.create(username=f'test-{name}')
+    return Driver.objects.create(
+        user=user, firebase_uid=f'uid-{name}', driver_id=name, license_number='L', phone='0')
+
+
+def make_route(name, stops, duration):
+    return Route.objects.create(
+        name=name, source=stops[0], destination=stops[-1], stops=stops, estimated_duration=duration)
+
+
+# ============================================
+# WIRE FORMAT
+# ============================================
+
+class WireTests(SimpleTestCase):
+    def fixes(self):
+        base = datetime(2026, 5, 1, 8, 0, tzinfo=dt_timezone.utc)
+        return [
+            ('12.971599', '77.594566', 0, base),
+            ('12.972001', '77.595002', 23.4, base + timedelta(seconds=5)),
+            ('-33.868820', '-151.209290', 61.2, base + timedelta(seconds=12, milliseconds=250)),
+        ]
+
+    def test_round_trip(self):
+        batch = wire.decode(wire.encode(self.fixes()))
+        self.assertEqual(len(batch), 3)
+        for (lat, lng, speed, ts), fix in zip(batch, self.fixes()):
+            self.assertEqual(lat, Decimal(fix[0]))
+            self.assertEqual(lng, Decimal(fix[1]))
+            self.assertAlmostEqual(speed, fix[2])
+            self.assertEqual(ts, fix[3])
+        self.assertEqual(batch.last(), list(batch)[-1])
+
+    def test_rejects_malformed(self):
+        buf = wire.encode(self.fixes())
+        for bad in (buf[:10], b'XXXX' + buf[4:], buf[:-1], buf + b'\0'):
+            with self.assertRaises(ValueError):
+                wire.decode(bad)
+        with self.assertRaises(ValueError):
+            wire.encode(list(reversed(self.fixes())))
+
+    def test_rejects_out_of_range_coordinates(self):
+        now = datetime(2026, 5, 1, tzinfo=dt_timezone.utc)
+        with self.assertRaisesMessage(ValueError, 'Latitude out of range'):
+            wire.decode(wire.encode([(90.5, 0, 0, now)]))
+        with self.assertRaisesMessage(ValueError, 'Longitude out of range'):
+            wire.decode(wire.encode([(0, -180.5, 0, now)]))
+        self.assertEqual(len(wire.decode(wire.encode([(90, 180, 0, now), (-90, -180, 0, now)]))), 2)
+
+    def test_rejects_unrepresentable_timestamps(self):
+        buf = bytearray(wire.encode(self.fixes()))
+        for base_ms in (-1, 2 ** 62):
+            wire.HEADER.pack_into(buf, 0, wire.MAGIC, wire.VERSION, 0, 3, base_ms)
+            with self.assertRaisesMessage(ValueError, 'Timestamp out of range'):
+                wire.decode(bytes(buf))
+
+    def test_accepted_window(self):
+        buf = wire.encode(self.fixes())
+        first_ms = int(self.fixes()[0][3].timestamp() * 1000)
+        self.assertEqual(len(wire.decode(buf, now_ms=first_ms + wire.MAX_AGE_MS)), 3)
+        for now_ms in (first_ms + wire.MAX_AGE_MS + 1, first_ms + 12_250 - wire.MAX_AHEAD_MS - 1):
+            with self.assertRaisesMessage(ValueError, 'outside the accepted window'):
+                wire.decode(buf, now_ms=now_ms)
+
+    def test_parser_checks_server_time(self):
+        stale = wire.encode([(12.97, 77.59, 0, datetime.now(dt_timezone.utc) - timedelta(days=30))])
+        with self.assertRaises(ParseError):
+            FixBatchParser().parse(io.BytesIO(stale))
+        fresh = wire.encode([(12.97, 77.59, 0, datetime.now(dt_timezone.utc))])
+        self.assertEqual(len(FixBatchParser().parse(io.BytesIO(fresh))), 1)
+
+
+# ============================================
+# CONDITIONAL GETS
+# ============================================
+
+@override_settings(**TEST_SETTINGS)
+class ETagTests(TestCase):
+    url = '/api/admin/buses/locations/'
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_not_modified_until_a_write(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        etag = first['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bus = Bus.objects.create(bus_number='T-1')
+            BusLocation.objects.create(bus=bus, latitude=Decimal('12.97'), longitude=Decimal('77.59'))
+        changed = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=changed['ETag']).status_code, 304)
+
+    def test_variants_have_their_own_etag(self):
+        rows = self.client.get(self.url)
+        columns = self.client.get(self.url, {'layout': 'columns'})
+        self.assertNotEqual(rows['ETag'], columns['ETag'])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=rows['ETag']).status_code, 304)
+
+
+# ============================================
+# LOAD GENERATION
+# ============================================
+
+@override_settings(**TEST_SETTINGS)
+class LoadgenTests(TestCase):
+    def test_server_errors_are_counted(self):
+        stats = loadgen.EndpointStats('get_all_bus_locations')
+        client = loadgen._client(3, 1)
+        # No snapshot from an earlier test may answer for the view
+        caching.bump_version(caching.FLEET)
+        with mock.patch('api.views.fleet_rows', side_effect=OperationalError('database is locked')):
+            loadgen._timed(stats, lambda: client.get('/api/admin/buses/locations/'))
+        loadgen._timed(stats, lambda: client.get('/api/admin/buses/locations/'))
+        self.assertEqual((stats.errors, stats.statuses), (1, {500: 1, 200: 1}))
+
+    def test_cleanup_keeps_real_load_users(self):
+        loadgen.seed(students=2, drivers=2, routes=1)
+        real = User.objects.create(username='load-alice')
+        loadgen.cleanup()
+        self.assertFalse(loadgen.cleanup_needed())
+        self.assertTrue(User.objects.filter(pk=real.pk).exists())
+
+    def test_refuses_a_database_with_real_data(self):
+        make_driver('real')
+        self.assertTrue(loadgen.holds_real_data())
+        with self.assertRaises(RuntimeError):
+            loadgen.cleanup()
+
+
+# ============================================
+# TRACE REPLAY
+# ============================================
+
+@override_settings(**TEST_SETTINGS)
+class TraceReplayTests(TestCase):
+    def test_replays_onto_synthetic_buses(self):
+        driver = make_driver()
+        bus = Bus.objects.create(bus_number='KA-01', driver=driver, is_active=False)
+        with self.assertRaises(RuntimeError):
+            traces.replay_drivers({'KA-01'})
+
+        long_number = 'CAMPUS-SHUTTLE-0001'
+        drivers = traces.replay_drivers({'KA-01', long_number}, allow_live=True)
+        bus.refresh_from_db()
+        self.assertEqual((bus.driver_id, bus.is_active), (driver.pk, False))
+        self.assertNotEqual(drivers['KA-01'].pk, driver.pk)
+        replayed = Bus.objects.get(driver=drivers[long_number])
+        self.assertTrue(replayed.bus_number.startswith(traces.REPLAY_PREFIX))
+        self.assertLessEqual(len(replayed.bus_number), traces.BUS_NUMBER_LENGTH)
+        # Replay users do not count as real data
+        Bus.objects.filter(pk=bus.pk).delete()
+        driver.user.delete()
+        self.assertFalse(loadgen.holds_real_data())
+
+    def test_empty_trace(self):
+        summary = traces.replay([], lambda *fix: None)
+        self.assertEqual(summary['fixes'], 0)
+
+
+# ============================================
+# FIREBASE
+# ============================================
+
+class FirebaseConfigTests(SimpleTestCase):
+    def setUp(self):
+        firebase_config.reset()
+        self.addCleanup(firebase_config.reset)
+        # A lock of its own, so a deadlocked worker cannot hang reset() in cleanup
+        patcher = mock.patch.object(firebase_config, '_lock', threading.Lock())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_first_firestore_call_initializes_app(self):
+        admin = mock.MagicMock(_apps={})
+        modules = {'firebase_admin': admin, 'firebase_admin.credentials': admin.credentials,
+                   'firebase_admin.firestore': admin.firestore}
+        result = {}
+        with mock.patch.dict(sys.modules, modules):
+            worker = threading.Thread(target=lambda: result.update(client=firebase_config.get_firestore()),
+                                      daemon=True)
+            worker.start()
+            worker.join(timeout=5)
+        self.assertFalse(worker.is_alive(), 'get_firestore() deadlocked')
+        self.assertIs(result['client'], admin.firestore.client.return_value)
+        admin.firestore.client.assert_called_once_with(app=admin.initialize_app.return_value)
+
+
+# ============================================
+# RATE LIMITS
+# ============================================
+
+@override_settings(**TEST_SETTINGS)
+class RateLimitTests(TestCase):
+    url = '/api/stops/search/'
+
+    def setUp(self):
+        self.client = APIClient()
+        # Fresh buckets for every test
+        patcher = mock.patch.object(ratelimit, '_backend', ratelimit.LocalBackend())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def limits(self, rate, burst, factor=10):
+        limits = {'fleet_read': (rate, burst), 'ingest': (rate, burst), 'booking_write': (rate, burst),
+                  'export': (rate, burst)}
+        return self.settings(RATE_LIMIT_ENABLED=True, RATE_LIMITS=limits, RATE_LIMIT_SHARED_IP_FACTOR=factor)
+
+    def test_per_ip_burst(self):
+        with self.limits(0.001, 2):
+            codes = [self.client.get(self.url, {'q': 'gate'}, REMOTE_ADDR='10.0.0.1').status_code
+                     for _ in range(3)]
+            other = self.client.get(self.url, {'q': 'gate'}, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(codes, [200, 200, 429])
+        self.assertEqual(other.status_code, 200)
+
+    def test_retry_after(self):
+        with self.limits(0.5, 1):
+            self.client.get(self.url, REMOTE_ADDR='10.0.0.3')
+            limited = self.client.get(self.url, REMOTE_ADDR='10.0.0.3')
+        self.assertEqual(limited.status_code, 429)
+        self.assertEqual(limited['Retry-After'], '2')
+
+    def test_made_up_tokens_share_one_bucket(self):
+        with self.limits(0.001, 1, factor=3):
+            codes = [self.client.get(self.url, REMOTE_ADDR='10.0.0.4',
+                                     HTTP_AUTHORIZATION=f'Bearer forged-{i}').status_code
+                     for i in range(4)]
+        self.assertNotIn(429, codes[:3])
+        self.assertEqual(codes[3], 429)
+
+    @override_settings(FIREBASE_TOKEN_VERIFIER='backend_project.firebase_config.LocalTokenVerifier')
+    def test_verified_user_limited_across_addresses(self):
+        firebase_config.reset()
+        self.addCleanup(firebase_config.reset)
+        with self.limits(0.001, 2, factor=100):
+            codes = [self.client.get(self.url, REMOTE_ADDR=f'10.0.1.{i}',
+                                     HTTP_AUTHORIZATION='Bearer local:alice').status_code
+                     for i in range(3)]
+            other = self.client.get(self.url, REMOTE_ADDR='10.0.1.9', HTTP_AUTHORIZATION='Bearer local:bob')
+        self.assertEqual(codes, [200, 200, 429])
+        self.assertEqual(other.status_code, 200)
+
+    def test_buckets_refill(self):
+        backend = ratelimit.LocalBackend()
+        self.assertEqual(backend.consume('k', 10, 1, now=100.0), 0)
+        self.assertGreater(backend.consume('k', 10, 1, now=100.0), 0)
+        self.assertEqual(backend.consume('k', 10, 1, now=100.2), 0)
+
+
+# ============================================
+# BACKGROUND JOBS
+# ============================================
+
+calls = []
+
+
+@jobs.task('test.flaky', retries=3)
+def flaky(key, failures):
+    calls.append(key)
+    if calls.count(key) <= failures:
+        raise RuntimeError(f'failure {calls.count(key)}')
+
+
+@jobs.task('test.record')
+def record(key):
+    calls.append(key)
+
+
+class JobQueueTests(SimpleTestCase):
+    def setUp(self):
+        calls.clear()
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        self.path = os.path.join(self.dir, 'jobs.sqlite3')
+
+    def wait_idle(self, queue):
+        deadline = time.monotonic() + 5
+        while not queue.idle() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_retries_until_success(self):
+        queue = jobs.JobQueue(workers=1, backoff_s=0.01, store=jobs.SQLiteStore(self.path))
+        queue.enqueue('test.flaky', 'a', 2)
+        self.wait_idle(queue)
+        queue.shutdown()
+        self.assertEqual(calls, ['a', 'a', 'a'])
+        self.assertEqual(list(jobs.SQLiteStore(self.path).pending()), [])
+
+    def test_gives_up_after_retries(self):
+        store = jobs.SQLiteStore(self.path)
+        queue = jobs.JobQueue(workers=1, retries=1, backoff_s=0.01, store=store)
+        queue.enqueue('test.record', 'ok')
+        queue.enqueue('test.flaky', 'b', 10)
+        self.wait_idle(queue)
+        queue.shutdown()
+        # The task's own retries=3 overrides the queue default
+        self.assertEqual(calls.count('b'), 4)
+        status = jobs.SQLiteStore(self.path)._conn.execute('SELECT task, status FROM jobs').fetchall()
+        self.assertEqual(status, [('test.flaky', 'failed')])
+
+    def test_pending_jobs_survive_a_restart(self):
+        # Accepted by a process that died before running it
+        jobs.SQLiteStore(self.path).add('test.record', ['before-crash'], {})
+        queue = jobs.JobQueue(workers=1, backoff_s=0.01, store=jobs.SQLiteStore(self.path))
+        self.wait_idle(queue)
+        queue.shutdown()
+        self.assertEqual(calls, ['before-crash'])
+        self.assertEqual(list(jobs.SQLiteStore(self.path).pending()), [])
+
+    def test_full_queue(self):
+        queue = jobs.JobQueue(workers=0, maxsize=1)
+        queue.enqueue('test.record', 'x')
+        with self.assertRaises(jobs.QueueFull):
+            queue.enqueue('test.record', 'y')
+        with self.assertRaises(KeyError):
+            queue.enqueue('test.unknown')
+        queue.shutdown(timeout=0)
+
+    @override_settings(JOB_QUEUE={'enabled': False})
+    def test_defer_runs_inline_when_disabled(self):
+        jobs.defer('test.record', 'inline')
+        self.assertEqual(calls, ['inline'])
+
+
+# ============================================
+# HEATMAP TILES
+# ============================================
+
+@override_settings(**TEST_SETTINGS)
+class HeatmapTileTests(TestCase):
+    url = '/api/admin/heatmap/pickups/12/2900/1900/'
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_time_range_validation(self):
+        for params in ({'hours': 'inf'}, {'hours': 'nan'}, {'hours': '-1'}, {'hours': '0'}, {'hours': 'x'},
+                       {'from': 'yesterday'},
+                       {'from': '2026-05-02T00:00:00Z', 'to': '2026-05-01T00:00:00Z'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+    def test_ranges_are_clamped_to_history(self):
+        history = timedelta(seconds=heatmap.get_store().cfg['history_s'])
+        for params in ({'hours': '1e9'}, {'from': '0001-01-01T00:00:00Z'}):
+            with self.subTest(params=params):
+                started = time.monotonic()
+                response = self.client.get(self.url, params)
+                self.assertLess(time.monotonic() - started, 1)
+                self.assertEqual(response.status_code, 200)
+                data = response.json()
+                span = datetime.fromisoformat(data['to']) - datetime.fromisoformat(data['from'])
+                self.assertLessEqual(span, history)
+
+    def test_layer_and_zoom(self):
+        self.assertEqual(self.client.get('/api/admin/heatmap/nothing/12/0/0/').status_code, 404)
+        self.assertEqual(self.client.get('/api/admin/heatmap/pickups/3/0/0/').status_code, 400)
+        dense = self.client.get(self.url, {'layout': 'dense'}).json()
+        self.assertEqual(len(dense['counts']), dense['size'] ** 2)
+
+    def use_store(self):
+        store = heatmap.HeatmapStore(heatmap.config())
+        patcher = mock.patch.object(heatmap, '_store', store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return store
+
+    def tile_url(self, layer, lat, lng, z=12):
+        _, _, x, y, _, _ = next(heatmap.bin_points([lat], [lng], [0], z, z))
+        return f'/api/admin/heatmap/{layer}/{z}/{x}/{y}/'
+
+    def test_rows_committing_below_the_last_id_are_counted(self):
+        store = self.use_store()
+        bus = Bus.objects.create(bus_number='HM-1')
+        now = timezone.now()
+        fixes = [BusLocation.objects.create(bus=bus, latitude=Decimal('12.971600'), longitude=Decimal('77.594600'),
+                                            speed=0, timestamp=now) for _ in range(4)]
+        late = fixes[1:3]
+        BusLocation.objects.filter(pk__in=[fix.pk for fix in fixes[1:]]).delete()
+        store.refresh()
+        fixes[3].save(force_insert=True)
+        store.refresh()
+        # The middle ids were handed out first but committed last
+        for fix in late:
+            fix.save(force_insert=True)
+        store.refresh()
+        store.refresh()
+        url = self.tile_url('buses', 12.9716, 77.5946)
+        self.assertEqual(self.client.get(url).json()['total'], 4)
+        self.assertEqual(store._holes['locations'], [])
+
+    def test_etag_follows_the_shared_version(self):
+        url = self.tile_url('buses', 12.9716, 77.5946)
+        self.use_store()
+        first = self.client.get(url)['ETag']
+        self.use_store()
+        self.assertEqual(self.client.get(url)['ETag'], first)
+        caching.bump_version(caching.FLEET)
+        heatmap.get_store()._refreshed_at = 0.0
+        self.assertNotEqual(self.client.get(url)['ETag'], first)
+
+    def test_upcoming_pickups(self):
+        self.use_store()
+        with self.captureOnCommitCallbacks(execute=True):
+            make_route('Loop', [{'name': 'North Gate', 'lat': 12.9716, 'lng': 77.5946},
+                                {'name': 'Library', 'lat': 12.9816, 'lng': 77.6046}], 20)
+        student = Student.objects.create(user=User.objects.create(username='hm-student'), firebase_uid='uid-hm',
+                                         student_id='HM1', phone='0', address='x')
+        now = timezone.now()
+        Booking.objects.create(student=student, source='North Gate', destination='Library',
+                               pickup_time=now + timedelta(hours=2))
+        url = self.tile_url('pickups', 12.9716, 77.5946)
+        data = self.client.get(url, {'from': now.isoformat(), 'to': (now + timedelta(hours=3)).isoformat()}).json()
+        self.assertEqual(data['total'], 1)
+        self.assertEqual(self.client.get(url).json()['total'], 0)
+        # Bus fixes cannot come from the future
+        data = self.client.get(self.tile_url('buses', 12.9716, 77.5946),
+                               {'from': now.isoformat(), 'to': (now + timedelta(hours=3)).isoformat()}).json()
+        self.assertLessEqual(datetime.fromisoformat(data['to']), timezone.now())
+
+
+# ============================================
+# EXPORT
+# ============================================
+
+@override_settings(**TEST_SETTINGS)
+class ExportTests(TestCase):
+    def setUp(self):
+        bus = Bus.objects.create(bus_number='EX-1')
+        for hour in (0, 12, 23, 24):
+            BusLocation.objects.create(
+                bus=bus, latitude=Decimal('12.971600'), longitude=Decimal('77.594600'), speed=0,
+                timestamp=timezone.make_aware(datetime(2026, 5, 1) + timedelta(hours=hour, minutes=30)))
+
+    def test_bounds(self):
+        self.assertEqual(export.parse_bound('2026-05-01', is_end=True),
+                         timezone.make_aware(datetime(2026, 5, 2)))
+        self.assertEqual(export.parse_bound('2026-05-01T06:00:00+00:00', is_end=True),
+                         datetime(2026, 5, 1, 6, tzinfo=dt_timezone.utc))
+        with self.assertRaises(ValueError):
+            export.parse_bound('May 1st')
+
+    def test_view_and_command_agree_on_date_ranges(self):
+        admin = User.objects.create(username='ex-admin', is_staff=True)
+        client = APIClient()
+        client.force_authenticate(admin)
+        response = client.get('/api/admin/export/locations.ndjson', {'from': '2026-05-01', 'to': '2026-05-01'})
+        self.assertEqual(response.status_code, 200)
+        from_view = b''.join(response.streaming_content)
+
+        path = os.path.join(tempfile.mkdtemp(), 'locations.ndjson')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        call_command('export_data', 'locations', '--format', 'ndjson', '--start', '2026-05-01',
+                     '--end', '2026-05-01', '--output', path, stdout=io.StringIO())
+        with open(path, 'rb') as fh:
+            self.assertEqual(fh.read(), from_view)
+        self.assertEqual(from_view.count(b'\n'), 3)
+
+
+# ============================================
+# JOURNEY PLANNER
+# ============================================
+
+class NetworkTests(SimpleTestCase):
+    def network(self):
+        east = planner.compile_route(1, 'East', ['North Gate', 'Library', 'Main Gate'], 20)
+        west = planner.compile_route(2, 'West', ['Main Gate', 'Hostel'], 10)
+        direct = planner.compile_route(3, 'Direct', ['North Gate', 'Hostel'], 60)
+        return planner.Network([
+            east.with_departures([(600, 11), (0, 10)]),
+            west.with_departures([(1900, 20), (2500, 21)]),
+            direct.with_departures([(0, 30)]),
+        ])
+
+    def test_fastest_then_fewer_transfers(self):
+        journeys = self.network().plan('north gate', 'HOSTEL', 0, max_transfers=2, transfer_s=120)
+        fewest, fastest = journeys
+        self.assertEqual([leg['route'] for leg in fastest], ['East', 'West'])
+        self.assertEqual(fastest[0]['trip_id'], 10)
+        # East reaches Main Gate at 1200; 1900 is the first West trip after the transfer
+        self.assertEqual((fastest[1]['trip_id'], fastest[1]['arrive']), (20, 2500))
+        self.assertEqual([leg['route'] for leg in fewest], ['Direct'])
+        self.assertEqual(fewest[0]['arrive'], 3600)
+
+    def test_transfer_time_and_limits(self):
+        network = self.network()
+        # Leaving at 1: the 600 East trip reaches Main Gate at 1800, too late for the 1900 West trip
+        late = network.plan('North Gate', 'Hostel', 1, max_transfers=1, transfer_s=120)
+        self.assertEqual([leg['trip_id'] for leg in late[-1]], [11, 21])
+        direct_only = network.plan('North Gate', 'Hostel', 0, max_transfers=0)
+        self.assertEqual([[leg['route'] for leg in legs] for legs in direct_only], [['Direct']])
+        self.assertEqual(network.plan('North Gate', 'Nowhere', 0), [])
+
+
+@override_settings(**TEST_SETTINGS)
+class PlannerTests(TestCase):
+    url = '/api/routes/plan/'
+
+    def setUp(self):
+        self.client = APIClient()
+        patcher = mock.patch.object(planner, '_planner', planner.Planner())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.now = timezone.now().replace(microsecond=0)
+        self.bus = Bus.objects.create(bus_number='P-1')
+        self.driver = make_driver()
+        self.east = make_route('East', ['North Gate', 'Library', 'Main Gate'], 20)
+        self.west = make_route('West', ['Main Gate', 'Hostel'], 10)
+        self.trip(self.east, 10)
+        self.trip(self.west, 40)
+
+    def trip(self, route, minutes, **kwargs):
+        return Trip.objects.create(bus=self.bus, driver=self.driver, route=route,
+                                   scheduled_time=self.now + timedelta(minutes=minutes), **kwargs)
+
+    def plan(self, **params):
+        return self.client.get(self.url, {'from': 'North Gate', 'to': 'Hostel', **params})
+
+    def test_journey_with_a_transfer(self):
+        response = self.plan()
+        self.assertEqual(response.status_code, 200)
+        journey = response.json()['journeys'][0]
+        self.assertEqual(journey['transfers'], 1)
+        self.assertEqual([leg['route'] for leg in journey['legs']], ['East', 'West'])
+
+    def test_trip_changes_are_picked_up(self):
+        self.plan()
+        with self.captureOnCommitCallbacks(execute=True):
+            faster = self.trip(self.west, 33)
+        legs = self.plan().json()['journeys'][0]['legs']
+        self.assertEqual(legs[1]['trip_id'], faster.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            faster.status = 'cancelled'
+            faster.save()
+        legs = self.plan().json()['journeys'][0]['legs']
+        self.assertNotEqual(legs[1]['trip_id'], faster.pk)
+
+    def test_depart_outside_window(self):
+        self.assertEqual(self.plan(depart=(self.now + timedelta(days=2)).isoformat()).status_code, 400)
+        self.assertEqual(self.plan(depart=(self.now - timedelta(hours=3)).isoformat()).status_code, 400)
+        self.assertEqual(self.plan(depart='soon').status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'from': 'North Gate'}).status_code, 400)
+
+
+# ============================================
+# INGEST SHARDS
+# ============================================
+
+class ShardTests(SimpleTestCase):
+    def shard(self, name, stored):
+        shard = shards.Shard(name, queue.Queue(), queue.Queue(), shards.config())
+        analyzer = anomalies.Analyzer(
+            dict(anomalies.config(), enabled=True), route_points=lambda bus_id, ttl: [], emit=lambda *args: None)
+        shard._observe = lambda bus_id, lat, lng, speed, ts: analyzer.observe(bus_id, lat, lng, speed, ts.timestamp())
+        shard._release_windows = analyzer.release
+        shard._adopt_windows = analyzer.adopt
+        shard._store = stored.update
+        return shard, analyzer
+
+    def fix(self, seconds, lat):
+        return (Decimal(lat), Decimal('77.594600'), 20.0, datetime(2026, 6, 1, 8, tzinfo=dt_timezone.utc)
+                + timedelta(seconds=seconds))
+
+    def test_reanchoring_stores_both_agreeing_rejects(self):
+        stored = {}
+        shard, _ = self.shard('shard-0', stored)
+        fixes = [self.fix(0, '12.971600'), self.fix(10, '13.071600'), self.fix(20, '13.071700')]
+        shard.inbox.put(('fixes', 7, fixes))
+        shard.inbox.put(('stop',))
+        shard.run()
+        self.assertEqual(stored[7], fixes)
+        track = shard.tracks[7]
+        self.assertEqual((track.accepted, track.dropped), (3, 0))
+
+    def test_resize_hands_the_anomaly_window_over(self):
+        stored = {}
+        old, old_analyzer = self.shard('shard-0', stored)
+        new, new_analyzer = self.shard('shard-1', stored)
+        # Under a ring of shard-1 alone, every bus moves
+        bus_id = 7
+        old.inbox.put(('fixes', bus_id, [self.fix(i * 5, '12.971600') for i in range(3)]))
+        old.inbox.put(('release', ['shard-1'], 1))
+        old.inbox.put(('stop',))
+        old.run()
+        _, _, _, moved = old.outbox.get_nowait()
+
+        self.assertNotIn(bus_id, old_analyzer._windows)
+        new.control(('adopt', moved))
+        self.assertEqual(len(new_analyzer._windows[bus_id].fixes), 3)
+        self.assertIsNone(new.tracks[bus_id].window)
+        self.assertEqual(new.tracks[bus_id].accepted, 3)
+
+
+# ============================================
+# PRESENCE
+# ============================================
+
+@override_settings(**TEST_SETTINGS)
+class PresenceTests(TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.tracker = presence.PresenceTracker(
+            {'stale_s': 120, 'offline_s': 600, 'tick_s': 1.0}, clock=lambda: self.now)
+        patcher = mock.patch.object(presence, '_tracker', self.tracker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        cache.clear()
+        self.driver = make_driver()
+        Driver.objects.filter(pk=self.driver.pk).update(
+            last_location_update=timezone.now() - timedelta(hours=1))
+
+    def state(self):
+        entry = self.tracker._drivers.get(self.driver.pk)
+        return entry[1] if entry else presence.OFFLINE
+
+    def test_online_stale_offline_online(self):
+        presence.heartbeat(self.driver.pk)
+        self.assertEqual(self.state(), presence.ONLINE)
+
+        version = caching.get_version(caching.FLEET)
+        self.now += 121
+        presence.tick()
+        self.assertEqual(self.state(), presence.STALE)
+        self.assertNotEqual(caching.get_version(caching.FLEET), version)
+        self.assertTrue(Driver.objects.get(pk=self.driver.pk).is_available)
+
+        self.now += 480
+        presence.tick()
+        self.assertEqual(self.state(), presence.OFFLINE)
+        self.assertFalse(Driver.objects.get(pk=self.driver.pk).is_available)
+
+        presence.heartbeat(self.driver.pk)
+        self.assertEqual(self.state(), presence.ONLINE)
+        self.assertTrue(Driver.objects.get(pk=self.driver.pk).is_available)
+
+    def test_heartbeats_postpone_timeouts(self):
+        presence.heartbeat(self.driver.pk)
+        for _ in range(5):
+            self.now += 100
+            presence.heartbeat(self.driver.pk)
+        self.now += 100
+        presence.tick()
+        self.assertEqual(self.state(), presence.ONLINE)
+
+    def test_availability_set_by_admin_is_kept(self):
+        presence.heartbeat(self.driver.pk)
+        Driver.objects.filter(pk=self.driver.pk).update(is_available=False)
+        self.now += 601
+        presence.tick()
+        presence.heartbeat(self.driver.pk)
+        self.assertFalse(Driver.objects.get(pk=self.driver.pk).is_available)
+
+    def test_online_job_needs_the_offline_flag(self):
+        Driver.objects.filter(pk=self.driver.pk).update(is_available=False)
+        tasks.mark_driver_online(self.driver.pk)
+        self.assertFalse(Driver.objects.get(pk=self.driver.pk).is_available)
+
+        Driver.objects.filter(pk=self.driver.pk).update(is_available=True)
+        tasks.mark_driver_offline(self.driver.pk, 600)
+        tasks.mark_driver_online(self.driver.pk)
+        self.assertTrue(Driver.objects.get(pk=self.driver.pk).is_available)
+        # The flag is spent: a repeated job cannot undo a later admin change
+        Driver.objects.filter(pk=self.driver.pk).update(is_available=False)
+        tasks.mark_driver_online(self.driver.pk)
+        self.assertFalse(Driver.objects.get(pk=self.driver.pk).is_available)
+
+    def test_conditional_polls_fire_timeouts(self):
+        client = APIClient()
+        presence.heartbeat(self.driver.pk)
+        etag = client.get('/api/admin/buses/locations/')['ETag']
+        self.now += 121
+        self.assertEqual(client.get('/api/admin/buses/locations/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_classify(self):
+        cfg = {'stale_s': 120, 'offline_s': 600}
+        self.assertEqual([presence.classify(age, cfg) for age in (0, 119, 120, 599, 600)],
+                         [presence.ONLINE, presence.ONLINE, presence.STALE, presence.STALE, presence.OFFLINE])
+
+
+# ============================================
+# TIMETABLES
+# ============================================
+
+@override_settings(**TEST_SETTINGS)
+class TimetableTests(TestCase):
+    def setUp(self):
+        self.timetable = Timetable.objects.create(
+            route=make_route('Loop', ['A', 'B'], 15), bus=Bus.objects.create(bus_number='TT-1'),
+            driver=make_driver(), weekdays='0123456', start_time=dt_time(6, 0), end_time=dt_time(7, 0),
+            headway_minutes=10)
+
+    def test_rerun_creates_nothing(self):
+        start = date(2026, 6, 1)
+        self.assertEqual(timetables.generate_trips(start, start + timedelta(days=1), [self.timetable]), 12)
+        self.assertEqual(timetables.generate_trips(start, start + timedelta(days=1), [self.timetable]), 0)
+        self.assertEqual(timetables.generate_trips(start, start + timedelta(days=2), [self.timetable]), 6)
+        self.assertEqual(Trip.objects.filter(timetable=self.timetable).count(), 18)
+
+    def test_conflicting_rows_are_not_counted(self):
+        first = timezone.make_aware(datetime(2026, 6, 1, 6, 0))
+        Trip.objects.create(route=self.timetable.route, bus=self.timetable.bus, driver=self.timetable.driver,
+                            timetable=self.timetable, scheduled_time=first)
+        # As if a concurrent run inserted the first after the existing departures were read
+        trips = [Trip(route=self.timetable.route, bus=self.timetable.bus, driver=self.timetable.driver,
+                      timetable=self.timetable, scheduled_time=first + timedelta(minutes=10 * i)) for i in range(3)]
+        self.assertEqual(timetables._insert(self.timetable, trips), 2)
+        self.assertEqual(Trip.objects.filter(timetable=self.timetable).count(), 3)
+
+    def test_weekdays_and_validity(self):
+        self.timetable.weekdays = '0'
+        self.timetable.valid_until = date(2026, 6, 8)
+        departures = list(timetables.departures(self.timetable, date(2026, 6, 1), date(2026, 6, 30)))
+        # Mondays 1 and 8 June
+        self.assertEqual(len(departures), 12)
+        self.assertEqual({d.date() for d in departures}, {date(2026, 6, 1), date(2026, 6, 8)})
+        self.assertEqual(departures[0].time(), dt_time(6, 0))
@@ -0,0 +1,293 @@
+# api/traces.py
+
+"""
+Record and replay BusLocation streams.
+
+A trace file is a small header followed by one record per bus chunk:
+
+    file     b'CHTR' + version byte
+    record   uint8 bus-number length, bus number (utf-8),
+             uint32 payload length, payload = api.wire batch (<= 65535 fixes)
+
+Files ending in .gz are gzip-compressed. Replay merges all buses back into one
+timeline and re-sends each fix at its original offset (scaled by `speed`),
+either through the HTTP ingest endpoint or straight into api.ingest, and
+reports how far behind schedule each fix was stored. When history writes are
+deferred to the job queue or handed to ingest shards, "stored" means queued:
+the lag stops at the enqueue, not the insert (see lag_until in the summary).
+
+Replay never touches the buses in the trace: each is replayed onto its own
+synthetic 'replay-' bus and driver (replay_bus_number()), and replay_drivers()
+refuses a database holding real students or drivers unless allow_live is set,
+since the replayed fixes land in its BusLocation history stamped with the
+current time.
+
+Gaps between fixes are uint32 milliseconds on the wire, so one export spans
+at most MAX_SPAN (about 49.7 days).
+"""
+
+import gzip
+import heapq
+import queue
+import struct
+import threading
+import time
+import zlib
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection
+
+from . import jobs, shards, wire
+from .ingest import record_location
+from .loadgen import SYNTHETIC_PREFIXES, holds_real_data, percentile
+from .models import Bus, BusLocation, Driver
+
+MAGIC = b'CHTR'
+VERSION = 1
+LENGTH = struct.Struct('<I')
+
+REPLAY_PREFIX = SYNTHETIC_PREFIXES[1]
+# Bus.bus_number max_length
+BUS_NUMBER_LENGTH = 20
+
+MAX_SPAN = timedelta(milliseconds=0xFFFFFFFF)
+
+
+def _open(path, mode):
+    return gzip.open(path, mode) if str(path).endswith('.gz') else open(path, mode)
+
+
+# ============================================
+# RECORD
+# ============================================
+
+def export_trace(path, start, end, bus_numbers=None, chunk_size=5000):
+    """
+    Write every BusLocation with start <= timestamp < end to `path`.
+    Returns (buses, fixes) written.
+    """
+    if end <= start:
+        raise ValueError('end must be after start')
+    if end - start > MAX_SPAN:
+        raise ValueError(f'a trace spans at most {MAX_SPAN.days} days')
+    rows = (
+        BusLocation.objects.filter(timestamp__gte=start, timestamp__lt=end)
+        .order_by('bus_id', 'timestamp')
+        .values_list('bus__bus_number', 'latitude', 'longitude', 'speed', 'timestamp')
+    )
+    if bus_numbers:
+        rows = rows.filter(bus__bus_number__in=bus_numbers)
+
+    buses, fixes = set(), 0
+    with _open(path, 'wb') as out:
+        out.write(MAGIC + bytes([VERSION]))
+        current, pending = None, []
+        for bus_number, lat, lng, speed, ts in rows.iterator(chunk_size=chunk_size):
+            if bus_number != current or len(pending) == wire.MAX_FIXES:
+                _write_record(out, current, pending)
+                current, pending = bus_number, []
+            pending.append((lat, lng, speed, ts))
+            buses.add(bus_number)
+            fixes += 1
+        _write_record(out, current, pending)
+    return len(buses), fixes
+
+
+def _write_record(out, bus_number, fixes):
+    if not fixes:
+        return
+    name = bus_number.encode('utf-8')
+    payload = wire.encode(fixes)
+    out.write(bytes([len(name)]) + name + LENGTH.pack(len(payload)) + payload)
+
+
+def read_trace(path):
+    """Yield (bus_number, FixBatch) records from a trace file"""
+    with _open(path, 'rb') as fh:
+        if fh.read(5) != MAGIC + bytes([VERSION]):
+            raise ValueError(f'{path} is not a version {VERSION} trace file')
+        while True:
+            size = fh.read(1)
+            if not size:
+                return
+            bus_number = fh.read(size[0]).decode('utf-8')
+            (length,) = LENGTH.unpack(fh.read(LENGTH.size))
+            yield bus_number, wire.decode(fh.read(length))
+
+
+def timeline(path):
+    """
+    All fixes in time order as (ts_ms, bus_number, lat_micro, lng_micro, speed_tenths)
+    """
+    per_bus = {}
+    for bus_number, batch in read_trace(path):
+        per_bus.setdefault(bus_number, []).append(batch)
+
+    def fixes(bus_number, batches):
+        for batch in batches:
+            for ts, lat, lng, speed in zip(batch.timestamps, batch.lat, batch.lng, batch.speeds):
+                yield ts, bus_number, lat, lng, speed
+
+    return list(heapq.merge(*(fixes(b, batches) for b, batches in per_bus.items())))
+
+
+# ============================================
+# REPLAY
+# ============================================
+
+def replay_bus_number(bus_number):
+    """The synthetic bus that replays `bus_number`"""
+    name = f'{REPLAY_PREFIX}{bus_number}'
+    if len(name) > BUS_NUMBER_LENGTH:
+        name = f"{REPLAY_PREFIX}{zlib.crc32(bus_number.encode('utf-8')):08x}"
+    return name
+
+
+def replay_drivers(bus_numbers, allow_live=False):
+    """
+    Map the trace's bus numbers to the replay driver that will send their
+    fixes, creating the replay driver and bus on first use. Raises
+    RuntimeError when the database holds real users and not allow_live.
+    """
+    if not allow_live and holds_real_data():
+        raise RuntimeError(
+            f"Database '{connection.settings_dict['NAME']}' holds real students or drivers; "
+            "replaying into it needs allow_live=True")
+    drivers = {}
+    for bus_number in set(bus_numbers):
+        name = replay_bus_number(bus_number)
+        user, _ = User.objects.get_or_create(username=name)
+        driver, _ = Driver.objects.get_or_create(
+            user=user,
+            defaults={
+                'firebase_uid': name,
+                'driver_id': name,
+                'license_number': 'REPLAY',
+                'phone': '0',
+            },
+        )
+        Bus.objects.update_or_create(bus_number=name, defaults={'driver': driver, 'is_active': True})
+        drivers[bus_number] = driver
+    return drivers
+
+
+def ingest_sink(drivers):
+    """Store fixes through api.ingest, as the view would"""
+    def send(bus_number, lat, lng, speed):
+        record_location(
+            drivers[bus_number],
+            Decimal(lat).scaleb(-6),
+            Decimal(lng).scaleb(-6),
+            speed / 10,
+        )
+    return send
+
+
+def endpoint_sink(drivers):
+    """POST fixes to update_driver_location through the full request stack"""
+    from rest_framework.test import APIClient
+
+    local = threading.local()
+
+    def send(bus_number, lat, lng, speed):
+        clients = getattr(local, 'clients', None)
+        if clients is None:
+            clients = local.clients = {}
+        client = clients.get(bus_number)
+        if client is None:
+            client = clients[bus_number] = APIClient(SERVER_NAME='localhost')
+            client.force_authenticate(drivers[bus_number].user)
+        response = client.post('/api/driver/location/update/', {
+            'lat': f'{lat / 1e6:.6f}',
+            'lng': f'{lng / 1e6:.6f}',
+            'speed': speed / 10,
+        }, format='json')
+        if response.status_code >= 400:
+            raise RuntimeError(f'{response.status_code}: {response.content[:200]!r}')
+    return send
+
+
+def replay(events, send, speed=1.0, workers=4):
+    """
+    Re-send `events` (from timeline()) at `speed` x real time; speed=None
+    sends as fast as possible. Each bus always goes to the same worker so
+    its fixes stay in order. Returns a summary with end-to-end lag stats.
+    """
+    if not events:
+        return _summary(events, [], [], 0.0, 0)
+
+    queues = [queue.Queue(maxsize=10000) for _ in range(workers)]
+    lags, errors = [], []
+    lock = threading.Lock()
+
+    def work(q):
+        local_lags = []
+        while True:
+            item = q.get()
+            if item is None:
+                break
+            due, bus_number, lat, lng, spd = item
+            try:
+                send(bus_number, lat, lng, spd)
+            except Exception as exc:
+                with lock:
+                    errors.append(f'{bus_number}: {exc}')
+                continue
+            local_lags.append(time.perf_counter() - due)
+        connection.close()
+        with lock:
+            lags.extend(local_lags)
+
+    threads = [threading.Thread(target=work, args=(q,)) for q in queues]
+    for t in threads:
+        t.start()
+
+    first_ms = events[0][0]
+    started = time.perf_counter()
+    routing = {}
+    for ts, bus_number, lat, lng, spd in events:
+        if speed:
+            due = started + (ts - first_ms) / 1000 / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        else:
+            due = time.perf_counter()
+        index = routing.setdefault(bus_number, len(routing) % workers)
+        queues[index].put((due, bus_number, lat, lng, spd))
+
+    for q in queues:
+        q.put(None)
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    return _summary(events, lags, errors, elapsed, len(routing))
+
+
+def lag_until():
+    """Where a replayed fix's lag stops: 'insert', or 'enqueue' when history writes are handed off"""
+    if shards.enabled():
+        return 'enqueue (ingest shards)'
+    if jobs.config()['defer_history']:
+        return 'enqueue (deferred history)'
+    return 'insert'
+
+
+def _summary(events, lags, errors, elapsed, buses):
+    lags.sort()
+    return {
+        'fixes': len(events),
+        'buses': buses,
+        'errors': len(errors),
+        'sample_error': errors[0] if errors else None,
+        'trace_seconds': (events[-1][0] - events[0][0]) / 1000 if events else 0.0,
+        'wall_seconds': elapsed,
+        'fixes_per_second': len(lags) / elapsed if elapsed else 0.0,
+        'lag_p50_ms': percentile(lags, 50) * 1000,
+        'lag_p95_ms': percentile(lags, 95) * 1000,
+        'lag_p99_ms': percentile(lags, 99) * 1000,
+        'lag_max_ms': (lags[-1] if lags else 0.0) * 1000,
+        'lag_until': lag_until(),
+    }
@@ -17,6 +17,13 @@ urlpatterns = [
     path('student/booking/create/', views.create_booking, name='create_booking'),
     path('student/bookings/', views.get_student_bookings, name='get_student_bookings'),
     
+    # ============================================
+    # STOPS & ROUTES
+    # ============================================
+    path('stops/search/', views.search_stops, name='search_stops'),
+    path('routes/between/', views.get_routes_between, name='get_routes_between'),
+    path('routes/plan/', views.plan_journey, name='plan_journey'),
+    
     # ============================================
     # DRIVER ENDPOINTS
     # ============================================
@@ -28,4 +35,15 @@ urlpatterns = [
     # ============================================
     path('admin/buses/locations/', views.get_all_bus_locations, name='get_all_bus_locations'),
     path('admin/bookings/pending/', views.get_pending_bookings, name='get_pending_bookings'),
+    path('admin/analytics/<str:scope>/', views.get_fleet_kpis, name='get_fleet_kpis'),
+    path('admin/export/<slug:dataset>.<slug:fmt>', views.export_data, name='export_data'),
+    path('admin/heatmap/<str:layer>/<int:z>/<int:x>/<int:y>/', views.get_heatmap_tile, name='get_heatmap_tile'),
+    
+    # ============================================
+    # MONITORING
+    # ============================================
+    path('metrics/', views.metrics_endpoint, name='metrics'),
+    path('admin/snapshots/', views.get_snapshot_stats, name='get_snapshot_stats'),
+    path('admin/profile/', views.profile_worker, name='profile_worker'),
+    path('admin/profile/<str:profile_id>/', views.get_request_profile, name='get_request_profile'),
 ]
\ No newline at end of file
@@ -1,12 +1,37 @@
 # api/views.py - COMPLETE VERSION
 
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated, AllowAny
+import hmac
+import logging
+import math
+
+from rest_framework.decorators import api_view, parser_classes, permission_classes, renderer_classes
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.permissions import IsAdminUser, IsAuthenticated, AllowAny
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 from rest_framework import status
-from datetime import datetime
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.db.models import OuterRef, Subquery
+from django.http import HttpResponse, StreamingHttpResponse
 from django.utils import timezone
-from .models import Student, Driver, BusLocation, Bus, Booking
+from django.utils.dateparse import parse_datetime
+from .models import Student, Driver, BusLocation, Bus, Booking, Route
+from . import analytics, caching, export, heatmap, metrics, mirror, pingrate, planner, presence, profiling, snapshots, stops
+from .eventlog import log_event
+from .ingest import record_batch, record_location
+from .parsers import FixBatchParser
+from .renderers import FastJSONRenderer, rows_to_dicts, wants_columns
+
+# Renderers for the high-volume read endpoints
+FAST_RENDERERS = [FastJSONRenderer, BrowsableAPIRenderer]
+
+# Location ingest also accepts the compact binary format from api/wire.py
+LOCATION_PARSERS = [JSONParser, FormParser, MultiPartParser, FixBatchParser]
+
+STUDENT_BOOKING_COLUMNS = ('id', 'source', 'destination', 'pickup_time', 'status', 'created_at')
+PENDING_BOOKING_COLUMNS = ('id', 'student_id', 'source', 'destination', 'pickup_time', 'created_at')
+FLEET_COLUMNS = ('bus_number', 'latitude', 'longitude', 'speed', 'timestamp', 'driver', 'presence')
 
 # ============================================
 # TEST ENDPOINTS
@@ -90,13 +115,10 @@ def create_booking(request):
     """Create a new bus booking request"""
     user = request.user
     
-    print(f"📝 Booking request from user: {user.username} ({user.email})")
-    
     try:
         student = Student.objects.get(user=user)
-        print(f"✅ Student found: {student.student_id}")
     except Student.DoesNotExist:
-        print(f"❌ Student not found for user: {user.username}")
+        log_event('booking.student_missing', logging.WARNING, user=user.username)
         return Response({
             'error': 'User is not registered as a student. Please complete student registration first.'
         }, status=status.HTTP_403_FORBIDDEN)
@@ -105,8 +127,6 @@ def create_booking(request):
     destination = request.data.get('destination')
     pickup_time = request.data.get('pickup_time')  # ISO format datetime
     
-    print(f"📍 Booking details: {source} → {destination} at {pickup_time}")
-    
     if not all([source, destination, pickup_time]):
         return Response({
             'error': 'Missing required fields: source, destination, pickup_time'
@@ -120,6 +140,14 @@ def create_booking(request):
             'error': 'Invalid pickup_time format. Use ISO format.'
         }, status=status.HTTP_400_BAD_REQUEST)
     
+    # Store catalogued stops under their canonical name; unknown ones as typed
+    catalog = stops.get_catalog()
+    source_stop, destination_stop = catalog.resolve(source), catalog.resolve(destination)
+    if source_stop is not None:
+        source = source_stop.name
+    if destination_stop is not None:
+        destination = destination_stop.name
+    
     booking = Booking.objects.create(
         student=student,
         source=source,
@@ -128,7 +156,14 @@ def create_booking(request):
         status='pending'
     )
     
-    print(f"✅ Booking created: #{booking.id}")
+    log_event(
+        'booking.created',
+        booking_id=booking.id,
+        student_id=student.student_id,
+        source=source,
+        destination=destination,
+        pickup_time=pickup_time,
+    )
     
     return Response({
         'message': 'Booking created successfully',
@@ -138,12 +173,15 @@ def create_booking(request):
             'destination': booking.destination,
             'pickup_time': booking.pickup_time.isoformat(),
             'status': booking.status,
-        }
+        },
+        'routes': sorted(catalog.routes_between(source, destination)),
     }, status=status.HTTP_201_CREATED)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@renderer_classes(FAST_RENDERERS)
+@caching.versioned_response(lambda request: caching.student_scope(request.user.pk))
 def get_student_bookings(request):
     """Get all bookings for the current student"""
     user = request.user
@@ -155,16 +193,12 @@ def get_student_bookings(request):
             'error': 'User is not registered as a student'
         }, status=status.HTTP_403_FORBIDDEN)
     
-    bookings = Booking.objects.filter(student=student).order_by('-created_at')
-    
-    bookings_data = [{
-        'id': b.id,
-        'source': b.source,
-        'destination': b.destination,
-        'pickup_time': b.pickup_time.isoformat(),
-        'status': b.status,
-        'created_at': b.created_at.isoformat(),
-    } for b in bookings]
+    bookings = (
+        Booking.objects.filter(student=student)
+        .order_by('-created_at')
+        .values_list(*STUDENT_BOOKING_COLUMNS)
+    )
+    bookings_data = rows_to_dicts(STUDENT_BOOKING_COLUMNS, bookings)
     
     return Response({
         'bookings': bookings_data,
@@ -172,14 +206,110 @@ def get_student_bookings(request):
     })
 
 
+# ============================================
+# STOPS & ROUTES
+# ============================================
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@renderer_classes(FAST_RENDERERS)
+@caching.versioned_response(caching.ROUTES)
+def search_stops(request):
+    """Stop name autocomplete: ?q=<text>[&limit=10], prefix matches then fuzzy ones"""
+    query = request.query_params.get('q', '')
+    try:
+        limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+    except ValueError:
+        return Response({'error': 'limit must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    matches = [stop.as_dict() for stop in stops.get_catalog().suggest(query, limit)]
+    return Response({
+        'stops': matches,
+        'count': len(matches),
+    })
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@renderer_classes(FAST_RENDERERS)
+@caching.versioned_response(caching.ROUTES)
+def get_routes_between(request):
+    """Active routes that stop at ?from=<stop> and later at ?to=<stop>"""
+    source = request.query_params.get('from', '')
+    destination = request.query_params.get('to', '')
+    if not source or not destination:
+        return Response({
+            'error': 'Missing required parameters: from, to'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    route_ids = stops.get_catalog().routes_between(source, destination)
+    routes = list(
+        Route.objects.filter(pk__in=route_ids)
+        .order_by('name')
+        .values('id', 'name', 'source', 'destination', 'estimated_duration')
+    ) if route_ids else []
+    return Response({
+        'routes': routes,
+        'count': len(routes),
+    })
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@renderer_classes(FAST_RENDERERS)
+def plan_journey(request):
+    """
+    Journeys from ?from=<stop> to ?to=<stop> leaving at ?depart=<ISO time> (default now,
+    at most an hour back or 12 hours ahead), with up to ?max_transfers= changes (default 2). The fastest journey comes first,
+    followed by slower ones only when they need fewer changes.
+    """
+    source = request.query_params.get('from', '')
+    destination = request.query_params.get('to', '')
+    if not source or not destination:
+        return Response({
+            'error': 'Missing required parameters: from, to'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    depart_at = timezone.now()
+    if request.query_params.get('depart'):
+        depart_at = parse_datetime(request.query_params['depart'])
+        if depart_at is None:
+            return Response({'error': 'depart must be an ISO 8601 datetime'}, status=status.HTTP_400_BAD_REQUEST)
+        if timezone.is_naive(depart_at):
+            depart_at = timezone.make_aware(depart_at)
+    try:
+        max_transfers = min(max(int(request.query_params.get('max_transfers', 2)), 0), 4)
+    except ValueError:
+        return Response({'error': 'max_transfers must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        journeys = planner.plan(source, destination, depart_at, max_transfers)
+    except ValueError as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({
+        'journeys': [{
+            'legs': legs,
+            'transfers': len(legs) - 1,
+            'depart': legs[0]['depart'],
+            'arrive': legs[-1]['arrive'],
+        } for legs in reversed(journeys)],
+        'count': len(journeys),
+    })
+
+
 # ============================================
 # DRIVER ENDPOINTS
 # ============================================
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@parser_classes(LOCATION_PARSERS)
 def update_driver_location(request):
-    """Receive and store driver's GPS location (AUTHENTICATED)"""
+    """
+    Receive and store driver's GPS location (AUTHENTICATED).
+    The reply carries next_ping_ms (also as X-Next-Ping-Ms): when to send the next fix,
+    and mirrored: whether the server keeps Firestore driver_locations up to date.
+    """
     user = request.user
     
     # Check if user is a driver
@@ -190,6 +320,9 @@ def update_driver_location(request):
             'error': 'User is not registered as a driver'
         }, status=status.HTTP_403_FORBIDDEN)
     
+    if request.content_type.startswith(FixBatchParser.media_type):
+        return _store_location_batch(driver, request.data)
+    
     latitude = request.data.get('lat')
     longitude = request.data.get('lng')
     speed = request.data.get('speed', 0)
@@ -199,46 +332,70 @@ def update_driver_location(request):
             'error': 'Missing latitude or longitude'
         }, status=status.HTTP_400_BAD_REQUEST)
     
-    # Update driver's current location
-    driver.current_latitude = latitude
-    driver.current_longitude = longitude
-    driver.last_location_update = timezone.now()
-    driver.save()
+    bus, location = record_location(driver, latitude, longitude, speed)
+    next_ping = pingrate.next_ping_ms(bus, latitude, longitude, speed)
     
-    # Get driver's assigned bus
-    try:
-        bus = Bus.objects.get(driver=driver, is_active=True)
-        
-        # Save location history
-        location = BusLocation.objects.create(
-            bus=bus,
-            latitude=latitude,
-            longitude=longitude,
-            speed=speed
-        )
-        
-        print(f"📍 Location saved: Bus {bus.bus_number} at ({latitude}, {longitude})")
-        
-        return Response({
-            'message': 'Location updated successfully',
-            'data': {
-                'bus_number': bus.bus_number,
-                'latitude': str(location.latitude),
-                'longitude': str(location.longitude),
-                'timestamp': location.timestamp.isoformat()
-            }
-        }, status=status.HTTP_201_CREATED)
-        
-    except Bus.DoesNotExist:
+    if bus is None:
         # If no bus assigned, still save driver location
-        print(f"📍 Driver location updated (no bus assigned): ({latitude}, {longitude})")
-        return Response({
+        log_event('location.no_bus', driver_id=driver.driver_id, lat=latitude, lng=longitude)
+        return _with_next_ping(Response({
             'message': 'Driver location updated (no bus assigned)',
             'data': {
                 'latitude': str(latitude),
                 'longitude': str(longitude),
-            }
-        }, status=status.HTTP_200_OK)
+            },
+            'next_ping_ms': next_ping,
+            'mirrored': mirror.enabled(),
+        }, status=status.HTTP_200_OK), next_ping)
+    
+    log_event('location.saved', bus=bus.bus_number, lat=latitude, lng=longitude)
+    
+    return _with_next_ping(Response({
+        'message': 'Location updated successfully',
+        'data': {
+            'bus_number': bus.bus_number,
+            'latitude': str(location.latitude),
+            'longitude': str(location.longitude),
+            'timestamp': location.timestamp.isoformat()
+        },
+        'next_ping_ms': next_ping,
+        'mirrored': mirror.enabled(),
+    }, status=status.HTTP_201_CREATED), next_ping)
+
+
+def _with_next_ping(response, next_ping):
+    response['X-Next-Ping-Ms'] = str(next_ping)
+    return response
+
+
+def _store_location_batch(driver, batch):
+    """Store a binary FixBatch and answer with the latest fix"""
+    bus, locations = record_batch(driver, batch)
+    latitude, longitude, speed, timestamp = batch.last()
+    next_ping = pingrate.next_ping_ms(bus, latitude, longitude, speed)
+    
+    data = {
+        'count': len(batch),
+        'latitude': str(latitude),
+        'longitude': str(longitude),
+        'timestamp': timestamp.isoformat(),
+    }
+    if bus is None:
+        return _with_next_ping(Response({
+            'message': 'Driver location updated (no bus assigned)',
+            'data': data,
+            'next_ping_ms': next_ping,
+            'mirrored': mirror.enabled(),
+        }, status=status.HTTP_200_OK), next_ping)
+    
+    log_event('location.batch_saved', bus=bus.bus_number, count=len(locations))
+    
+    return _with_next_ping(Response({
+        'message': 'Locations updated successfully',
+        'data': dict(data, bus_number=bus.bus_number),
+        'next_ping_ms': next_ping,
+        'mirrored': mirror.enabled(),
+    }, status=status.HTTP_201_CREATED), next_ping)
 
 
 @api_view(['POST'])
@@ -249,7 +406,7 @@ def driver_location_public(request):
     lat = request.data.get('lat')
     lng = request.data.get('lng')
     
-    print(f"📍 PUBLIC: Received location from driver {driver_id}: ({lat}, {lng})")
+    log_event('location.public', driver_id=driver_id, lat=lat, lng=lng)
     
     return Response({
         'message': '✅ Location received successfully',
@@ -266,49 +423,270 @@ def driver_location_public(request):
 # ADMIN ENDPOINTS
 # ============================================
 
+def fleet_rows(states=presence.STATES):
+    """
+    Latest location of every active bus as FLEET_COLUMNS tuples (one query),
+    keeping buses whose presence (from the age of that fix) is in `states`
+    """
+    latest = BusLocation.objects.filter(bus=OuterRef('pk')).order_by('-timestamp')
+    latest_ids = (
+        Bus.objects.filter(is_active=True)
+        .annotate(latest_id=Subquery(latest.values('pk')[:1]))
+        .values('latest_id')
+    )
+    rows = (
+        BusLocation.objects.filter(pk__in=latest_ids)
+        .order_by('bus_id')
+        .values_list(
+            'bus__bus_number',
+            'latitude',
+            'longitude',
+            'speed',
+            'timestamp',
+            'bus__driver__driver_id',
+        )
+    )
+    now = timezone.now()
+    cfg = presence.config()
+    fleet = []
+    for row in rows:
+        state = presence.classify((now - row[4]).total_seconds(), cfg)
+        if state in states:
+            fleet.append(row + (state,))
+    return fleet
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@renderer_classes(FAST_RENDERERS)
+@pingrate.tracks_fleet_interest
+@presence.ticks_on_read
+@snapshots.published(caching.FLEET)
 def get_all_bus_locations(request):
-    """Get latest location of all active buses"""
-    buses = Bus.objects.filter(is_active=True)
-    
-    locations_data = []
-    for bus in buses:
-        latest_location = BusLocation.objects.filter(bus=bus).order_by('-timestamp').first()
-        
-        if latest_location:
-            locations_data.append({
-                'bus_number': bus.bus_number,
-                'latitude': str(latest_location.latitude),
-                'longitude': str(latest_location.longitude),
-                'speed': latest_location.speed,
-                'timestamp': latest_location.timestamp.isoformat(),
-                'driver': bus.driver.driver_id if bus.driver else None,
-            })
+    """
+    Get latest location of all active buses.
+    ?presence=online,stale (the default) filters by presence; ?presence=all keeps offline buses too.
+    Rendered once per fleet change or SNAPSHOT_TICK_S and shared by all pollers (api/snapshots.py).
+    """
+    requested = request.query_params.get('presence', 'online,stale')
+    states = presence.STATES if requested == 'all' else tuple(requested.split(','))
+    if not set(states) <= set(presence.STATES):
+        return Response({
+            'error': f"presence must be 'all' or a list of {', '.join(presence.STATES)}"
+        }, status=status.HTTP_400_BAD_REQUEST)
+    rows = fleet_rows(states)
+    
+    # ?layout=columns returns [[...], ...] rows plus one column list for the fleet map
+    if wants_columns(request):
+        return Response({
+            'columns': FLEET_COLUMNS,
+            'buses': rows,
+            'count': len(rows),
+            'timestamp': datetime.now(),
+        })
     
     return Response({
-        'buses': locations_data,
-        'count': len(locations_data),
-        'timestamp': datetime.now().isoformat()
+        'buses': rows_to_dicts(FLEET_COLUMNS, rows),
+        'count': len(rows),
+        'timestamp': datetime.now(),
     })
 
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@renderer_classes(FAST_RENDERERS)
+@caching.versioned_response(caching.BOOKINGS)
 def get_pending_bookings(request):
     """Get all pending bookings (for admin to assign)"""
-    bookings = Booking.objects.filter(status='pending').order_by('pickup_time')
-    
-    bookings_data = [{
-        'id': b.id,
-        'student_id': b.student.student_id,
-        'source': b.source,
-        'destination': b.destination,
-        'pickup_time': b.pickup_time.isoformat(),
-        'created_at': b.created_at.isoformat(),
-    } for b in bookings]
+    bookings = (
+        Booking.objects.filter(status='pending')
+        .order_by('pickup_time')
+        .values_list('id', 'student__student_id', 'source', 'destination', 'pickup_time', 'created_at')
+    )
+    bookings_data = rows_to_dicts(PENDING_BOOKING_COLUMNS, bookings)
     
     return Response({
         'bookings': bookings_data,
         'count': len(bookings_data)
-    })
\ No newline at end of file
+    })
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@renderer_classes(FAST_RENDERERS)
+def get_heatmap_tile(request, layer, z, x, y):
+    """
+    Demand heatmap tile (layer: pickups, dropoffs or buses) as sparse
+    [cell index, count] pairs, cell index = row * size + column.
+    ?hours=N (default 24) or ?from=&to= (ISO) picks the time range; for
+    pickups and dropoffs, binned by pickup time, `to` can be in the future.
+    ?layout=dense returns all size * size counts instead.
+    """
+    store = heatmap.get_store()
+    cfg = store.cfg
+    if layer not in heatmap.LAYERS:
+        return Response({'error': f'Unknown layer {layer!r}'}, status=status.HTTP_404_NOT_FOUND)
+    if not cfg['min_zoom'] <= z <= cfg['max_zoom']:
+        return Response({
+            'error': f"Zoom must be between {cfg['min_zoom']} and {cfg['max_zoom']}"
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        if 'from' in request.query_params:
+            start = parse_datetime(request.query_params['from'])
+            end = parse_datetime(request.query_params.get('to', '')) or timezone.now()
+            if start is None or end < start:
+                raise ValueError
+        else:
+            hours = float(request.query_params.get('hours', 24))
+            if not 0 < hours < math.inf:
+                raise ValueError
+            end = timezone.now()
+            # The store holds history_s at most; clamping first keeps timedelta in range
+            start = end - timedelta(hours=min(hours, cfg['history_s'] / 3600))
+    except (TypeError, ValueError):
+        return Response({'error': 'Invalid time range'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    store.request_refresh()
+    start, end = store.clamp(layer, start, end)
+    first, last = store.window_of(start.timestamp()), store.window_of(end.timestamp())
+    etag = f'W/"heatmap-{layer}-{store.version(layer)}-{first}-{last}-{caching.variant(request)}"'
+    if caching.etag_matches(request, etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    
+    cells = store.tile(layer, z, x, y, first, last)
+    data = {
+        'layer': layer,
+        'z': z,
+        'x': x,
+        'y': y,
+        'size': heatmap.TILE_SIZE,
+        'from': start,
+        'to': end,
+        'max': max(cells.values(), default=0),
+        'total': sum(cells.values()),
+    }
+    if request.query_params.get('layout') == 'dense':
+        counts = [0] * (heatmap.TILE_SIZE * heatmap.TILE_SIZE)
+        for index, count in cells.items():
+            counts[index] = count
+        data['counts'] = counts
+    else:
+        data['cells'] = sorted(cells.items())
+    return Response(data, headers={'ETag': etag})
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@renderer_classes(FAST_RENDERERS)
+@caching.versioned_response(analytics.ANALYTICS)
+def get_fleet_kpis(request, scope):
+    """On-time %, utilization, distance and idle time per route or per bus"""
+    if scope not in ('route', 'bus'):
+        return Response({'error': 'Scope must be route or bus'}, status=status.HTTP_404_NOT_FOUND)
+    rows = analytics.kpi_rows(scope)
+    return Response({
+        'scope': scope,
+        'kpis': rows,
+        'count': len(rows),
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_data(request, dataset, fmt):
+    """
+    Stream bookings, trips or locations as CSV or NDJSON
+    (/admin/export/<dataset>.csv or .ndjson), optionally limited to
+    ?from=&to= (ISO datetimes, or dates: a 'to' date includes that whole day;
+    values without an offset are in the server's time zone)
+    """
+    if dataset not in export.DATASETS:
+        return Response({'error': f'Unknown dataset {dataset!r}'}, status=status.HTTP_404_NOT_FOUND)
+    if fmt not in export.FORMATS:
+        return Response({'error': 'Format must be csv or ndjson'}, status=status.HTTP_404_NOT_FOUND)
+    
+    bounds = []
+    for param in ('from', 'to'):
+        value = request.query_params.get(param)
+        try:
+            bounds.append(export.parse_bound(value, param == 'to') if value else None)
+        except ValueError:
+            return Response({'error': f'Invalid {param!r} datetime'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    response = StreamingHttpResponse(export.stream(dataset, fmt, *bounds), content_type=export.FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{dataset}.{fmt}"'
+    return response
+
+
+# ============================================
+# MONITORING
+# ============================================
+
+LOOPBACK_ADDRS = ('127.0.0.1', '::1')
+
+
+def _metrics_allowed(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        return hmac.compare_digest(header.encode('latin-1', 'replace'), f'Bearer {token}'.encode())
+    # No token: a scraper on this host (not a request relayed by a local proxy) or a staff session
+    local = (request.META.get('REMOTE_ADDR') in LOOPBACK_ADDRS
+             and 'HTTP_X_FORWARDED_FOR' not in request.META and 'HTTP_X_REAL_IP' not in request.META)
+    return local or request.user.is_staff
+
+
+def metrics_endpoint(request):
+    """Prometheus text exposition of this worker's metrics"""
+    if not _metrics_allowed(request):
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def get_snapshot_stats(request):
+    """Live shared response snapshots with their age, sizes per encoding and requests served"""
+    snapshot_list = snapshots.publisher.stats()
+    return Response({
+        'snapshots': snapshot_list,
+        'count': len(snapshot_list),
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def profile_worker(request):
+    """
+    Sample every thread of the worker serving this request for ?seconds= (default 5)
+    every ?interval_ms= (default PROFILING interval_ms). Collapsed stacks as text
+    (flamegraph.pl / speedscope), or ?output=json.
+    """
+    cfg = profiling.config()
+    try:
+        seconds = float(request.query_params.get('seconds', 5))
+        interval_ms = float(request.query_params.get('interval_ms', cfg['interval_ms']))
+    except ValueError:
+        return Response({'error': 'seconds and interval_ms must be numbers'}, status=status.HTTP_400_BAD_REQUEST)
+    if not 0 < seconds <= cfg['max_seconds'] or not 1 <= interval_ms <= 1000:
+        return Response({
+            'error': f"seconds must be in (0, {cfg['max_seconds']}] and interval_ms in [1, 1000]"
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    sampler = profiling.profile_worker(seconds, interval_ms / 1000)
+    if sampler is None:
+        return Response({'error': 'A profile is already running in this worker'}, status=status.HTTP_409_CONFLICT)
+    if request.query_params.get('output') == 'json':
+        return Response(sampler.as_dict())
+    return HttpResponse(sampler.collapsed(), content_type='text/plain; charset=utf-8')
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def get_request_profile(request, profile_id):
+    """Collapsed stacks of a request profiled with the X-Profile header"""
+    stacks = profiling.load_request_profile(profile_id)
+    if stacks is None:
+        return Response({'error': 'Profile not found or expired'}, status=status.HTTP_404_NOT_FOUND)
+    return HttpResponse(stacks, content_type='text/plain; charset=utf-8')
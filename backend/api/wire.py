@@ -0,0 +1,185 @@
+# api/wire.py
+
+"""
+Compact binary encoding for driver location fixes.
+
+A message carries a batch of one or more fixes from one driver, laid out
+column by column so a batch decodes with a handful of memcpy-style
+array.frombytes() calls instead of per-field parsing:
+
+    header   <4s B B H q   magic b'CHFX', version, flags, count, base time (ms since epoch)
+    lat      int32[count]  latitude in micro-degrees
+    lng      int32[count]  longitude in micro-degrees
+    dt       uint32[count] ms since the previous fix (first fix: since base time)
+    dspeed   int16[count]  speed change from the previous fix in 0.1 km/h (first fix: from 0)
+
+All values are little-endian. Given the server time, decode() also rejects
+fixes timed more than MAX_AGE_MS before or MAX_AHEAD_MS after it: a phone
+with a wrong clock would otherwise pin its bus as the latest fix on the
+fleet map.
+"""
+
+import struct
+import sys
+from array import array
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from itertools import accumulate
+
+MEDIA_TYPE = 'application/x-campushub-fixes'
+MAGIC = b'CHFX'
+VERSION = 1
+
+HEADER = struct.Struct('<4sBBHq')
+# bytes per fix across the four columns
+FIX_SIZE = 4 + 4 + 4 + 2
+MAX_FIXES = 0xFFFF
+# Valid coordinate ranges in micro-degrees
+MAX_LAT = 90_000_000
+MAX_LNG = 180_000_000
+# Last ms datetime can represent (9999-12-31)
+MAX_EPOCH_MS = 253_402_300_799_999
+# Fixes may be this old (batches queued while offline) or this far ahead (clock skew)
+MAX_AGE_MS = 7 * 24 * 3600 * 1000
+MAX_AHEAD_MS = 5 * 60 * 1000
+
+_BIG_ENDIAN = sys.byteorder == 'big'
+
+
+def _column(typecode, buf, offset, count):
+    col = array(typecode)
+    col.frombytes(buf[offset:offset + count * col.itemsize])
+    if _BIG_ENDIAN:
+        col.byteswap()
+    return col, offset + count * col.itemsize
+
+
+def _micro(value):
+    return int(round(float(value) * 1_000_000))
+
+
+def _epoch_ms(value):
+    if isinstance(value, datetime):
+        return int(round(value.timestamp() * 1000))
+    return int(value)
+
+
+class FixBatch:
+    """
+    Decoded batch of fixes, kept as typed columns.
+
+    lat/lng are micro-degree ints, timestamps are ms since epoch and speeds are
+    in 0.1 km/h, so nothing is converted until a caller asks for it.
+    """
+
+    def __init__(self, lat, lng, timestamps, speeds):
+        self.lat = lat
+        self.lng = lng
+        self.timestamps = timestamps
+        self.speeds = speeds
+
+    def __len__(self):
+        return len(self.lat)
+
+    def __iter__(self):
+        """Yield (latitude, longitude, speed, timestamp) ready for the models"""
+        for lat, lng, speed, ts in zip(self.lat, self.lng, self.speeds, self.timestamps):
+            yield (
+                Decimal(lat).scaleb(-6),
+                Decimal(lng).scaleb(-6),
+                speed / 10,
+                datetime.fromtimestamp(ts / 1000, tz=dt_timezone.utc),
+            )
+
+    def last(self):
+        """The most recent fix in the batch, in the same shape as __iter__"""
+        i = len(self) - 1
+        return (
+            Decimal(self.lat[i]).scaleb(-6),
+            Decimal(self.lng[i]).scaleb(-6),
+            self.speeds[i] / 10,
+            datetime.fromtimestamp(self.timestamps[i] / 1000, tz=dt_timezone.utc),
+        )
+
+
+def decode(buf, now_ms=None):
+    """
+    Decode a binary message into a FixBatch. Raises ValueError if malformed,
+    or with `now_ms` (ms since epoch) if a fix is outside the accepted window
+    around it.
+    """
+    buf = memoryview(buf)
+    if len(buf) < HEADER.size:
+        raise ValueError('Truncated header')
+
+    magic, version, _flags, count, base_ms = HEADER.unpack_from(buf)
+    if magic != MAGIC:
+        raise ValueError('Bad magic')
+    if version != VERSION:
+        raise ValueError(f'Unsupported version {version}')
+    if count == 0:
+        raise ValueError('Empty batch')
+    if len(buf) != HEADER.size + count * FIX_SIZE:
+        raise ValueError('Length does not match fix count')
+
+    offset = HEADER.size
+    lat, offset = _column('i', buf, offset, count)
+    lng, offset = _column('i', buf, offset, count)
+    dt, offset = _column('I', buf, offset, count)
+    dspeed, offset = _column('h', buf, offset, count)
+
+    # int32 micro-degrees reach about +-2147 degrees; the models hold +-999
+    if min(lat) < -MAX_LAT or max(lat) > MAX_LAT:
+        raise ValueError('Latitude out of range')
+    if min(lng) < -MAX_LNG or max(lng) > MAX_LNG:
+        raise ValueError('Longitude out of range')
+
+    # dt is unsigned, so the fixes run from first_ms to last_ms in order
+    first_ms, last_ms = base_ms + dt[0], base_ms + sum(dt)
+    if base_ms < 0 or last_ms > MAX_EPOCH_MS:
+        raise ValueError('Timestamp out of range')
+    if now_ms is not None and (first_ms < now_ms - MAX_AGE_MS or last_ms > now_ms + MAX_AHEAD_MS):
+        raise ValueError('Timestamp outside the accepted window')
+
+    timestamps = array('q', accumulate(dt, initial=base_ms))[1:]
+    speeds = array('i', accumulate(dspeed))
+    return FixBatch(lat, lng, timestamps, speeds)
+
+
+def encode(fixes, base_time=None):
+    """
+    Encode (lat, lng, speed, timestamp) fixes, oldest first.
+
+    Coordinates may be floats, strings or Decimals; speed is km/h; timestamps
+    are datetimes or ms since epoch.
+    """
+    fixes = list(fixes)
+    if not fixes:
+        raise ValueError('Empty batch')
+    if len(fixes) > MAX_FIXES:
+        raise ValueError(f'At most {MAX_FIXES} fixes per batch')
+
+    times = [_epoch_ms(f[3]) for f in fixes]
+    base_ms = _epoch_ms(base_time) if base_time is not None else times[0]
+
+    lat = array('i', (_micro(f[0]) for f in fixes))
+    lng = array('i', (_micro(f[1]) for f in fixes))
+    dt = array('I')
+    dspeed = array('h')
+    prev_ms, prev_speed = base_ms, 0
+    for fix, ts in zip(fixes, times):
+        if ts < prev_ms:
+            raise ValueError('Fixes must be in time order')
+        speed = int(round(float(fix[2] or 0) * 10))
+        dt.append(ts - prev_ms)
+        dspeed.append(speed - prev_speed)
+        prev_ms, prev_speed = ts, speed
+
+    columns = [lat, lng, dt, dspeed]
+    if _BIG_ENDIAN:
+        for col in columns:
+            col.byteswap()
+
+    return HEADER.pack(MAGIC, VERSION, 0, len(fixes), base_ms) + b''.join(
+        col.tobytes() for col in columns
+    )
@@ -0,0 +1,96 @@
+# api/write_queue.py
+
+"""
+Single-writer queue for SQLite.
+
+SQLite allows one writer at a time. With many request threads writing,
+each one fights for the lock and some give up with "database is locked".
+When settings.SQLITE_WRITE_QUEUE is on, writes are handed to one writer
+thread instead. It drains whatever is queued and commits it as a single
+transaction, giving each job its own savepoint. Reads keep running in
+parallel on the request threads (WAL mode).
+
+When the queue is off, run() simply calls the function inline.
+"""
+
+import queue
+import threading
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+# Upper bound on jobs committed together in one transaction
+MAX_GROUP = 256
+
+
+class SingleWriter:
+    def __init__(self, max_group=MAX_GROUP):
+        self.max_group = max_group
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='sqlite-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, func, *args, **kwargs):
+        """Queue func(*args, **kwargs) for the writer thread; returns a Future"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((future, func, args, kwargs))
+        return future
+
+    def run(self, func, *args, **kwargs):
+        """Run a write through the queue and wait for its result"""
+        return self.submit(func, *args, **kwargs).result()
+
+    def _next_group(self):
+        group = [self._queue.get()]
+        while len(group) < self.max_group:
+            try:
+                group.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return group
+
+    def _loop(self):
+        while True:
+            group = self._next_group()
+            close_old_connections()
+            results = []
+            try:
+                with transaction.atomic():
+                    for future, func, args, kwargs in group:
+                        if not future.set_running_or_notify_cancel():
+                            continue
+                        try:
+                            with transaction.atomic():
+                                results.append((future, func(*args, **kwargs), None))
+                        except Exception as exc:
+                            results.append((future, None, exc))
+            except Exception as exc:
+                # The commit itself failed, so none of the group's writes landed
+                connection.close_if_unusable_or_obsolete()
+                results = [(future, None, exc) for future, _, _, _ in group if future.running()]
+
+            for future, result, exc in results:
+                if exc is not None:
+                    future.set_exception(exc)
+                else:
+                    future.set_result(result)
+
+
+writer = SingleWriter()
+
+
+def run(func, *args, **kwargs):
+    """Run a database write, serialized through the writer thread when enabled"""
+    if getattr(settings, 'SQLITE_WRITE_QUEUE', False):
+        return writer.run(func, *args, **kwargs)
+    return func(*args, **kwargs)
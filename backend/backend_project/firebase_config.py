@@ -1,19 +1,103 @@
-import firebase_admin
-from firebase_admin import credentials, auth
+"""
+Firebase Admin integration, initialized lazily.
+
+Nothing here touches firebase_admin or the service-account file at import
+time; the app is created on the first token verification or Firestore call.
+Token verification is pluggable through settings.FIREBASE_TOKEN_VERIFIER:
+
+    FirebaseAdminVerifier   verifies real Firebase ID tokens (default)
+    LocalTokenVerifier      accepts "local:<uid>[:<email>]" tokens, for tests
+                            and local development without credentials
+"""
+
+import logging
+import threading
+
 from django.conf import settings
-import os
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_app = None
+_firestore = None
+_verifier = None
+
+
+def get_app():
+    """The Firebase Admin app, initialized on first use"""
+    global _app
+    if _app is None:
+        with _lock:
+            if _app is None:
+                import firebase_admin
+                from firebase_admin import credentials
+
+                if firebase_admin._apps:
+                    _app = firebase_admin.get_app()
+                else:
+                    cred = credentials.Certificate(settings.FIREBASE_SERVICE_ACCOUNT_KEY)
+                    _app = firebase_admin.initialize_app(cred)
+                    logger.info("Firebase Admin SDK initialized")
+    return _app
+
+
+def get_firestore():
+    """Firestore client, created on first use"""
+    global _firestore
+    if _firestore is None:
+        # Outside _lock: get_app() takes it too, and it is not reentrant
+        app = get_app()
+        with _lock:
+            if _firestore is None:
+                from firebase_admin import firestore
+                _firestore = firestore.client(app=app)
+    return _firestore
+
 
-# Initialize Firebase Admin SDK
-cred = credentials.Certificate(
-    os.path.join(settings.BASE_DIR, 'serviceAccountKey.json')
-)
+# ============================================
+# TOKEN VERIFIERS
+# ============================================
 
-try:
-    firebase_admin.initialize_app(cred)
-    print("✅ Firebase Admin SDK initialized successfully")
-except ValueError:
-    # Already initialized
-    pass
+class FirebaseAdminVerifier:
+    def verify(self, id_token):
+        from firebase_admin import auth
+        return auth.verify_id_token(id_token, app=get_app())
+
+
+class LocalTokenVerifier:
+    """
+    Stand-in verifier: "local:<uid>" or "local:<uid>:<email>" decodes to
+    {'uid': uid, 'email': email}. Never enable this in production.
+    """
+    prefix = 'local:'
+
+    def __init__(self):
+        logger.warning("LocalTokenVerifier is active: Firebase tokens are NOT verified")
+
+    def verify(self, id_token):
+        if not id_token.startswith(self.prefix):
+            raise ValueError('Not a local token')
+        uid, _, email = id_token[len(self.prefix):].partition(':')
+        if not uid:
+            raise ValueError('Missing uid')
+        return {'uid': uid, 'email': email}
+
+
+def get_verifier():
+    global _verifier
+    if _verifier is None:
+        with _lock:
+            if _verifier is None:
+                _verifier = import_string(settings.FIREBASE_TOKEN_VERIFIER)()
+    return _verifier
+
+
+def reset():
+    """Drop cached app/client/verifier, e.g. after changing settings in tests"""
+    global _app, _firestore, _verifier
+    with _lock:
+        _app = _firestore = _verifier = None
 
 
 def verify_firebase_token(id_token):
@@ -21,10 +105,9 @@ def verify_firebase_token(id_token):
     Verify Firebase ID token and return decoded token or None
     """
     try:
-        decoded_token = auth.verify_id_token(id_token)
-        return decoded_token
+        return get_verifier().verify(id_token)
     except Exception as e:
-        print(f"❌ Firebase token verification failed: {e}")
+        logger.warning("Firebase token verification failed: %s", e)
         return None
 
 
@@ -33,8 +116,8 @@ def get_firebase_user(uid):
     Get Firebase user by UID
     """
     try:
-        user = auth.get_user(uid)
-        return user
+        from firebase_admin import auth
+        return auth.get_user(uid, app=get_app())
     except Exception as e:
-        print(f"❌ Failed to get Firebase user: {e}")
-        return None
\ No newline at end of file
+        logger.warning("Failed to get Firebase user %s: %s", uid, e)
+        return None
@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 import os
 from pathlib import Path
 
+from .database import database_settings, sqlite_tuning_enabled
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -44,7 +46,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
+    'api.middleware.ProfileMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'api.ratelimit.RateLimitMiddleware',
+    'backend_project.db_routing.ReplicaRoutingMiddleware',
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -76,13 +82,17 @@ WSGI_APPLICATION = "backend_project.wsgi.application"
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+# Configured from DATABASE_URL / DATABASE_REPLICA_URLS / DB_* env vars, see database.py
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
-    }
-}
+DATABASES = database_settings(BASE_DIR)
+
+DATABASE_ROUTERS = ['backend_project.db_routing.ReplicaRouter']
+
+# Seconds after a change that its scope's reads go to the primary (see api/caching.py)
+REPLICA_LAG_S = float(os.environ.get('REPLICA_LAG_S', '5'))
+
+# Serialize ingest writes through one thread (api/write_queue.py); on with DB_SQLITE_TUNING
+SQLITE_WRITE_QUEUE = sqlite_tuning_enabled(DATABASES['default'])
 
 
 # Password validation
@@ -109,6 +119,9 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',  # Require auth by default
     ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.ratelimit.VerifiedUserThrottle',  # Per-user half of RATE_LIMITS
+    ],
 }
 
 
@@ -135,4 +148,203 @@ STATIC_URL = "static/"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 CORS_ALLOW_ALL_ORIGINS = True   # Dev mode only
-FIREBASE_SERVICE_ACCOUNT_KEY = os.path.join(BASE_DIR, 'serviceAccountKey.json')
\ No newline at end of file
+FIREBASE_SERVICE_ACCOUNT_KEY = os.environ.get(
+    'FIREBASE_SERVICE_ACCOUNT_KEY', os.path.join(BASE_DIR, 'serviceAccountKey.json'))
+# Token verifier class; 'backend_project.firebase_config.LocalTokenVerifier' for tests/dev only
+FIREBASE_TOKEN_VERIFIER = os.environ.get(
+    'FIREBASE_TOKEN_VERIFIER', 'backend_project.firebase_config.FirebaseAdminVerifier')
+
+# Fast JSON renderer backend for the high-volume endpoints: 'auto', 'orjson' or 'stdlib'
+API_JSON_BACKEND = os.environ.get('API_JSON_BACKEND', 'auto')
+
+
+# Cache
+# Holds the ETag version counters and the optional short-TTL API response cache
+# (api/caching.py). Multi-worker deployments need a shared cache: set REDIS_URL.
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# Seconds to share full GET responses between pollers (0 disables)
+API_RESPONSE_CACHE_TTL = float(os.environ.get('API_RESPONSE_CACHE_TTL', '0'))
+
+
+# Monitoring
+# /api/metrics/ serves Prometheus text; set METRICS_TOKEN to require "Authorization: Bearer <token>".
+# Without it only direct requests from this host and staff sessions get through
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+# Log requests slower than this many milliseconds to the 'api.slow' logger (0 disables)
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', '0'))
+
+
+# Logging
+# api.* and backend_project.* log JSON lines through a background thread
+# (api/eventlog.py) so request threads never block on stdout.
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'api.eventlog.JSONFormatter'},
+    },
+    'handlers': {
+        'background': {
+            'class': 'api.eventlog.BackgroundQueueHandler',
+            'formatter': 'json',
+        },
+    },
+    'loggers': {
+        'api': {'handlers': ['background'], 'level': LOG_LEVEL, 'propagate': False},
+        'backend_project': {'handlers': ['background'], 'level': LOG_LEVEL, 'propagate': False},
+    },
+}
+
+# Emit one line per N occurrences of these events; all occurrences are still counted
+LOG_SAMPLE_LOCATION = int(os.environ.get('LOG_SAMPLE_LOCATION', '100'))
+LOG_SAMPLE_EVERY = {
+    'location.saved': LOG_SAMPLE_LOCATION,
+    'location.batch_saved': LOG_SAMPLE_LOCATION,
+    'location.no_bus': LOG_SAMPLE_LOCATION,
+    'location.public': LOG_SAMPLE_LOCATION,
+}
+
+
+# Rate limiting (api/ratelimit.py)
+# Buckets are "<tokens per second>/<burst>" per IP before authentication and
+# per verified Firebase uid after it
+
+def _bucket(name, default):
+    rate, burst = os.environ.get(name, default).split('/')
+    return float(rate), int(burst)
+
+
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1') not in ('0', 'false', 'False')
+# 'local' (per process) or 'cache' (shared through CACHES['default'])
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'local')
+# Use the first X-Forwarded-For address as client IP (only behind a trusted proxy)
+RATE_LIMIT_TRUST_FORWARDED = os.environ.get('RATE_LIMIT_TRUST_FORWARDED', '') in ('1', 'true', 'True')
+# The per-IP bucket for requests with a bearer token is this many times larger,
+# room for the signed-in users behind one NAT address
+RATE_LIMIT_SHARED_IP_FACTOR = float(os.environ.get('RATE_LIMIT_SHARED_IP_FACTOR', '10'))
+RATE_LIMITS = {
+    'ingest': _bucket('RATE_LIMIT_INGEST', '1/10'),
+    'fleet_read': _bucket('RATE_LIMIT_FLEET_READ', '2/20'),
+    'booking_write': _bucket('RATE_LIMIT_BOOKING_WRITE', '0.1/5'),
+    'export': _bucket('RATE_LIMIT_EXPORT', '0.05/3'),
+}
+# URL name -> bucket class
+RATE_LIMIT_VIEWS = {
+    'update_driver_location': 'ingest',
+    'driver_location_public': 'ingest',
+    'get_all_bus_locations': 'fleet_read',
+    'get_pending_bookings': 'fleet_read',
+    'get_heatmap_tile': 'fleet_read',
+    'get_fleet_kpis': 'fleet_read',
+    'get_snapshot_stats': 'fleet_read',
+    'search_stops': 'fleet_read',
+    'get_routes_between': 'fleet_read',
+    'plan_journey': 'fleet_read',
+    'export_data': 'export',
+    'profile_worker': 'export',
+    'get_student_bookings': 'fleet_read',
+    'create_booking': 'booking_write',
+}
+
+
+# Adaptive driver ping interval (api/pingrate.py); any key overrides the default
+ADAPTIVE_PING = {
+    'min_s': float(os.environ.get('PING_MIN_S', 2)),
+    'max_s': float(os.environ.get('PING_MAX_S', 60)),
+    'idle_s': float(os.environ.get('PING_IDLE_S', 30)),
+    # Fleet-wide fixes/s above which every interval is stretched proportionally
+    'ingest_capacity_per_s': float(os.environ.get('PING_INGEST_CAPACITY', 200)),
+}
+
+
+# Background jobs (api/jobs.py)
+JOB_QUEUE = {
+    'enabled': os.environ.get('JOB_QUEUE_ENABLED', '1') not in ('0', 'false', 'False'),
+    'workers': int(os.environ.get('JOB_QUEUE_WORKERS', 2)),
+    'maxsize': int(os.environ.get('JOB_QUEUE_MAXSIZE', 10000)),
+    # SQLite file that keeps queued jobs across restarts; unset = memory only
+    'durable_path': os.environ.get('JOB_QUEUE_DB') or None,
+    'defer_history': os.environ.get('JOB_QUEUE_DEFER_HISTORY', '') in ('1', 'true', 'True'),
+}
+
+
+# Firestore driver_locations mirror (api/mirror.py)
+FIRESTORE_MIRROR = {
+    'enabled': os.environ.get('FIRESTORE_MIRROR', '') in ('1', 'true', 'True'),
+    # Zero-argument client factory; 'api.mirror.MemoryFirestore' needs no credentials
+    'client': os.environ.get('FIRESTORE_MIRROR_CLIENT', 'backend_project.firebase_config.get_firestore'),
+    'interval_s': float(os.environ.get('FIRESTORE_MIRROR_INTERVAL', 2)),
+}
+
+
+# Demand heatmap tiles (api/heatmap.py)
+HEATMAP = {
+    'min_zoom': 10,
+    'max_zoom': 16,
+    'window_s': int(os.environ.get('HEATMAP_WINDOW_S', 3600)),
+    # How far back the first refresh reads
+    'history_s': int(os.environ.get('HEATMAP_HISTORY_S', 7 * 86400)),
+    'refresh_s': 5,
+}
+
+
+# Fleet KPIs (api/analytics.py): a trip counts as on time if it started within this many seconds
+ANALYTICS_ON_TIME_GRACE_S = int(os.environ.get('ANALYTICS_ON_TIME_GRACE_S', 300))
+
+
+# Sharded location ingest (api/shards.py); run the shards with `manage.py run_ingest_shards`
+INGEST_SHARDS = {
+    'enabled': os.environ.get('INGEST_SHARDS', '') in ('1', 'true', 'True'),
+    'address': os.environ.get('INGEST_SHARDS_SOCKET', '/tmp/campushub-ingest.sock'),
+    'workers': int(os.environ.get('INGEST_SHARDS_WORKERS', os.cpu_count() or 2)),
+}
+
+
+# Driver presence (api/presence.py): seconds without a fix before a driver is stale / offline
+PRESENCE = {
+    'stale_s': int(os.environ.get('PRESENCE_STALE_S', 120)),
+    'offline_s': int(os.environ.get('PRESENCE_OFFLINE_S', 600)),
+}
+
+
+# Shared fleet snapshots (api/snapshots.py): longest a rendered snapshot is served without a fleet change
+SNAPSHOT_TICK_S = float(os.environ.get('SNAPSHOT_TICK_S', 1.0))
+
+
+# Location anomaly alerts (api/anomalies.py); any key overrides the default
+ANOMALIES = {
+    'enabled': os.environ.get('ANOMALIES_ENABLED', '1') not in ('0', 'false', 'False'),
+    'speed_limit_kmh': float(os.environ.get('ANOMALY_SPEED_LIMIT_KMH', 60)),
+    'idle_s': float(os.environ.get('ANOMALY_IDLE_S', 600)),
+    'off_route_m': float(os.environ.get('ANOMALY_OFF_ROUTE_M', 250)),
+    'dropout_s': float(os.environ.get('ANOMALY_DROPOUT_S', 120)),
+}
+
+
+# Sampling profiler (api/profiling.py). Requests sent with "X-Profile: <token>" are
+# profiled individually; leave PROFILE_TOKEN unset to keep the middleware out entirely
+PROFILING = {
+    'token': os.environ.get('PROFILE_TOKEN', ''),
+    'max_seconds': int(os.environ.get('PROFILE_MAX_SECONDS', 60)),
+}
+
+
+# Journey planner (api/planner.py): minimum time to change buses at a stop
+PLANNER_TRANSFER_S = int(os.environ.get('PLANNER_TRANSFER_S', 120))
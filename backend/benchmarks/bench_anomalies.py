@@ -0,0 +1,91 @@
+# benchmarks/bench_anomalies.py
+
+"""
+Anomaly checks over a replayed trace.
+
+    python -m benchmarks.bench_anomalies [trace.chtr[.gz]]
+
+With a trace file from `manage.py export_trace`, its fixes are replayed in
+time order; without one, a synthetic day is generated in the same format:
+50 buses pinging every 5 s along a 20-stop loop, with injected speeding,
+a long idle, a detour and signal dropouts. Prints the per-fix cost of the
+checks (the part added to update_driver_location) and the alerts raised.
+"""
+
+import math
+import random
+import sys
+import time
+from collections import Counter
+
+from benchmarks.common import setup_django
+
+BUSES = 50
+FIXES_PER_BUS = 2000
+PING_MS = 5000
+CENTER = (12.9716, 77.5946)
+
+
+def loop_points(radius_deg=0.02, stops=20):
+    return [
+        (CENTER[0] + radius_deg * math.sin(2 * math.pi * i / stops),
+         CENTER[1] + radius_deg * math.cos(2 * math.pi * i / stops))
+        for i in range(stops + 1)
+    ]
+
+
+def synthetic_timeline(rng):
+    """Events like api.traces.timeline(): (ts_ms, bus, lat_micro, lng_micro, speed_tenths)"""
+    points = loop_points()
+    events = []
+    for bus in range(BUSES):
+        name = f"B{bus}"
+        ts = 1_700_000_000_000 + rng.randrange(PING_MS)
+        angle = rng.random() * 2 * math.pi
+        for i in range(FIXES_PER_BUS):
+            speed = 25 + rng.random() * 10
+            if bus % 10 == 0 and 500 <= i < 520:
+                speed = 85
+            if bus % 10 == 1 and 800 <= i < 1000:
+                speed = 0
+            if speed:
+                angle += speed / 3.6 * PING_MS / 1000 / (0.02 * 111_000)
+            lat = CENTER[0] + 0.02 * math.sin(angle)
+            lng = CENTER[1] + 0.02 * math.cos(angle)
+            if bus % 10 == 2 and 1200 <= i < 1300:
+                # Eases out to a 1.1 km detour and back at normal speed
+                lat += 0.01 * min(i - 1200, 1300 - i, 30) / 30
+            events.append((ts, name, round(lat * 1e6), round(lng * 1e6), round(speed * 10)))
+            ts += PING_MS
+            if bus % 10 == 3 and i == 1500:
+                ts += 300_000
+    events.sort()
+    return events, points
+
+
+def main():
+    setup_django()
+    from api.anomalies import Analyzer
+
+    if len(sys.argv) > 1:
+        from api.traces import timeline
+        events, points = timeline(sys.argv[1]), []
+        source = sys.argv[1]
+    else:
+        events, points = synthetic_timeline(random.Random(49))
+        source = f"synthetic, {BUSES} buses x {FIXES_PER_BUS} fixes"
+
+    alerts = Counter()
+    analyzer = Analyzer(route_points=lambda bus_id, ttl: points, emit=lambda bus_id, kind, fields: alerts.update([kind]))
+    start = time.perf_counter()
+    for ts_ms, bus, lat, lng, speed in events:
+        analyzer.observe(bus, lat / 1e6, lng / 1e6, speed / 10, ts_ms / 1000)
+    elapsed = time.perf_counter() - start
+
+    print(f"{source}: {len(events)} fixes in {elapsed:.2f} s, {elapsed / len(events) * 1e6:.1f} us/fix")
+    for kind, count in sorted(alerts.items()):
+        print(f"  {kind:<12} {count}")
+
+
+if __name__ == '__main__':
+    main()
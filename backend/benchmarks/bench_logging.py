@@ -0,0 +1,64 @@
+# benchmarks/bench_logging.py
+
+"""
+Request-thread cost of logging one location ping.
+
+Both paths write to the same slow consumer: a pipe drained at about 400 KB/s,
+standing in for a busy terminal or log shipper. The old print() blocks the
+request thread whenever the pipe is full. log_event() only enqueues the record
+and leaves the writing to the background handler. It runs unsampled and with
+the default 1-in-100 sampling for location events.
+"""
+
+import logging
+import os
+import threading
+import time
+
+from benchmarks.common import bench, setup_django
+
+
+def slow_pipe(chunk=4096, delay=0.01):
+    """A writable text stream whose reader drains `chunk` bytes every `delay` seconds"""
+    read_fd, write_fd = os.pipe()
+
+    def drain():
+        while os.read(read_fd, chunk):
+            time.sleep(delay)
+
+    threading.Thread(target=drain, daemon=True).start()
+    return os.fdopen(write_fd, 'w', buffering=1)
+
+
+def main():
+    setup_django()
+    from api import eventlog
+    from api.eventlog import BackgroundQueueHandler, JSONFormatter, log_event
+    from django.conf import settings
+
+    bus, lat, lng = 'B0001', '12.971599', '77.594566'
+
+    stdout = slow_pipe()
+    bench("print() per ping", lambda: print(
+        f"📍 Location saved: Bus {bus} at ({lat}, {lng})", file=stdout), number=2000, repeat=3)
+
+    handler = BackgroundQueueHandler(stream=slow_pipe())
+    handler.setFormatter(JSONFormatter())
+    logger = eventlog.event_logger
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+
+    settings.LOG_SAMPLE_EVERY = {}
+    bench("log_event, every ping", lambda: log_event(
+        'location.saved', bus=bus, lat=lat, lng=lng), number=2000, repeat=3)
+
+    settings.LOG_SAMPLE_EVERY = {'location.saved': 100}
+    bench("log_event, sampled 1/100", lambda: log_event(
+        'location.saved', bus=bus, lat=lat, lng=lng), number=2000, repeat=3)
+
+    print(f"Records dropped (queue full): {eventlog.DROPPED.value()}")
+
+
+if __name__ == '__main__':
+    main()
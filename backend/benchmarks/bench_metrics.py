@@ -0,0 +1,36 @@
+# benchmarks/bench_metrics.py
+
+"""
+Overhead of MetricsMiddleware per request.
+
+Wraps a trivial view (one cheap query, like the driver lookup at the start of
+the ingest path) and compares it with the same view without the middleware.
+"""
+
+from benchmarks.common import bench, setup_django
+
+
+def main():
+    setup_django()
+    from django.db import connection
+    from django.http import HttpResponse
+    from django.test import RequestFactory
+    from django.urls import resolve
+    from api.middleware import MetricsMiddleware
+
+    def view(request):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        return HttpResponse(b'{}', status=201)
+
+    request = RequestFactory().post('/api/driver/location/update/')
+    request.resolver_match = resolve('/api/driver/location/update/')
+    middleware = MetricsMiddleware(view)
+
+    plain = bench("view only", lambda: view(request), number=5000)
+    wrapped = bench("view + MetricsMiddleware", lambda: middleware(request), number=5000)
+    print(f"Middleware cost: {(wrapped - plain) * 1e6:.1f} us/request")
+
+
+if __name__ == '__main__':
+    main()
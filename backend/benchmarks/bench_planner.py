@@ -0,0 +1,68 @@
+# benchmarks/bench_planner.py
+
+"""
+Journey planner on a synthetic 200-route network.
+
+600 stops, 200 routes of 20 stops each, a bus every 15 minutes from 06:00
+to 22:00 on every route. Times a full compile, the rebuild after one route
+changes (other patterns reused), and queries between random stop pairs at
+random times of day with up to two transfers.
+"""
+
+import random
+
+from benchmarks.common import bench, setup_django
+
+ROUTES = 200
+STOPS = 600
+STOPS_PER_ROUTE = 20
+DAY_START = 6 * 3600
+DAY_END = 22 * 3600
+HEADWAY_S = 15 * 60
+
+
+def synthetic_routes(rng):
+    for route_id in range(1, ROUTES + 1):
+        names = [f"Stop {n}" for n in rng.sample(range(STOPS), STOPS_PER_ROUTE)]
+        yield route_id, f"Route {route_id}", names, rng.randint(20, 60)
+
+
+def main():
+    setup_django()
+    from api.planner import Network, compile_route
+
+    rng = random.Random(44)
+    rows = list(synthetic_routes(rng))
+    departures = [(t, t) for t in range(DAY_START, DAY_END, HEADWAY_S)]
+
+    def compile_all():
+        patterns = {}
+        for route_id, name, stops, duration in rows:
+            patterns[route_id] = compile_route(route_id, name, stops, duration).with_departures(departures)
+        return patterns
+
+    patterns = compile_all()
+    network = Network(patterns.values())
+
+    def rebuild_one():
+        route_id, name, stops, duration = rows[0]
+        pattern = compile_route(route_id, name, stops[::-1], duration).with_departures(departures)
+        return Network({**patterns, route_id: pattern}.values())
+
+    stop_names = sorted(network.display.values())
+    queries = [
+        (rng.choice(stop_names), rng.choice(stop_names), rng.randrange(DAY_START, DAY_END - 3600))
+        for _ in range(500)
+    ]
+    found = sum(bool(network.plan(a, b, t)) for a, b, t in queries)
+    print(f"{ROUTES} routes, {len(stop_names)} stops, {len(departures)} trips/route; "
+          f"{found}/{len(queries)} random queries answered")
+
+    bench("compile every route", compile_all, number=5)
+    bench("rebuild after one route change", rebuild_one, number=20)
+    it = iter(queries * 1000)
+    bench("plan (up to 2 transfers)", lambda: network.plan(*next(it)), number=500)
+
+
+if __name__ == '__main__':
+    main()
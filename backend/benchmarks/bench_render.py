@@ -0,0 +1,85 @@
+# benchmarks/bench_render.py
+
+"""
+Microbenchmark: rendering a 1,000-bus fleet payload.
+
+Compares the old path (str()/isoformat() per row + DRF's JSONRenderer) with
+FastJSONRenderer on each backend, in dict and array-of-columns layouts.
+"""
+
+import random
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from benchmarks.common import bench, setup_django
+
+BUS_COUNT = 1000
+
+
+def make_rows(count=BUS_COUNT):
+    now = datetime.now(timezone.utc)
+    rows = []
+    for i in range(count):
+        rows.append((
+            f"BUS-{i:04d}",
+            Decimal(f"{12.9 + random.random() / 10:.6f}"),
+            Decimal(f"{77.5 + random.random() / 10:.6f}"),
+            round(random.uniform(0, 60), 1),
+            now - timedelta(seconds=random.randint(0, 60)),
+            f"DRV-{i:04d}",
+            'online',
+        ))
+    return rows
+
+
+def main():
+    setup_django()
+    from rest_framework.renderers import JSONRenderer
+    from api import renderers
+    from api.renderers import FastJSONRenderer, rows_to_dicts
+    from api.views import FLEET_COLUMNS
+
+    rows = make_rows()
+    now = datetime.now()
+
+    def legacy_payload():
+        return {
+            'buses': [{
+                'bus_number': r[0],
+                'latitude': str(r[1]),
+                'longitude': str(r[2]),
+                'speed': r[3],
+                'timestamp': r[4].isoformat(),
+                'driver': r[5],
+                'presence': r[6],
+            } for r in rows],
+            'count': len(rows),
+            'timestamp': now.isoformat(),
+        }
+
+    def dict_payload():
+        return {'buses': rows_to_dicts(FLEET_COLUMNS, rows), 'count': len(rows), 'timestamp': now}
+
+    def column_payload():
+        return {'columns': FLEET_COLUMNS, 'buses': rows, 'count': len(rows), 'timestamp': now}
+
+    drf = JSONRenderer()
+    fast = FastJSONRenderer()
+
+    print(f"Fleet payload with {BUS_COUNT} buses")
+    bench("DRF JSONRenderer (legacy dicts)", lambda: drf.render(legacy_payload()))
+
+    backends = ['stdlib'] + (['orjson'] if renderers.orjson is not None else [])
+    for backend in backends:
+        dumps = renderers.get_dumps(backend)
+        bench(f"{backend}: dicts", lambda: dumps(dict_payload()))
+        bench(f"{backend}: columns", lambda: dumps(column_payload()))
+
+    print()
+    print(f"Body size legacy:  {len(drf.render(legacy_payload())):>8} bytes")
+    print(f"Body size dicts:   {len(fast.render(dict_payload())):>8} bytes")
+    print(f"Body size columns: {len(fast.render(column_payload())):>8} bytes")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+# benchmarks/bench_sqlite_ingest.py
+
+"""
+Multi-threaded ingest benchmark on SQLite.
+
+Runs the same workload (THREADS drivers each sending PINGS fixes through
+api.ingest.record_location) against a fresh database file twice: once with
+default SQLite settings, once with DB_SQLITE_TUNING=1. Each mode runs in its
+own subprocess because database settings are fixed at startup.
+
+    python -m benchmarks.bench_sqlite_ingest [--threads 16] [--pings 200]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+
+def worker_main(threads, pings):
+    from benchmarks.common import setup_django
+    setup_django()
+
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.db import connection
+    from api.ingest import record_location
+    from api.models import Bus, Driver
+
+    call_command('migrate', verbosity=0)
+
+    drivers = []
+    for i in range(threads):
+        user = User.objects.create(username=f'bench-driver-{i}')
+        driver = Driver.objects.create(
+            user=user, firebase_uid=f'bench-{i}', driver_id=f'D{i:04d}',
+            license_number='BENCH', phone='0',
+        )
+        Bus.objects.create(bus_number=f'B{i:04d}', driver=driver)
+        drivers.append(driver)
+
+    errors = []
+    start_barrier = threading.Barrier(threads + 1)
+
+    def drive(driver):
+        start_barrier.wait()
+        try:
+            for n in range(pings):
+                try:
+                    record_location(driver, f'{12.9 + n * 1e-5:.6f}', '77.600000', 20)
+                except Exception as exc:
+                    errors.append(type(exc).__name__ + ': ' + str(exc))
+        finally:
+            connection.close()
+
+    pool = [threading.Thread(target=drive, args=(d,)) for d in drivers]
+    for t in pool:
+        t.start()
+    start_barrier.wait()
+    started = time.perf_counter()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    attempted = threads * pings
+    print(json.dumps({
+        'attempted': attempted,
+        'failed': len(errors),
+        'seconds': elapsed,
+        'fixes_per_second': (attempted - len(errors)) / elapsed,
+        'sample_error': errors[0] if errors else None,
+    }))
+
+
+def run_mode(label, tuning, threads, pings):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            DJANGO_SETTINGS_MODULE='backend_project.settings',
+            DATABASE_URL=f'sqlite:///{tmp}/bench.sqlite3',
+            DB_SQLITE_TUNING='1' if tuning else '0',
+        )
+        out = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_sqlite_ingest', '--worker',
+             '--threads', str(threads), '--pings', str(pings)],
+            env=env, capture_output=True, text=True, check=True,
+        ).stdout
+    result = json.loads(out.strip().splitlines()[-1])
+    print(f"{label:<10} {result['fixes_per_second']:>9.0f} fixes/s   "
+          f"{result['failed']:>5}/{result['attempted']} failed   {result['seconds']:.2f}s")
+    if result['sample_error']:
+        print(f"           e.g. {result['sample_error']}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--pings', type=int, default=200)
+    parser.add_argument('--worker', action='store_true')
+    args = parser.parse_args()
+
+    if args.worker:
+        worker_main(args.threads, args.pings)
+        return
+
+    print(f"{args.threads} drivers x {args.pings} pings")
+    run_mode('default', False, args.threads, args.pings)
+    run_mode('tuned', True, args.threads, args.pings)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+# benchmarks/bench_startup.py
+
+"""
+Process startup cost: `manage.py` commands and WSGI worker boot.
+
+Each measurement is a fresh interpreter, so it includes imports and settings
+but, with lazy Firebase, no credential loading or Firestore client creation.
+
+    python -m benchmarks.bench_startup [--runs 5]
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+WORKER_BOOT = (
+    "import os; os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend_project.settings');"
+    "from backend_project.wsgi import application"
+)
+
+FIRST_REQUEST = WORKER_BOOT + (
+    ";from django.test import RequestFactory;"
+    "r = RequestFactory(SERVER_NAME='localhost').get('/api/test/');"
+    "assert application.get_response(r).status_code == 200"
+)
+
+CASES = [
+    ('manage.py check', [sys.executable, 'manage.py', 'check']),
+    ('manage.py showmigrations', [sys.executable, 'manage.py', 'showmigrations', 'api']),
+    ('WSGI worker boot', [sys.executable, '-c', WORKER_BOOT]),
+    ('WSGI boot + first request', [sys.executable, '-c', FIRST_REQUEST]),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    for label, cmd in CASES:
+        times = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            subprocess.run(cmd, check=True, capture_output=True)
+            times.append(time.perf_counter() - start)
+        print(f"{label:<30} median {statistics.median(times) * 1000:>7.0f} ms   "
+              f"min {min(times) * 1000:>7.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
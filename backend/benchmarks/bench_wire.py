@@ -0,0 +1,46 @@
+# benchmarks/bench_wire.py
+
+"""
+Microbenchmark: decoding a batch of driver fixes, JSON vs the binary format.
+"""
+
+import json
+import random
+from datetime import datetime, timedelta, timezone
+
+from api import wire
+from benchmarks.common import bench
+
+BATCH_SIZE = 60
+
+
+def make_fixes(count=BATCH_SIZE):
+    start = datetime.now(timezone.utc)
+    return [(
+        12.9 + random.random() / 100,
+        77.5 + random.random() / 100,
+        random.uniform(0, 60),
+        start + timedelta(seconds=5 * i),
+    ) for i in range(count)]
+
+
+def main():
+    fixes = make_fixes()
+    json_body = json.dumps([{
+        'lat': f"{lat:.6f}",
+        'lng': f"{lng:.6f}",
+        'speed': round(speed, 1),
+        'timestamp': ts.isoformat(),
+    } for lat, lng, speed, ts in fixes]).encode()
+    binary_body = wire.encode(fixes)
+
+    print(f"Batch of {BATCH_SIZE} fixes")
+    print(f"JSON body:   {len(json_body):>6} bytes")
+    print(f"Binary body: {len(binary_body):>6} bytes")
+    bench("json.loads", lambda: json.loads(json_body), number=2000)
+    bench("wire.decode (columns only)", lambda: wire.decode(binary_body), number=2000)
+    bench("wire.decode + iterate fixes", lambda: list(wire.decode(binary_body)), number=2000)
+
+
+if __name__ == '__main__':
+    main()
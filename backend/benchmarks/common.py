@@ -0,0 +1,29 @@
+# benchmarks/common.py
+
+"""
+Shared helpers for the benchmark scripts.
+
+Run them from the backend directory, e.g. `python -m benchmarks.bench_render`.
+"""
+
+import os
+import time
+
+
+def setup_django():
+    """Configure Django the same way manage.py does"""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend_project.settings")
+    import django
+    django.setup()
+
+
+def bench(label, func, number=200, repeat=5):
+    """Time func() and print the best per-call time in microseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    print(f"{label:<40} {best * 1e6:>10.1f} us/call")
+    return best
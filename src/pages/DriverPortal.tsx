@@ -150,24 +150,53 @@ const DriverPortal = () => {
 
       watchIdRef.current = id;
 
-      intervalRef.current = window.setInterval(async () => {
+      // The backend answers each fix with next_ping_ms (slower when parked,
+      // faster near stops); fall back to the fixed interval otherwise.
+      let cancelled = false;
+      // Once the backend mirrors fixes to Firestore, only the profile fields
+      // (which the server does not know) and isActive still need writing,
+      // once per sharing session: the mirror never marks a driver active
+      // when sharing starts, so without it the maps would not show them.
+      let profileWritten = false;
+      const schedule = (delay: number) => {
+        if (!cancelled) intervalRef.current = window.setTimeout(sendLocation, delay);
+      };
+
+      const sendLocation = async () => {
         const pos = lastPosRef.current;
-        if (!pos) return;
+        if (!pos) {
+          schedule(POLL_INTERVAL_MS);
+          return;
+        }
 
+        let nextDelay = POLL_INTERVAL_MS;
         try {
-          await postDriverLocation(currentUser.uid, pos.lat, pos.lng, pos.speed);
-
-          await setDoc(doc(db, "driver_locations", currentUser.uid), {
-            driverId: currentUser.uid,
-            email: currentUser.email,
-            displayName: currentUser.displayName || currentUser.email,
-            latitude: pos.lat,
-            longitude: pos.lng,
-            speed: pos.speed,
-            timestamp: Timestamp.now(),
-            isActive: true,
-            lastUpdated: new Date().toISOString()
-          }, { merge: true });
+          const result = await postDriverLocation(currentUser.uid, pos.lat, pos.lng, pos.speed);
+          if (typeof result?.next_ping_ms === "number" && result.next_ping_ms > 0) {
+            nextDelay = result.next_ping_ms;
+          }
+
+          if (!result?.mirrored) {
+            await setDoc(doc(db, "driver_locations", currentUser.uid), {
+              driverId: currentUser.uid,
+              email: currentUser.email,
+              displayName: currentUser.displayName || currentUser.email,
+              latitude: pos.lat,
+              longitude: pos.lng,
+              speed: pos.speed,
+              timestamp: Timestamp.now(),
+              isActive: true,
+              lastUpdated: new Date().toISOString()
+            }, { merge: true });
+          } else if (!profileWritten) {
+            await setDoc(doc(db, "driver_locations", currentUser.uid), {
+              driverId: currentUser.uid,
+              email: currentUser.email,
+              displayName: currentUser.displayName || currentUser.email,
+              isActive: true,
+            }, { merge: true });
+            profileWritten = true;
+          }
 
         } catch (e) {
           console.error("Backend failed, fallback:", e);
@@ -184,15 +213,19 @@ const DriverPortal = () => {
             console.error("Firestore also failed:", err);
           }
         }
-      }, POLL_INTERVAL_MS);
+        schedule(nextDelay);
+      };
+
+      schedule(POLL_INTERVAL_MS);
 
       return () => {
+        cancelled = true;
         if (watchIdRef.current !== null) navigator.geolocation.clearWatch(watchIdRef.current);
-        if (intervalRef.current) clearInterval(intervalRef.current);
+        if (intervalRef.current) clearTimeout(intervalRef.current);
       };
     } else {
       if (watchIdRef.current !== null) navigator.geolocation.clearWatch(watchIdRef.current);
-      if (intervalRef.current) clearInterval(intervalRef.current);
+      if (intervalRef.current) clearTimeout(intervalRef.current);
     }
   }, [isSharing, currentUser]);
 
@@ -243,7 +276,7 @@ const DriverPortal = () => {
     try {
       if (isSharing) setIsSharing(false);
       if (watchIdRef.current !== null) navigator.geolocation.clearWatch(watchIdRef.current);
-      if (intervalRef.current) clearInterval(intervalRef.current);
+      if (intervalRef.current) clearTimeout(intervalRef.current);
 
       await logout();
       navigate("/driver/auth");